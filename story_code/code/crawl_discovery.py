@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应的故事id空间探索
+取代对 1..max_story_id 每个整数都发一次请求的盲扫:
+
+1. 上界: 从已知最大id开始按指数步长探测，遇到空窗口后再往更远处看几眼
+   （跨过较大的空隙），然后在最后一个有效点与空窗口之间二分，
+   找到当前仍有故事的最大id（每次探测一个小窗口，避免被零星的空id误导）
+2. 扫描: 按块推进，每块先抽样几个id；抽样命中（或历史上是稠密块）才抓整块，
+   未命中的块记为空隙并计入未命中预算，预算用完后不再探测新的空隙
+3. 重抓: 只从上次已知最大id往上探测和扫描，另外随机复查一部分旧故事
+
+稠密/稀疏区域从抓取边界（crawl_frontier）中done/empty的记录学习，跨运行保留。
+探测本身就是正常抓取：命中的页面照常解析和保存，不会重复下载。
+"""
+
+import logging
+
+from crawl_frontier import DONE, EMPTY
+
+logger = logging.getLogger(__name__)
+
+
+class IdSpaceExplorer:
+    """id空间探索
+
+    frontier: crawl_frontier.CrawlFrontier
+    crawl_ids: 抓取一组id的函数（解析、保存并记录到frontier）
+    window: 探测上界时每个探测点抓取的连续id数
+    lookahead: 遇到空窗口后继续按倍数往远处探测的次数
+    block_size/sample_size: 扫描块大小与每块先抽样的id数
+    dense_ratio: 历史命中率不低于该值的块直接整块抓取
+    miss_budget: 空隙抽样允许的未命中总数
+    recheck: 重抓时随机复查的旧故事数
+    max_id_limit: 上界探测的硬上限
+    """
+
+    def __init__(self, frontier, crawl_ids, window=8, lookahead=6, block_size=100, sample_size=5,
+                 dense_ratio=0.2, miss_budget=200, recheck=50, max_id_limit=10_000_000):
+        self.frontier = frontier
+        self.crawl_ids = crawl_ids
+        self.window = window
+        self.lookahead = lookahead
+        self.block_size = block_size
+        self.sample_size = sample_size
+        self.dense_ratio = dense_ratio
+        self.miss_budget = miss_budget
+        self.recheck = recheck
+        self.max_id_limit = max_id_limit
+        self.misses = 0
+        self.report = {
+            'probes': 0,
+            'dense_blocks': 0,
+            'gap_blocks': 0,
+            'skipped_blocks': 0,
+            'rechecked': 0,
+        }
+
+    def _probe_ids(self, story_ids):
+        """抓取其中尚未确定或到期的id，返回这些id中有故事的个数"""
+        story_ids = sorted(set(story_ids))
+        if not story_ids:
+            return 0
+        self.frontier.add_ids(story_ids)
+        wanted = set(story_ids)
+        due = [story_id for story_id in self.frontier.due(story_ids[0], story_ids[-1]) if story_id in wanted]
+        if due:
+            self.crawl_ids(due)
+        if story_ids[-1] - story_ids[0] + 1 == len(story_ids):
+            return self.frontier.count(story_ids[0], story_ids[-1])
+        return sum(self.frontier.count(story_id, story_id) for story_id in story_ids)
+
+    def _live(self, position):
+        """position起的一个窗口内是否有故事"""
+        self.report['probes'] += 1
+        end = min(position + self.window - 1, self.max_id_limit)
+        return self._probe_ids(range(position, end + 1)) > 0
+
+    def find_upper_bound(self, start=0):
+        """指数探测加二分查找当前最大的有效id（没有任何故事时返回start）"""
+        low = start
+        # 先探测紧挨着start的窗口，否则start+1..start+window-1从未被检查
+        if start + 1 <= self.max_id_limit and self._live(start + 1):
+            low = start + 1
+        step = self.window
+        high = low + step
+        while True:
+            while high <= self.max_id_limit and self._live(high):
+                low = high
+                step *= 2
+                high = low + step
+            jumped = self._look_ahead(low, step)
+            if jumped is None:
+                break
+            low = jumped
+            high = low + step
+        high = min(high, self.max_id_limit)
+        while high - low > self.window:
+            middle = (low + high) // 2
+            if self._live(middle):
+                low = middle
+            else:
+                high = middle
+        upper = self.frontier.max_id() or start
+        logger.info(f"🔭 上界探测: 最大有效id {upper}（{self.report['probes']} 次窗口探测）")
+        return upper
+
+    def _look_ahead(self, low, step):
+        """空窗口之后按倍数往远处探测，返回第一个有故事的位置"""
+        for power in range(1, self.lookahead + 1):
+            probe = low + step * (2 ** power)
+            if probe > self.max_id_limit:
+                return None
+            if self._live(probe):
+                return probe
+        return None
+
+    def _sample(self, block_start, block_end):
+        count = block_end - block_start + 1
+        if count <= self.sample_size:
+            return list(range(block_start, block_end + 1))
+        stride = count / self.sample_size
+        return [block_start + int(stride * index + stride / 2) for index in range(self.sample_size)]
+
+    def sweep(self, start_id, end_id):
+        """按块扫描区间：稠密块整块抓取，空隙块只抽样并消耗未命中预算"""
+        if end_id < start_id:
+            return
+        history = self.frontier.density(self.block_size)
+        # 块与frontier.density()的分块对齐
+        first = (start_id - 1) // self.block_size * self.block_size + 1
+        for block in range(first, end_id + 1, self.block_size):
+            block_start = max(block, start_id)
+            block_end = min(block + self.block_size - 1, end_id)
+            found, settled = history.get(block, (0, 0))
+            if settled and found / settled >= self.dense_ratio:
+                dense = True
+            elif self.misses >= self.miss_budget:
+                self.report['skipped_blocks'] += 1
+                continue
+            else:
+                sample = self._sample(block_start, block_end)
+                hits = self._probe_ids(sample)
+                dense = hits > 0
+                if not dense:
+                    self.misses += len(sample)
+            if dense:
+                self.report['dense_blocks'] += 1
+                self._probe_ids(range(block_start, block_end + 1))
+            else:
+                self.report['gap_blocks'] += 1
+        if self.misses >= self.miss_budget:
+            logger.info(f"🕳️ 未命中预算已用完（{self.misses}/{self.miss_budget}），"
+                        f"跳过 {self.report['skipped_blocks']} 个未探测的块")
+
+    def run(self):
+        """首次运行探索整个id空间；已有记录时只扫描上次最大id以上并复查部分旧故事"""
+        known_max = self.frontier.max_id()
+        if known_max is None:
+            upper = self.find_upper_bound(0)
+            self.sweep(1, upper)
+        else:
+            # 上次探测时超出上界的空id可能已经有了新故事
+            self.frontier.reset(states=(EMPTY,), start_id=known_max + 1)
+            upper = self.find_upper_bound(known_max)
+            self.sweep(known_max + 1, upper)
+            old_ids = self.frontier.sample(self.recheck, states=(DONE, EMPTY), end_id=known_max)
+            if old_ids:
+                self.crawl_ids(old_ids)
+                self.report['rechecked'] = len(old_ids)
+        self.report.update(known_max=known_max, upper_bound=upper, misses=self.misses)
+        logger.info(f"🗺️ id空间探索: {self.report}")
+        return self.report
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享异步抓取引擎
+各个storynook爬虫共用的asyncio抓取层：
+- 一个aiohttp会话复用连接池（keep-alive），全局并发与每主机并发分别限制
+- 每主机令牌桶限速，取代每次请求前的 time.sleep(random.uniform(...))
+- 连接错误、超时及429/5xx按带抖动的指数退避重试，遵守Retry-After
+- 页面处理器可插拔：普通函数在线程池中执行（解析与写库不阻塞事件循环），
+  协程函数直接在事件循环中执行；处理器返回的CrawlRequest（或其列表）会加入抓取队列，
+  其他非空返回值作为crawl()的结果
+- 可选的磁盘缓存（http_cache.HttpCache）：带校验器做条件请求，304时使用本地内容；
+  离线回放模式下不访问网络
+
+用法:
+    engine = CrawlEngine(headers=DEFAULT_HEADERS, concurrency=8, rate=5)
+    results = engine.crawl([f"https://storynook.cn/?id={i}" for i in range(1, 101)], handler)
+"""
+
+import asyncio
+import contextlib
+import email.utils
+import logging
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+# 值得重试的HTTP状态码
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class CrawlRequest:
+    """一次抓取请求：key/meta由调用方使用（如故事id），handler可覆盖引擎级处理器"""
+
+    __slots__ = ('url', 'key', 'meta', 'handler', 'headers')
+
+    def __init__(self, url, key=None, meta=None, handler=None, headers=None):
+        self.url = url
+        self.key = key
+        self.meta = meta if meta is not None else {}
+        self.handler = handler
+        self.headers = headers
+
+    def __repr__(self):
+        return f"CrawlRequest({self.url!r}, key={self.key!r})"
+
+
+class FetchResult:
+    """抓取结果：body为解压后的字节；网络错误时status为None、error为异常；
+    from_cache表示内容来自本地缓存（304重新验证或离线回放）"""
+
+    def __init__(self, request, status=None, headers=None, body=b'', error=None, attempts=0, elapsed=0.0,
+                 from_cache=False):
+        self.request = request
+        self.status = status
+        self.headers = headers or {}
+        self.body = body
+        self.error = error
+        self.attempts = attempts
+        self.elapsed = elapsed
+        self.from_cache = from_cache
+
+    @property
+    def url(self):
+        return self.request.url
+
+    @property
+    def key(self):
+        return self.request.key
+
+    @property
+    def meta(self):
+        return self.request.meta
+
+    @property
+    def ok(self):
+        return self.error is None and self.status == 200
+
+    @property
+    def content_type(self):
+        return (self.headers.get('Content-Type') or '').lower()
+
+    def text(self, encoding=None):
+        """按Content-Type中的charset解码（默认utf-8，非法字节替换）"""
+        if encoding is None:
+            _, _, charset = self.content_type.partition('charset=')
+            encoding = charset.split(';')[0].strip() or 'utf-8'
+        try:
+            return self.body.decode(encoding, errors='replace')
+        except LookupError:
+            return self.body.decode('utf-8', errors='replace')
+
+    def __repr__(self):
+        return f"FetchResult({self.url!r}, status={self.status}, attempts={self.attempts})"
+
+
+class TokenBucket:
+    """令牌桶：平均每秒rate个请求，最多burst个突发；rate<=0表示不限速"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        # 持锁等待，等待者按先来后到取得令牌
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def parse_retry_after(value):
+    """解析Retry-After（秒数或HTTP日期），无法解析返回None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CrawlEngine:
+    """异步抓取引擎
+
+    concurrency: 同时进行的请求数（也是连接池大小）
+    per_host: 单个主机的并发上限
+    rate/burst: 单个主机的令牌桶限速（请求/秒）
+    max_retries: 每个请求的最多尝试次数
+    backoff_base/backoff_max: 退避时间为 [0, min(backoff_max, backoff_base * 2^n)] 内的随机值
+    handler_threads: 执行普通函数处理器的线程数（0为在事件循环中直接执行）
+    cache: http_cache.HttpCache，None为不缓存
+    """
+
+    def __init__(self, headers=None, concurrency=8, per_host=4, rate=5.0, burst=None, max_retries=3,
+                 backoff_base=1.0, backoff_max=30.0, timeout=15.0, retry_statuses=RETRY_STATUSES,
+                 handler_threads=4, cache=None):
+        self.headers = dict(DEFAULT_HEADERS if headers is None else headers)
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.retry_statuses = retry_statuses
+        self.handler_threads = handler_threads
+        self.cache = cache
+        self.stats = Counter()
+        self.status_counts = Counter()
+        self._session = None
+        self._hosts = {}
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        """打开共享会话；crawl()/fetch_one()会自动调用，也可在协程中直接使用"""
+        if self._session is not None:
+            yield self._session
+            return
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(headers=self.headers, connector=connector, timeout=timeout) as session:
+            self._session = session
+            self._hosts = {}
+            try:
+                yield session
+            finally:
+                self._session = None
+                self._hosts = {}
+
+    def _host(self, url):
+        host = urlparse(url).netloc
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = (asyncio.Semaphore(self.per_host), TokenBucket(self.rate, self.burst))
+        return state
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))))
+
+    async def _cached(self, function, *args):
+        # 缓存读写是磁盘I/O，放到默认线程池中执行
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def fetch(self, request):
+        """抓取一个请求（含限速、重试与缓存），需要在session()内调用"""
+        if isinstance(request, str):
+            request = CrawlRequest(request)
+        started = time.monotonic()
+        entry = None
+        request_headers = request.headers
+        if self.cache is not None:
+            entry = await self._cached(self.cache.lookup, request.url)
+            if self.cache.offline:
+                body = await self._cached(self.cache.body, entry) if entry is not None else None
+                if body is None:
+                    self.stats['cache_misses'] += 1
+                    return FetchResult(request, 504, {}, b'', None, 0, time.monotonic() - started)
+                self.stats['cache_hits'] += 1
+                return FetchResult(request, entry.status, entry.headers, body, None, 0,
+                                   time.monotonic() - started, from_cache=True)
+            if entry is not None:
+                request_headers = dict(request_headers or {}, **entry.validators())
+
+        semaphore, bucket = self._host(request.url)
+        for attempt in range(1, self.max_retries + 1):
+            status, headers, body, error = None, None, b'', None
+            async with semaphore:
+                await bucket.acquire()
+                self.stats['requests'] += 1
+                try:
+                    async with self._session.get(request.url, headers=request_headers) as response:
+                        body = await response.read()
+                        status, headers = response.status, response.headers
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = e
+            if error is None:
+                self.status_counts[status] += 1
+                self.stats['bytes'] += len(body)
+                if status not in self.retry_statuses:
+                    break
+            if attempt == self.max_retries:
+                break
+            self.stats['retries'] += 1
+            delay = self._backoff(attempt, parse_retry_after(headers.get('Retry-After')) if headers else None)
+            logger.debug(f"重试 {request.url} ({error or status})，{delay:.1f} 秒后第 {attempt + 1} 次尝试")
+            await asyncio.sleep(delay)
+
+        if error is not None:
+            self.stats['errors'] += 1
+            logger.warning(f"请求失败: {request.url} - {error!r}")
+        elif self.cache is not None:
+            if status == 304 and entry is not None:
+                cached_body = await self._cached(self.cache.body, entry)
+                if cached_body is not None:
+                    self.stats['cache_revalidated'] += 1
+                    await self._cached(self.cache.refresh, request.url, headers)
+                    return FetchResult(request, entry.status, entry.headers, cached_body, None, attempt,
+                                       time.monotonic() - started, from_cache=True)
+            elif status == 200:
+                await self._cached(self.cache.store, request.url, status, headers, body)
+        return FetchResult(request, status, headers, body, error, attempt, time.monotonic() - started)
+
+    async def _handle(self, handler, result, executor):
+        if handler is None:
+            return result
+        if asyncio.iscoroutinefunction(handler):
+            return await handler(result)
+        if executor is None:
+            return handler(result)
+        return await asyncio.get_running_loop().run_in_executor(executor, handler, result)
+
+    async def _worker(self, queue, handler, outputs, executor):
+        while True:
+            request = await queue.get()
+            try:
+                result = await self.fetch(request)
+                output = await self._handle(request.handler or handler, result, executor)
+                for item in output if isinstance(output, list) else (output,):
+                    if isinstance(item, CrawlRequest):
+                        queue.put_nowait(item)
+                    elif item is not None:
+                        outputs.append(item)
+            except Exception as e:
+                self.stats['handler_errors'] += 1
+                logger.error(f"处理 {request.url} 时出错: {e!r}")
+            finally:
+                queue.task_done()
+
+    async def crawl_async(self, requests, handler=None):
+        """抓取所有请求，返回处理器的非空返回值列表（未提供处理器时返回FetchResult列表）"""
+        queue = asyncio.Queue()
+        for request in requests:
+            queue.put_nowait(request if isinstance(request, CrawlRequest) else CrawlRequest(request))
+        outputs = []
+        executor = ThreadPoolExecutor(self.handler_threads, thread_name_prefix='crawl-handler') \
+            if self.handler_threads else None
+        try:
+            async with self.session():
+                workers = [asyncio.create_task(self._worker(queue, handler, outputs, executor))
+                           for _ in range(self.concurrency)]
+                try:
+                    await queue.join()
+                finally:
+                    for worker in workers:
+                        worker.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+        return outputs
+
+    def crawl(self, requests, handler=None):
+        """同步入口：在新的事件循环中运行crawl_async"""
+        return asyncio.run(self.crawl_async(requests, handler))
+
+    def fetch_one(self, url):
+        """同步抓取单个URL，返回FetchResult"""
+        async def run():
+            async with self.session():
+                return await self.fetch(url)
+        return asyncio.run(run())
+
+    def summary(self):
+        """引擎统计（请求数、重试、错误、字节数、状态码分布）"""
+        return {
+            'requests': self.stats['requests'],
+            'retries': self.stats['retries'],
+            'errors': self.stats['errors'],
+            'handler_errors': self.stats['handler_errors'],
+            'bytes': self.stats['bytes'],
+            'cache_revalidated': self.stats['cache_revalidated'],
+            'cache_hits': self.stats['cache_hits'],
+            'cache_misses': self.stats['cache_misses'],
+            'status': {str(code): count for code, count in sorted(self.status_counts.items())},
+        }
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可续传的抓取边界（frontier）
+用SQLite记录每个故事id的抓取状态，崩溃或中断后从停下的地方继续，
+重复运行时只抓取新id和到期需要复查的id。
+
+状态:
+    pending      尚未抓取
+    done         已成功抓取（设置了refresh_after时到期后重新抓取）
+    empty        页面存在但没有故事内容（empty_recheck_after后复查）
+    failed       抓取失败，按指数退避安排重试，超过max_attempts后不再重试
+    retry_after  服务器要求稍后再试（429/503的Retry-After），到期后重试
+
+每次状态变化立即提交（WAL模式，提交代价很小），因此中断时最多丢失正在进行的请求。
+"""
+
+import sqlite3
+import threading
+import time
+
+from crawl_engine import parse_retry_after
+
+
+PENDING = 'pending'
+DONE = 'done'
+EMPTY = 'empty'
+FAILED = 'failed'
+RETRY_AFTER = 'retry_after'
+STATES = (PENDING, DONE, EMPTY, FAILED, RETRY_AFTER)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_at REAL,
+    updated_at REAL,
+    status INTEGER,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_frontier_state ON frontier(state, next_at);
+"""
+
+
+class CrawlFrontier:
+    """基于SQLite的抓取状态表（线程安全，可在引擎的处理线程中调用）
+
+    max_attempts: 失败后最多尝试次数
+    retry_base/retry_max: 失败重试间隔为 retry_base * 2^(attempts-1)，不超过retry_max（秒）
+    refresh_after: done状态多久后重新抓取（秒），None为不刷新
+    empty_recheck_after: empty状态多久后复查（秒），None为不复查
+    """
+
+    def __init__(self, db_path, max_attempts=5, retry_base=60.0, retry_max=6 * 3600.0,
+                 refresh_after=None, empty_recheck_after=7 * 24 * 3600.0):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.refresh_after = refresh_after
+        self.empty_recheck_after = empty_recheck_after
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM frontier").fetchone()[0]
+
+    def add_range(self, start_id, end_id):
+        """把区间内尚未记录的id加入为pending，返回新增个数"""
+        return self.add_ids(range(start_id, end_id + 1))
+
+    def add_ids(self, story_ids):
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO frontier (id) VALUES (?)",
+                                   ((story_id,) for story_id in story_ids))
+            return self._conn.total_changes - before
+
+    def seed(self, story_ids, state=DONE):
+        """从已有的输出（如旧数据库中的故事）导入状态，已记录的id不变"""
+        now = time.time()
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO frontier (id, state, updated_at) VALUES (?, ?, ?)",
+                ((story_id, state, now) for story_id in story_ids)
+            )
+            return self._conn.total_changes - before
+
+    def due(self, start_id=None, end_id=None, limit=None, now=None):
+        """返回应当抓取的id（按id升序）：pending、到期的failed/retry_after及到期需刷新的done/empty"""
+        now = time.time() if now is None else now
+        clauses = [
+            "state = 'pending'",
+            "(state IN ('failed', 'retry_after') AND attempts < ? AND COALESCE(next_at, 0) <= ?)",
+        ]
+        params = [self.max_attempts, now]
+        if self.refresh_after is not None:
+            clauses.append("(state = 'done' AND updated_at <= ?)")
+            params.append(now - self.refresh_after)
+        if self.empty_recheck_after is not None:
+            clauses.append("(state = 'empty' AND updated_at <= ?)")
+            params.append(now - self.empty_recheck_after)
+        sql = f"SELECT id FROM frontier WHERE ({' OR '.join(clauses)})"
+        if start_id is not None:
+            sql += " AND id >= ?"
+            params.append(start_id)
+        if end_id is not None:
+            sql += " AND id <= ?"
+            params.append(end_id)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(sql, params)]
+
+    def _update(self, story_id, sql, params):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO frontier (id) VALUES (?)", (story_id,))
+            self._conn.execute(sql, params)
+
+    def mark_done(self, story_id, status=200):
+        self._update(story_id,
+                     "UPDATE frontier SET state = 'done', attempts = 0, next_at = NULL, updated_at = ?, "
+                     "status = ?, last_error = NULL WHERE id = ?",
+                     (time.time(), status, story_id))
+
+    def mark_empty(self, story_id, status=200):
+        self._update(story_id,
+                     "UPDATE frontier SET state = 'empty', attempts = 0, next_at = NULL, updated_at = ?, "
+                     "status = ?, last_error = NULL WHERE id = ?",
+                     (time.time(), status, story_id))
+
+    def mark_failed(self, story_id, error=None, status=None, retry_after=None):
+        """记录一次失败；给出retry_after（秒）时进入retry_after状态，否则按退避安排重试"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO frontier (id) VALUES (?)", (story_id,))
+            attempts = self._conn.execute("SELECT attempts FROM frontier WHERE id = ?",
+                                          (story_id,)).fetchone()[0] + 1
+            if retry_after is not None:
+                state, delay = RETRY_AFTER, retry_after
+            else:
+                state, delay = FAILED, min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+            self._conn.execute(
+                "UPDATE frontier SET state = ?, attempts = ?, next_at = ?, updated_at = ?, status = ?, "
+                "last_error = ? WHERE id = ?",
+                (state, attempts, now + delay, now, status, str(error) if error else None, story_id)
+            )
+            return attempts
+
+    def record(self, result, found):
+        """按抓取结果（crawl_engine.FetchResult）和是否提取到故事更新状态"""
+        if result.error is not None:
+            return self.mark_failed(result.key, error=repr(result.error))
+        if result.status in (429, 503):
+            return self.mark_failed(result.key, status=result.status,
+                                    retry_after=parse_retry_after(result.headers.get('Retry-After')))
+        if result.status == 404:
+            return self.mark_empty(result.key, result.status)
+        if result.status != 200:
+            return self.mark_failed(result.key, error=f"HTTP {result.status}", status=result.status)
+        if found:
+            return self.mark_done(result.key, result.status)
+        return self.mark_empty(result.key, result.status)
+
+    def reset(self, states=(FAILED, RETRY_AFTER), start_id=None):
+        """把指定状态（start_id及以上）的id重新置为pending（如手动放弃退避、强制重试）"""
+        placeholders = ','.join('?' * len(states))
+        sql = f"UPDATE frontier SET state = 'pending', attempts = 0, next_at = NULL WHERE state IN ({placeholders})"
+        params = tuple(states)
+        if start_id is not None:
+            sql += " AND id >= ?"
+            params += (start_id,)
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).rowcount
+
+    def counts(self):
+        """各状态的id个数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state").fetchall()
+        result = {state: 0 for state in STATES}
+        result.update(rows)
+        return result
+
+    def count(self, start_id, end_id, states=(DONE,)):
+        """区间内处于指定状态的id个数"""
+        placeholders = ','.join('?' * len(states))
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM frontier WHERE id BETWEEN ? AND ? AND state IN ({placeholders})",
+                (start_id, end_id) + tuple(states)
+            ).fetchone()[0]
+
+    def sample(self, limit, states=(DONE,), end_id=None):
+        """随机抽取指定状态的id（用于复查旧故事）"""
+        placeholders = ','.join('?' * len(states))
+        sql = f"SELECT id FROM frontier WHERE state IN ({placeholders})"
+        params = list(states)
+        if end_id is not None:
+            sql += " AND id <= ?"
+            params.append(end_id)
+        sql += " ORDER BY RANDOM() LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return sorted(row[0] for row in self._conn.execute(sql, params))
+
+    def density(self, block_size):
+        """按块统计已有结果: {块起始id: (有故事数, 已确定结果数)}，已确定指done或empty"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT (id - 1) / ? AS block, SUM(state = 'done'), SUM(state IN ('done', 'empty')) "
+                "FROM frontier GROUP BY block",
+                (block_size,)
+            ).fetchall()
+        return {block * block_size + 1: (found, settled) for block, found, settled in rows}
+
+    def max_id(self, states=(DONE,)):
+        """指定状态中最大的id"""
+        placeholders = ','.join('?' * len(states))
+        with self._lock:
+            return self._conn.execute(f"SELECT MAX(id) FROM frontier WHERE state IN ({placeholders})",
+                                      tuple(states)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
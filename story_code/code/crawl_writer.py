@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+爬虫结果的单写入线程
+抓取处理线程只把故事放进有界队列，由一个后台线程独占数据库连接：
+- 每批最多batch_size条（或等待flush_interval秒）在一个事务中executemany写入
+- WAL模式，写入时不阻塞其他进程读取
+- 分类统计按批次增量更新（旧记录换分类时先减后加），不再每条执行 COUNT(*)
+- flush()等待队列写完，close()写完剩余数据后停止；进程退出时自动close
+- 单条记录出错（数据库错误或字段缺失等）只计入errors，不会让写入线程退出；
+  写入线程意外退出时下一次put()/flush()/close()自动重启并继续写队列中的记录
+- put()可带on_commit回调，在该记录所在事务提交后由写入线程调用（写入失败则不调用），
+  用于在数据真正落盘后再更新抓取边界，进程中途退出时队列里未提交的故事会在恢复后重抓
+
+用法:
+    writer = StoryWriter("final_stories/all_stories.db")
+    writer.put({'story_id': 1, 'title': ..., 'category': ...})
+    writer.put(story, on_commit=lambda: frontier.mark_done(story_id))
+    writer.close()
+
+    python crawl_writer.py --stories 20000 --threads 8   # 与逐条写入对比
+"""
+
+import argparse
+import atexit
+import logging
+import os
+import queue
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_QUEUE_SIZE = 10000
+
+
+class StoryWriter:
+    """单写入线程
+
+    columns: 写入的列（与put()传入字典的键对应），key为唯一键列，category为分类列
+    categories_table/count_column: 分类统计表及其计数列（name列为分类名），为None时不统计
+    queue_size: 队列上限，写入跟不上时put()阻塞（对抓取形成背压）
+    """
+
+    def __init__(self, db_path, table='stories',
+                 columns=('story_id', 'title', 'content', 'category', 'url', 'word_count'),
+                 key='story_id', category='category', categories_table='categories',
+                 count_column='story_count', batch_size=DEFAULT_BATCH_SIZE, flush_interval=1.0,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.db_path = db_path
+        self.table = table
+        self.columns = tuple(columns)
+        self.key = key
+        self.category = category
+        self.categories_table = categories_table
+        self.count_column = count_column
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._atexit = False
+
+        placeholders = ', '.join('?' * len(self.columns))
+        self._insert_sql = (f"INSERT OR REPLACE INTO {table} ({', '.join(self.columns)}) "
+                            f"VALUES ({placeholders})")
+
+    def _ensure_started(self):
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            return self._queue
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self._queue
+            # 先打开连接，数据库不可用时在调用线程中直接报错
+            conn = self._connect()
+            if self._thread is None:
+                self._queue = queue.Queue(maxsize=self.queue_size)
+            else:
+                # 沿用原队列，未写入的记录不丢失，flush()也不会因无人处理而一直等待
+                logger.error(f"写入线程意外退出，重新启动（队列中还有 {self._queue.qsize()} 条）")
+            self._thread = threading.Thread(target=self._run, args=(conn, self._queue),
+                                            name='story-writer', daemon=True)
+            self._thread.start()
+            if not self._atexit:
+                atexit.register(self.close)
+                self._atexit = True
+        return self._queue
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        if self.categories_table:
+            # 启动时按现有数据校正一次分类统计，之后只做增量更新
+            with conn:
+                conn.execute(f"DELETE FROM {self.categories_table}")
+                conn.execute(
+                    f"INSERT INTO {self.categories_table} (name, {self.count_column}) "
+                    f"SELECT {self.category}, COUNT(*) FROM {self.table} "
+                    f"WHERE {self.category} IS NOT NULL GROUP BY {self.category}"
+                )
+        return conn
+
+    def put(self, story, on_commit=None):
+        """提交一条记录（字典，键为columns），在写入线程中异步落盘；提交成功后调用on_commit()"""
+        self._ensure_started().put((story, on_commit))
+
+    def flush(self):
+        """等待已提交的记录全部写入"""
+        if self._queue is not None:
+            self._ensure_started().join()
+
+    def close(self, timeout=30.0):
+        """写完剩余记录后停止写入线程；之后再put()会重新启动"""
+        if self._thread is None:
+            return
+        self._ensure_started()
+        with self._lock:
+            writer_queue, thread = self._queue, self._thread
+            self._queue = self._thread = None
+        if thread is None:
+            return
+        writer_queue.put(None)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.error(f"写入线程 {timeout:.0f} 秒内未结束，还有 {writer_queue.qsize()} 条记录未写入")
+
+    def stats(self):
+        return {
+            'written': self.written,
+            'batches': self.batches,
+            'errors': self.errors,
+            'pending': self._queue.qsize() if self._queue is not None else 0,
+        }
+
+    def _run(self, conn, writer_queue):
+        running = True
+        try:
+            while running:
+                try:
+                    batch = [writer_queue.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    continue
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(writer_queue.get_nowait())
+                    except queue.Empty:
+                        break
+                items = [item for item in batch if item is not None]
+                running = len(items) == len(batch)
+                try:
+                    if items:
+                        self._write(conn, items)
+                finally:
+                    for _ in batch:
+                        writer_queue.task_done()
+        finally:
+            conn.close()
+
+    def _write(self, conn, items):
+        stories = [story for story, _ in items]
+        try:
+            self._write_batch(conn, stories)
+            self.written += len(stories)
+            self.batches += 1
+            committed = items
+        except Exception as e:
+            # 整批失败时逐条重试，只丢弃真正出错的记录
+            logger.error(f"批量写入 {len(stories)} 条失败，改为逐条写入: {e}")
+            committed = []
+            for story, on_commit in items:
+                try:
+                    self._write_batch(conn, [story])
+                    self.written += 1
+                    committed.append((story, on_commit))
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"保存故事到数据库失败: {self._key_of(story)} - {e!r}")
+        for story, on_commit in committed:
+            if on_commit is None:
+                continue
+            try:
+                on_commit()
+            except Exception as e:
+                logger.error(f"提交回调失败: {self._key_of(story)} - {e}")
+
+    def _key_of(self, story):
+        """日志中标识记录用，记录格式不对时也不抛异常"""
+        return story.get(self.key) if isinstance(story, dict) else repr(story)[:80]
+
+    def _write_batch(self, conn, stories):
+        # 同一批内重复的键只保留最后一条
+        latest = {}
+        for story in stories:
+            latest[story[self.key]] = story
+        rows = [tuple(story.get(column) for column in self.columns) for story in latest.values()]
+
+        with conn:
+            if self.categories_table:
+                delta = self._category_delta(conn, latest)
+            conn.executemany(self._insert_sql, rows)
+            if self.categories_table:
+                conn.executemany(
+                    f"INSERT INTO {self.categories_table} (name, {self.count_column}) VALUES (?, ?) "
+                    f"ON CONFLICT(name) DO UPDATE SET {self.count_column} = {self.count_column} + excluded.{self.count_column}",
+                    [(name, change) for name, change in delta.items() if change]
+                )
+
+    def _category_delta(self, conn, latest):
+        """本批写入对各分类计数的变化（被替换的旧记录减去原分类）"""
+        delta = Counter()
+        keys = list(latest)
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            for old_category, in conn.execute(
+                    f"SELECT {self.category} FROM {self.table} WHERE {self.key} IN ({placeholders})", chunk):
+                if old_category is not None:
+                    delta[old_category] -= 1
+        for story in latest.values():
+            if story.get(self.category) is not None:
+                delta[story[self.category]] += 1
+        return delta
+
+
+def _create_schema(db_path):
+    """与final_crawler.py相同的表结构"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS stories (
+            id INTEGER PRIMARY KEY,
+            story_id INTEGER UNIQUE,
+            title TEXT NOT NULL,
+            content TEXT,
+            category TEXT,
+            url TEXT,
+            word_count INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE,
+            story_count INTEGER DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_story_id ON stories(story_id);
+        CREATE INDEX IF NOT EXISTS idx_category ON stories(category);
+    ''')
+    conn.close()
+
+
+def _save_per_row(db_path, story, lock):
+    """原来的写法：每条新建连接，全局锁内插入并用 COUNT(*) 重算分类"""
+    with lock:
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO stories
+                (story_id, title, content, category, url, word_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (story['story_id'], story['title'], story['content'], story['category'],
+                  story['url'], story['word_count']))
+            conn.execute('''
+                INSERT OR REPLACE INTO categories (name, story_count)
+                VALUES (?, (SELECT COUNT(*) FROM stories WHERE category = ?))
+            ''', (story['category'], story['category']))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def _fake_stories(count, content_chars):
+    categories = ['童话故事', '寓言故事', '成语故事', '睡前故事', '民间故事', '神话故事', '历史故事', '科学故事']
+    rng = random.Random(42)
+    for story_id in range(1, count + 1):
+        content = '从前有一只小兔子在森林里玩耍。' * (content_chars // 15 + 1)
+        yield {
+            'story_id': story_id,
+            'title': f'故事{story_id}号',
+            'content': content[:content_chars],
+            'category': rng.choice(categories),
+            'url': f'https://storynook.cn/?id={story_id}',
+            'word_count': content_chars,
+        }
+
+
+def _run_threads(stories, threads, save):
+    work = queue.Queue()
+    for story in stories:
+        work.put(story)
+
+    def worker():
+        while True:
+            try:
+                story = work.get_nowait()
+            except queue.Empty:
+                return
+            save(story)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def _check_counts(db_path):
+    conn = sqlite3.connect(db_path)
+    actual = dict(conn.execute("SELECT category, COUNT(*) FROM stories GROUP BY category"))
+    recorded = dict(conn.execute("SELECT name, story_count FROM categories"))
+    total = conn.execute("SELECT COUNT(*) FROM stories").fetchone()[0]
+    conn.close()
+    return total, actual == recorded
+
+
+def benchmark(count, threads, content_chars, batch_size):
+    """逐条写入与单写入线程的对比（各写入count条，再把前10%重写一遍模拟重抓）"""
+    stories = list(_fake_stories(count, content_chars))
+    rewrites = [dict(story, category='重抓故事') for story in stories[:count // 10]]
+    workdir = tempfile.mkdtemp(prefix='crawl_writer_bench_')
+    results = {}
+    try:
+        db_path = os.path.join(workdir, 'per_row.db')
+        _create_schema(db_path)
+        lock = threading.Lock()
+        elapsed = _run_threads(stories + rewrites, threads, lambda story: _save_per_row(db_path, story, lock))
+        results['逐条写入'] = (elapsed,) + _check_counts(db_path)
+
+        db_path = os.path.join(workdir, 'writer.db')
+        _create_schema(db_path)
+        writer = StoryWriter(db_path, batch_size=batch_size)
+        started = time.perf_counter()
+        _run_threads(stories + rewrites, threads, writer.put)
+        writer.close()
+        elapsed = time.perf_counter() - started
+        results['单写入线程'] = (elapsed,) + _check_counts(db_path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    total_writes = len(stories) + len(rewrites)
+    print(f"📊 写入 {total_writes} 条（{count} 个故事 + {len(rewrites)} 条重写）, {threads} 个线程, 正文 {content_chars} 字")
+    for name, (elapsed, total, consistent) in results.items():
+        print(f"   {name}: {elapsed:.2f} 秒, {total_writes / elapsed:.0f} 条/秒, "
+              f"库中 {total} 个故事, 分类统计{'一致' if consistent else '不一致'}")
+    baseline = results['逐条写入'][0]
+    print(f"   加速: {baseline / results['单写入线程'][0]:.1f} 倍")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比逐条写入与单写入线程批量写入')
+    parser.add_argument('--stories', type=int, default=20000, help='故事数 (默认: 20000)')
+    parser.add_argument('--threads', type=int, default=8, help='提交线程数 (默认: 8)')
+    parser.add_argument('--content-chars', type=int, default=800, help='每个故事的正文字数 (默认: 800)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'每批写入条数 (默认: {DEFAULT_BATCH_SIZE})')
+    args = parser.parse_args()
+    benchmark(args.stories, args.threads, args.content_chars, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
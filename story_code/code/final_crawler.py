@@ -5,19 +5,22 @@
 专门针对 https://storynook.cn/?id={数字} 格式优化
 """
 
-import requests
 import json
 import time
 import sqlite3
 import os
 import logging
-from bs4 import BeautifulSoup
-import random
 from datetime import datetime
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 
+from crawl_discovery import IdSpaceExplorer
+from crawl_engine import CrawlEngine, CrawlRequest
+from crawl_frontier import CrawlFrontier
+from crawl_writer import StoryWriter
+from http_cache import DEFAULT_CACHE_DIR, HttpCache
+from page_parser import parse_page
+
 # 设置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -30,20 +33,16 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class FinalStoryCrawler:
-    def __init__(self, max_workers=5):
+    def __init__(self, max_workers=5, rate=5.0, refresh_after=None, cache_dir=DEFAULT_CACHE_DIR, offline=False):
         self.base_url = "https://storynook.cn"
-        self.session = requests.Session()
         self.max_workers = max_workers
+        # 离线回放：只用HTTP缓存中的页面重新解析，不访问网络也不改动抓取状态
+        self.offline = offline
         
-        # 设置请求头
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        })
+        # 共享抓取引擎：连接池、每主机限速、重试与磁盘缓存（cache_dir为None时不缓存）
+        cache = HttpCache(cache_dir, offline=offline) if cache_dir else None
+        self.engine = CrawlEngine(concurrency=max_workers, per_host=max_workers, rate=rate,
+                                  max_retries=3, timeout=10, cache=cache)
         
         # 创建数据目录
         self.data_dir = "final_stories"
@@ -52,9 +51,18 @@ class FinalStoryCrawler:
         # 初始化数据库
         self.db_path = os.path.join(self.data_dir, "all_stories.db")
         self.init_database()
+        # 单写入线程：批量事务写入，分类统计增量更新
+        self.writer = StoryWriter(self.db_path)
+        
+        # 抓取状态（可续传）；首次使用时把数据库中已有的故事记为已完成
+        self.frontier = CrawlFrontier(os.path.join(self.data_dir, "frontier.db"), refresh_after=refresh_after)
+        if not len(self.frontier):
+            conn = sqlite3.connect(self.db_path)
+            self.frontier.seed(row[0] for row in conn.execute("SELECT story_id FROM stories"))
+            conn.close()
         
         # 线程锁
-        self.db_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
         
         # 统计信息
         self.stats = {
@@ -101,33 +109,9 @@ class FinalStoryCrawler:
         conn.close()
         logger.info(f"数据库初始化完成: {self.db_path}")
     
-    def make_request(self, url, **kwargs):
-        """发送HTTP请求，带重试机制"""
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                # 随机延迟
-                time.sleep(random.uniform(0.5, 1.5))
-                
-                response = self.session.get(url, timeout=10, **kwargs)
-                response.raise_for_status()
-                return response
-                
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    logger.warning(f"请求失败: {url} - {e}")
-                    return None
-                time.sleep(random.uniform(1, 3))
-        
-        return None
-    
     def extract_story_from_html(self, html_content, story_id, url):
-        """从HTML中提取故事信息"""
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # 移除脚本和样式
-        for script in soup(["script", "style"]):
-            script.decompose()
+        """从HTML中提取故事信息（页面只解析一次，脚本和样式不计入文本）"""
+        page = parse_page(html_content)
         
         # 提取标题 - 尝试多种选择器
         title = None
@@ -138,16 +122,16 @@ class FinalStoryCrawler:
         ]
         
         for selector in title_selectors:
-            title_elem = soup.select_one(selector)
+            title_elem = page.select_one(selector)
             if title_elem:
-                title = title_elem.get_text().strip()
+                title = page.text(title_elem).strip()
                 if title and len(title) > 2 and title != "小故事铺":
                     break
         
         # 如果没找到专门的标题，从页面内容中提取
         if not title or title == "小故事铺":
             # 查找可能的标题模式
-            text_content = soup.get_text()
+            text_content = page.text()
             lines = [line.strip() for line in text_content.split('\n') if line.strip()]
             
             for line in lines:
@@ -167,25 +151,23 @@ class FinalStoryCrawler:
         ]
         
         for selector in content_selectors:
-            content_elem = soup.select_one(selector)
+            content_elem = page.select_one(selector)
             if content_elem:
-                content = content_elem.get_text().strip()
+                content = page.text(content_elem).strip()
                 if content and len(content) > 50:
                     break
         
         # 如果没找到专门的内容区域，提取所有段落
         if not content:
-            paragraphs = soup.find_all('p')
-            if paragraphs:
-                content = '\n'.join([p.get_text().strip() for p in paragraphs if p.get_text().strip()])
+            paragraphs = [page.text(p).strip() for p in page.find_all('p')]
+            content = '\n'.join(text for text in paragraphs if text)
         
         # 如果还是没有内容，提取主要文本
         if not content:
             # 移除导航、菜单等元素
-            for elem in soup(['nav', 'header', 'footer', 'aside', '.nav', '.menu', '.header', '.footer']):
-                elem.decompose()
+            page.decompose(['nav', 'header', 'footer', 'aside'])
             
-            content = soup.get_text()
+            content = page.text()
             # 清理内容
             lines = [line.strip() for line in content.split('\n') if line.strip()]
             content = '\n'.join(lines)
@@ -257,101 +239,98 @@ class FinalStoryCrawler:
         
         return content.strip()
     
-    def crawl_story(self, story_id):
-        """爬取单个故事"""
-        url = f"{self.base_url}/?id={story_id}"
+    def handle_story_page(self, result, on_commit=None):
+        """处理单个故事页面的抓取结果（在引擎的处理线程中执行），故事提交到数据库后调用on_commit
+
+        保存失败（写入线程不可用等）时异常向上抛出，由调用方记为抓取失败以便重试。
+        """
+        story_id = result.key
+        url = result.url
         
         try:
-            response = self.make_request(url)
-            if not response:
-                self.stats['failed_downloads'] += 1
+            if not result.ok:
+                with self.stats_lock:
+                    self.stats['failed_downloads'] += 1
+                if result.error is None:
+                    logger.warning(f"请求失败: {url} - HTTP {result.status}")
                 return None
             
-            story_data = self.extract_story_from_html(response.text, story_id, url)
-            
-            if story_data:
-                self.save_story_to_db(story_data)
-                self.stats['successful_downloads'] += 1
-                self.stats['categories_found'].add(story_data['category'])
-                
-                logger.info(f"✅ 故事 {story_id}: {story_data['title'][:30]}... ({story_data['category']})")
-                return story_data
-            else:
-                self.stats['empty_stories'] += 1
-                logger.debug(f"❌ 故事 {story_id}: 内容为空或无效")
-                return None
-                
+            story_data = self.extract_story_from_html(result.text(), story_id, url)
         except Exception as e:
-            self.stats['failed_downloads'] += 1
+            with self.stats_lock:
+                self.stats['failed_downloads'] += 1
             logger.warning(f"❌ 故事 {story_id} 爬取失败: {e}")
             return None
+        
+        if not story_data:
+            with self.stats_lock:
+                self.stats['empty_stories'] += 1
+            logger.debug(f"❌ 故事 {story_id}: 内容为空或无效")
+            return None
+        
+        self.save_story_to_db(story_data, on_commit)
+        with self.stats_lock:
+            self.stats['successful_downloads'] += 1
+            self.stats['categories_found'].add(story_data['category'])
+        
+        logger.info(f"✅ 故事 {story_id}: {story_data['title'][:30]}... ({story_data['category']})")
+        return story_data
     
-    def save_story_to_db(self, story):
-        """保存故事到数据库"""
-        with self.db_lock:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            try:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO stories 
-                    (story_id, title, content, category, url, word_count)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    story['story_id'],
-                    story['title'],
-                    story['content'],
-                    story['category'],
-                    story['url'],
-                    story['word_count']
-                ))
-                
-                # 更新分类统计
-                cursor.execute('''
-                    INSERT OR REPLACE INTO categories (name, story_count)
-                    VALUES (?, (
-                        SELECT COUNT(*) FROM stories WHERE category = ?
-                    ))
-                ''', (story['category'], story['category']))
-                
-                conn.commit()
-                
-            except Exception as e:
-                logger.error(f"保存故事到数据库失败: {e}")
-            finally:
-                conn.close()
+    def save_story_to_db(self, story, on_commit=None):
+        """保存故事到数据库（交给写入线程批量提交，提交后调用on_commit）"""
+        self.writer.put(story, on_commit)
+    
+    def crawl_story(self, story_id):
+        """爬取单个故事"""
+        url = f"{self.base_url}/?id={story_id}"
+        return self.handle_story_page(self.engine.fetch_one(CrawlRequest(url, key=story_id)))
+    
+    def collect_story(self, result):
+        """引擎处理器：解析保存后按分类组织数据并定期显示进度"""
+        # 故事提交到数据库后才在抓取边界中标记完成，避免中途退出时丢失队列中的故事
+        on_commit = None if self.offline else lambda: self.frontier.record(result, True)
+        try:
+            story_data = self.handle_story_page(result, on_commit)
+        except Exception as e:
+            # 页面有故事但没能交给写入线程：记为失败按退避重试，不能当作空页面
+            logger.error(f"❌ 故事 {result.key} 保存失败: {e}")
+            with self.stats_lock:
+                self.stats['failed_downloads'] += 1
+            if not self.offline:
+                self.frontier.mark_failed(result.key, error=repr(e))
+            story_data = None
+        else:
+            if story_data is None and not self.offline:
+                self.frontier.record(result, False)
+        with self.stats_lock:
+            self.stats['total_attempted'] += 1
+            if story_data:
+                # 按分类组织数据
+                self.story_data.setdefault(story_data['category'], []).append(story_data)
+            # 每100个故事显示一次进度
+            if self.stats['total_attempted'] % 100 == 0:
+                self.show_progress()
+        return story_data
     
     def crawl_range(self, start_id, end_id):
-        """爬取指定范围的故事"""
-        logger.info(f"开始爬取故事 {start_id} 到 {end_id}")
-        
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # 提交所有任务
-            future_to_id = {
-                executor.submit(self.crawl_story, story_id): story_id 
-                for story_id in range(start_id, end_id + 1)
-            }
-            
-            # 处理完成的任务
-            for future in as_completed(future_to_id):
-                story_id = future_to_id[future]
-                self.stats['total_attempted'] += 1
-                
-                try:
-                    story_data = future.result()
-                    if story_data:
-                        # 按分类组织数据
-                        category = story_data['category']
-                        if category not in self.story_data:
-                            self.story_data[category] = []
-                        self.story_data[category].append(story_data)
-                
-                except Exception as e:
-                    logger.error(f"处理故事 {story_id} 结果时出错: {e}")
-                
-                # 每100个故事显示一次进度
-                if self.stats['total_attempted'] % 100 == 0:
-                    self.show_progress()
+        """爬取指定范围的故事：只抓取新id和到期需要重试/刷新的id"""
+        if self.offline:
+            story_ids = range(start_id, end_id + 1)
+            logger.info(f"离线回放故事 {start_id} 到 {end_id}（只使用HTTP缓存）")
+        else:
+            added = self.frontier.add_range(start_id, end_id)
+            story_ids = self.frontier.due(start_id, end_id)
+            logger.info(f"开始爬取故事 {start_id} 到 {end_id}: 新增 {added} 个, 本次待抓取 {len(story_ids)} 个")
+        logger.info(f"📌 抓取状态: {self.frontier.counts()}")
+        self.crawl_ids(story_ids)
+    
+    def crawl_ids(self, story_ids):
+        """抓取一组故事id，返回成功提取的故事列表"""
+        requests = (CrawlRequest(f"{self.base_url}/?id={story_id}", key=story_id) for story_id in story_ids)
+        stories = self.engine.crawl(requests, self.collect_story)
+        # 等写入线程提交完，抓取边界中的状态随之更新（id空间探索按此统计命中）
+        self.writer.flush()
+        return stories
     
     def show_progress(self):
         """显示进度"""
@@ -377,6 +356,8 @@ class FinalStoryCrawler:
     
     def get_statistics(self):
         """获取最终统计信息"""
+        # 先等写入线程把队列中的故事落盘
+        self.writer.flush()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
@@ -404,26 +385,29 @@ class FinalStoryCrawler:
             'empty': self.stats['empty_stories']
         }
     
-    def run(self, max_story_id=2000):
-        """运行完整的爬取流程"""
+    def run(self, max_story_id=2000, discover=False, **discover_options):
+        """运行完整的爬取流程
+
+        discover为True时不按max_story_id逐个扫描，而是自适应探索id空间
+        （discover_options传给crawl_discovery.IdSpaceExplorer）
+        """
         logger.info("🚀 开始最终故事爬取任务...")
         logger.info(f"目标网站: {self.base_url}")
         logger.info(f"URL模式: {self.base_url}/?id={{数字}}")
-        logger.info(f"最大故事ID: {max_story_id}")
-        logger.info(f"并发线程数: {self.max_workers}")
+        logger.info("最大故事ID: 自动探索" if discover else f"最大故事ID: {max_story_id}")
+        logger.info(f"并发请求数: {self.max_workers}, 限速: {self.engine.rate} 次/秒")
         
         start_time = datetime.now()
         
-        # 分批爬取，避免一次性创建太多线程
-        batch_size = 500
-        for start_id in range(1, max_story_id + 1, batch_size):
-            end_id = min(start_id + batch_size - 1, max_story_id)
-            
-            logger.info(f"🔄 爬取批次: {start_id} - {end_id}")
-            self.crawl_range(start_id, end_id)
-            
-            # 批次间休息
-            time.sleep(2)
+        # 引擎自身限制在途请求数并按令牌桶限速，无需再分批休息
+        if discover:
+            IdSpaceExplorer(self.frontier, self.crawl_ids, **discover_options).run()
+        else:
+            self.crawl_range(1, max_story_id)
+        logger.info(f"📡 抓取统计: {self.engine.summary()}")
+        logger.info(f"📌 抓取状态: {self.frontier.counts()}")
+        self.writer.close()
+        logger.info(f"💾 写入统计: {self.writer.stats()}")
         
         # 保存数据
         json_file = self.save_to_json()
@@ -466,12 +450,16 @@ def main():
         stats = crawler.run(max_story_id=2000)
         
         print(f"\n🎉 任务完成！成功获取了 {stats['total_stories']} 个故事！")
-        print(f"📊 成功率: {stats['total_stories']/stats['attempted']*100:.1f}%")
+        if stats['attempted']:
+            print(f"📊 本次成功率: {stats['successful']/stats['attempted']*100:.1f}%")
+        else:
+            print("📌 没有需要抓取的新故事")
         
         return stats
         
     except KeyboardInterrupt:
         logger.info("用户中断爬取")
+        crawler.writer.close()
         return crawler.get_statistics()
     except Exception as e:
         logger.error(f"爬取过程中出现错误: {e}")
@@ -4,19 +4,20 @@
 修复版故事爬虫 - 正确处理Brotli压缩
 """
 
-import requests
 import sqlite3
 import json
 import time
-import random
 import logging
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from bs4 import BeautifulSoup
 import re
 import os
-from urllib.parse import urljoin
-import brotli  # 需要安装: pip install brotli
+
+from crawl_discovery import IdSpaceExplorer
+from crawl_engine import CrawlEngine, CrawlRequest, DEFAULT_HEADERS
+from crawl_frontier import CrawlFrontier
+from crawl_writer import StoryWriter
+from http_cache import DEFAULT_CACHE_DIR, HttpCache
+from page_parser import first_text, parse_page
 
 # 配置日志
 logging.basicConfig(
@@ -30,23 +31,20 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class FixedStoryCrawler:
-    def __init__(self, base_url="https://storynook.cn", max_stories=2000):
+    def __init__(self, base_url="https://storynook.cn", max_stories=2000, rate=2.0, refresh_after=None,
+                 cache_dir=DEFAULT_CACHE_DIR, offline=False):
         self.base_url = base_url
         self.max_stories = max_stories
         self.db_path = "fixed_stories.db"
         self.json_path = "fixed_stories.json"
         
-        # 创建session，支持Brotli解压
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',  # 支持Brotli
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Cache-Control': 'max-age=0'
-        })
+        # 离线回放：只用HTTP缓存中的页面重新解析，不访问网络也不改动抓取状态
+        self.offline = offline
+        
+        # 共享抓取引擎；aiohttp在安装了brotli时自动解压br响应；已缓存的页面做条件请求
+        cache = HttpCache(cache_dir, offline=offline) if cache_dir else None
+        self.engine = CrawlEngine(headers=dict(DEFAULT_HEADERS, **{'Cache-Control': 'max-age=0'}),
+                                  rate=rate, timeout=30, cache=cache)
         
         # 统计信息
         self.stats = {
@@ -61,6 +59,16 @@ class FixedStoryCrawler:
         
         # 初始化数据库
         self.init_database()
+        # 单写入线程：批量事务写入，分类统计增量更新
+        self.writer = StoryWriter(self.db_path, columns=('id', 'title', 'content', 'category', 'word_count'),
+                                  key='id', count_column='count')
+        
+        # 抓取状态（可续传）；首次使用时把数据库中已有的故事记为已完成
+        self.frontier = CrawlFrontier("fixed_frontier.db", refresh_after=refresh_after)
+        if not len(self.frontier):
+            conn = sqlite3.connect(self.db_path)
+            self.frontier.seed(row[0] for row in conn.execute("SELECT id FROM stories"))
+            conn.close()
         
     def init_database(self):
         """初始化SQLite数据库"""
@@ -101,33 +109,24 @@ class FixedStoryCrawler:
     def fetch_story(self, story_id):
         """获取单个故事内容"""
         url = f"{self.base_url}/?id={story_id}"
+        return self.parse_story_page(self.engine.fetch_one(CrawlRequest(url, key=story_id)))
+    
+    def parse_story_page(self, result):
+        """解析故事页面的抓取结果"""
+        story_id = result.key
         
         try:
-            # 随机延迟
-            time.sleep(random.uniform(0.5, 2.0))
-            
-            response = self.session.get(url, timeout=30)
+            if result.error is not None:
+                logger.error(f"故事 {story_id}: 请求失败 - {result.error}")
+                return None
             
             # 检查响应状态
-            if response.status_code != 200:
-                logger.warning(f"故事 {story_id}: HTTP {response.status_code}")
+            if result.status != 200:
+                logger.warning(f"故事 {story_id}: HTTP {result.status}")
                 return None
             
-            # 检查内容编码
-            encoding = response.headers.get('content-encoding', '').lower()
-            logger.debug(f"故事 {story_id}: 编码 = {encoding}")
-            
-            # 获取原始内容
-            content = response.content
-            
-            # 如果是Brotli压缩，手动解压
-            if encoding == 'br':
-                try:
-                    content = brotli.decompress(content)
-                    logger.debug(f"故事 {story_id}: Brotli解压成功")
-                except Exception as e:
-                    logger.error(f"故事 {story_id}: Brotli解压失败 - {e}")
-                    return None
+            # 获取原始内容（引擎已按Content-Encoding解压）
+            content = result.body
             
             # 解码为文本
             try:
@@ -135,11 +134,11 @@ class FixedStoryCrawler:
             except UnicodeDecodeError:
                 html_content = content.decode('utf-8', errors='ignore')
             
-            # 解析HTML
-            soup = BeautifulSoup(html_content, 'html.parser')
+            # 解析HTML（只解析一次）
+            page = parse_page(html_content)
             
             # 提取标题和内容
-            story_data = self.extract_story_data(soup, story_id)
+            story_data = self.extract_story_data(page, story_id)
             
             if story_data:
                 logger.info(f"✅ 故事 {story_id}: {story_data['title'][:30]}...")
@@ -148,15 +147,12 @@ class FixedStoryCrawler:
                 logger.warning(f"❌ 故事 {story_id}: 无法提取内容")
                 return None
                 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"故事 {story_id}: 请求失败 - {e}")
-            return None
         except Exception as e:
             logger.error(f"故事 {story_id}: 处理失败 - {e}")
             return None
     
-    def extract_story_data(self, soup, story_id):
-        """从HTML中提取故事数据"""
+    def extract_story_data(self, page, story_id):
+        """从解析后的页面（page_parser.ParsedPage）中提取故事数据"""
         try:
             # 多种标题选择器
             title_selectors = [
@@ -169,16 +165,7 @@ class FixedStoryCrawler:
                 '.entry-title'
             ]
             
-            title = None
-            for selector in title_selectors:
-                elements = soup.select(selector)
-                for element in elements:
-                    text = element.get_text(strip=True)
-                    if text and len(text) > 2 and len(text) < 200:
-                        title = text
-                        break
-                if title:
-                    break
+            title = first_text(page, title_selectors, strip=True, min_len=3, max_len=199)
             
             # 多种内容选择器
             content_selectors = [
@@ -194,25 +181,12 @@ class FixedStoryCrawler:
                 'p'
             ]
             
-            content = None
-            for selector in content_selectors:
-                elements = soup.select(selector)
-                for element in elements:
-                    text = element.get_text(strip=True)
-                    if text and len(text) > 100:  # 内容应该足够长
-                        content = text
-                        break
-                if content:
-                    break
+            # 内容应该足够长
+            content = first_text(page, content_selectors, strip=True, min_len=101)
             
-            # 如果没找到合适的内容，尝试获取所有文本
+            # 如果没找到合适的内容，尝试获取所有文本（script和style不计入文本）
             if not content:
-                # 移除script和style标签
-                for script in soup(["script", "style"]):
-                    script.decompose()
-                
-                # 获取所有文本
-                all_text = soup.get_text()
+                all_text = page.text()
                 lines = [line.strip() for line in all_text.splitlines() if line.strip()]
                 content = '\n'.join(lines)
             
@@ -276,90 +250,47 @@ class FixedStoryCrawler:
         
         return '其他故事'
     
-    def save_to_database(self, story_data):
-        """保存故事到数据库"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 插入故事
-            cursor.execute('''
-                INSERT OR REPLACE INTO stories 
-                (id, title, content, category, word_count)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                story_data['id'],
-                story_data['title'],
-                story_data['content'],
-                story_data['category'],
-                story_data['word_count']
-            ))
-            
-            # 更新分类统计
-            cursor.execute('''
-                INSERT OR REPLACE INTO categories (name, count)
-                VALUES (?, (
-                    SELECT COUNT(*) FROM stories WHERE category = ?
-                ))
-            ''', (story_data['category'], story_data['category']))
-            
-            conn.commit()
-            conn.close()
-            
-        except Exception as e:
-            logger.error(f"保存数据库失败: {e}")
+    def save_to_database(self, story_data, on_commit=None):
+        """保存故事到数据库（交给写入线程批量提交，提交后调用on_commit）"""
+        self.writer.put(story_data, on_commit)
     
-    def process_story(self, story_id):
-        """处理单个故事"""
+    def process_story(self, result):
+        """引擎处理器：解析并保存单个故事"""
         with self.lock:
             self.stats['total_processed'] += 1
         
-        story_data = self.fetch_story(story_id)
+        story_data = self.parse_story_page(result)
         
         if story_data:
-            self.save_to_database(story_data)
-            with self.lock:
-                self.stats['successful'] += 1
-            return story_data
-        else:
-            with self.lock:
-                self.stats['failed'] += 1
-            return None
+            # 故事提交到数据库后才在抓取边界中标记完成，避免中途退出时丢失队列中的故事
+            self.save_to_database(story_data, None if self.offline else lambda: self.frontier.record(result, True))
+        elif not self.offline:
+            self.frontier.record(result, False)
+        with self.lock:
+            self.stats['successful' if story_data else 'failed'] += 1
+            # 每100个故事显示一次进度
+            if self.stats['total_processed'] % 100 == 0:
+                self.print_progress()
+        return story_data
     
     def crawl_stories(self, start_id=1, end_id=None, max_workers=8):
         """爬取故事"""
         if end_id is None:
             end_id = self.max_stories
         
-        logger.info(f"开始爬取故事 {start_id} 到 {end_id}")
-        logger.info(f"使用 {max_workers} 个线程")
-        
-        story_ids = list(range(start_id, end_id + 1))
-        stories = []
+        if self.offline:
+            story_ids = range(start_id, end_id + 1)
+            logger.info(f"离线回放故事 {start_id} 到 {end_id}（只使用HTTP缓存）")
+        else:
+            added = self.frontier.add_range(start_id, end_id)
+            story_ids = self.frontier.due(start_id, end_id)
+            logger.info(f"开始爬取故事 {start_id} 到 {end_id}: 新增 {added} 个, 本次待抓取 {len(story_ids)} 个")
+        logger.info(f"抓取状态: {self.frontier.counts()}")
+        logger.info(f"并发请求数: {max_workers}, 限速: {self.engine.rate} 次/秒")
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交任务
-            future_to_id = {
-                executor.submit(self.process_story, story_id): story_id 
-                for story_id in story_ids
-            }
-            
-            # 处理结果
-            for future in as_completed(future_to_id):
-                story_id = future_to_id[future]
-                try:
-                    result = future.result()
-                    if result:
-                        stories.append(result)
-                    
-                    # 每100个故事显示一次进度
-                    if self.stats['total_processed'] % 100 == 0:
-                        self.print_progress()
-                        
-                except Exception as e:
-                    logger.error(f"处理故事 {story_id} 时出错: {e}")
-                    with self.lock:
-                        self.stats['failed'] += 1
+        self.engine.concurrency = self.engine.per_host = max_workers
+        stories = self.crawl_ids(story_ids)
+        self.writer.close()
         
         # 保存到JSON
         self.save_to_json(stories)
@@ -369,6 +300,31 @@ class FixedStoryCrawler:
         
         return stories
     
+    def discover_stories(self, max_workers=8, **options):
+        """自适应探索id空间并爬取（options传给crawl_discovery.IdSpaceExplorer）"""
+        logger.info(f"开始探索故事id空间, 抓取状态: {self.frontier.counts()}")
+        self.engine.concurrency = self.engine.per_host = max_workers
+        stories = []
+        
+        def crawl_ids(story_ids):
+            found = self.crawl_ids(story_ids)
+            stories.extend(found)
+            return found
+        
+        IdSpaceExplorer(self.frontier, crawl_ids, **options).run()
+        self.writer.close()
+        self.save_to_json(stories)
+        self.print_final_stats()
+        return stories
+    
+    def crawl_ids(self, story_ids):
+        """抓取一组故事id，返回成功解析的故事列表"""
+        requests = (CrawlRequest(f"{self.base_url}/?id={story_id}", key=story_id) for story_id in story_ids)
+        stories = self.engine.crawl(requests, self.process_story)
+        # 等写入线程提交完，抓取边界中的状态随之更新（id空间探索按此统计命中）
+        self.writer.flush()
+        return stories
+    
     def save_to_json(self, stories):
         """保存故事到JSON文件"""
         try:
@@ -397,9 +353,12 @@ class FixedStoryCrawler:
         logger.info(f"总处理: {self.stats['total_processed']}")
         logger.info(f"成功: {self.stats['successful']}")
         logger.info(f"失败: {self.stats['failed']}")
-        logger.info(f"成功率: {self.stats['successful']/self.stats['total_processed']*100:.1f}%")
+        if self.stats['total_processed']:
+            logger.info(f"成功率: {self.stats['successful']/self.stats['total_processed']*100:.1f}%")
         logger.info(f"总耗时: {elapsed:.1f}秒")
         logger.info(f"平均速度: {self.stats['total_processed']/elapsed:.1f}故事/秒")
+        logger.info(f"抓取状态: {self.frontier.counts()}")
+        logger.info(f"写入统计: {self.writer.stats()}")
         logger.info("=" * 60)
 
 def main():
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+爬虫共享的磁盘HTTP缓存
+SQLite索引记录每个URL的状态码、响应头与校验器（ETag/Last-Modified），
+响应体按内容的sha256寻址，zlib压缩后存放在 blobs/ 下（相同内容只存一份）。
+
+- 正常模式: 已缓存的URL带 If-None-Match / If-Modified-Since 请求，
+  服务器返回304时直接用磁盘上的内容，不再重新下载
+- 离线回放模式(offline): 完全不访问网络，命中缓存返回原响应，未命中返回504
+  （同HTTP的only-if-cached），用于修改解析逻辑后对已下载页面重跑
+- 总大小超过max_bytes时按最近访问时间淘汰（LRU）
+
+用法:
+    python http_cache.py                      # 显示缓存统计
+    python http_cache.py --prune --max-mb 256
+    python http_cache.py --clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'http_cache')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# 淘汰时降到上限的该比例，避免每次写入都触发淘汰
+EVICT_TARGET = 0.9
+# 随缓存保存的响应头
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Content-Language')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at);
+CREATE INDEX IF NOT EXISTS idx_entries_digest ON entries(digest);
+"""
+
+
+class CacheEntry:
+    """一条缓存记录（不含响应体，需要时用HttpCache.body()读取）"""
+
+    __slots__ = ('url', 'digest', 'status', 'headers', 'etag', 'last_modified', 'stored_at')
+
+    def __init__(self, url, digest, status, headers, etag, last_modified, stored_at):
+        self.url = url
+        self.digest = digest
+        self.status = status
+        self.headers = headers
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at
+
+    def validators(self):
+        """条件请求头"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """磁盘HTTP缓存（线程安全）
+
+    cache_dir: 缓存目录（index.db 与 blobs/）
+    max_bytes: 压缩后响应体的总大小上限，0为不限
+    offline: 离线回放模式
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, offline=False):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, 'blobs')
+        self.max_bytes = max_bytes
+        self.offline = offline
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(cache_dir, 'index.db'), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        self.evicted = 0
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def lookup(self, url):
+        """返回URL的缓存记录并刷新访问时间，没有时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, digest, status, headers, etag, last_modified, stored_at FROM entries WHERE url = ?",
+                (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE entries SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        url, digest, status, headers, etag, last_modified, stored_at = row
+        return CacheEntry(url, digest, status, json.loads(headers), etag, last_modified, stored_at)
+
+    def body(self, entry):
+        """读取记录的响应体；文件丢失或损坏时删除该记录并返回None"""
+        try:
+            with open(self._blob_path(entry.digest), 'rb') as f:
+                return zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            self.remove(entry.url)
+            return None
+
+    def store(self, url, status, headers, body):
+        """保存一个响应（只缓存200），返回CacheEntry"""
+        if status != 200:
+            return None
+        kept = {name: headers[name] for name in STORED_HEADERS if headers.get(name)}
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest)
+        now = time.time()
+        with self._lock:
+            new_blob = self._conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone() is None
+            if new_blob:
+                data = zlib.compress(body, 6)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            old = self._conn.execute("SELECT digest FROM entries WHERE url = ?", (url,)).fetchone()
+            with self._conn:
+                if new_blob:
+                    self._conn.execute("INSERT INTO blobs (digest, size) VALUES (?, ?)", (digest, len(data)))
+                    self.total_bytes += len(data)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (url, digest, status, headers, etag, last_modified, stored_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (url, digest, status, json.dumps(kept, ensure_ascii=False), kept.get('ETag'),
+                     kept.get('Last-Modified'), now, now)
+                )
+                if old is not None and old[0] != digest:
+                    self._drop_blob_if_unused(old[0])
+            if self.max_bytes and self.total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * EVICT_TARGET))
+        return CacheEntry(url, digest, status, kept, kept.get('ETag'), kept.get('Last-Modified'), now)
+
+    def refresh(self, url, headers=None):
+        """304后更新存储时间（以及服务器给出的新校验器）"""
+        headers = headers or {}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE entries SET stored_at = ?, accessed_at = ?, etag = COALESCE(?, etag), "
+                "last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (time.time(), time.time(), headers.get('ETag'), headers.get('Last-Modified'), url)
+            )
+
+    def remove(self, url):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT digest FROM entries WHERE url = ?", (url,)).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self._drop_blob_if_unused(row[0])
+
+    def _drop_blob_if_unused(self, digest):
+        # 调用方持有锁并处于事务中
+        if self._conn.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+            return
+        row = self._conn.execute("SELECT size FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return
+        self._conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        self.total_bytes -= row[0]
+        try:
+            os.remove(self._blob_path(digest))
+        except OSError:
+            pass
+
+    def _evict(self, target):
+        """按最近访问时间从旧到新淘汰，直到总大小不超过target（调用方持有锁）"""
+        with self._conn:
+            for url, digest in self._conn.execute(
+                    "SELECT url, digest FROM entries ORDER BY accessed_at").fetchall():
+                if self.total_bytes <= target:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self._drop_blob_if_unused(digest)
+                self.evicted += 1
+
+    def prune(self, max_bytes=None):
+        """立即淘汰到max_bytes（默认为配置的上限）以下"""
+        with self._lock:
+            self._evict(self.max_bytes if max_bytes is None else max_bytes)
+
+    def clear(self):
+        with self._lock:
+            with self._conn:
+                digests = [row[0] for row in self._conn.execute("SELECT digest FROM blobs")]
+                self._conn.execute("DELETE FROM entries")
+                self._conn.execute("DELETE FROM blobs")
+            for digest in digests:
+                try:
+                    os.remove(self._blob_path(digest))
+                except OSError:
+                    pass
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            blobs = self._conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        return {
+            'entries': entries,
+            'blobs': blobs,
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'evicted': self.evicted,
+            'offline': self.offline,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='爬虫HTTP缓存管理')
+    parser.add_argument('--dir', default=DEFAULT_CACHE_DIR, help='缓存目录 (默认: 本目录下 http_cache)')
+    parser.add_argument('--prune', action='store_true', help='按LRU淘汰到 --max-mb 以下')
+    parser.add_argument('--max-mb', type=float, default=DEFAULT_MAX_BYTES / 1024 / 1024,
+                        help=f'缓存大小上限MB (默认: {DEFAULT_MAX_BYTES // 1024 // 1024})')
+    parser.add_argument('--clear', action='store_true', help='清空缓存')
+    args = parser.parse_args()
+
+    cache = HttpCache(args.dir, max_bytes=int(args.max_mb * 1024 * 1024))
+    if args.clear:
+        cache.clear()
+        print("🧹 缓存已清空")
+    if args.prune:
+        cache.prune()
+        print(f"🧹 已淘汰 {cache.evicted} 条记录")
+    stats = cache.stats()
+    print(f"📦 {args.dir}: {stats['entries']} 个URL, {stats['blobs']} 个内容块, "
+          f"{stats['bytes'] / 1024 / 1024:.1f} MB / {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+爬虫共用的HTML解析层
+每个页面只解析一次，得到一个扁平的页面模型（ParsedPage）：按文档顺序排列的元素
+（标签、属性、文本范围）加上文本片段表。提取逻辑在这个模型上做简单选择器匹配，
+取元素文本只是对片段表切片，不再反复遍历BeautifulSoup树。
+
+可选解析后端:
+    stream       标准库html.parser的流式分词，直接生成页面模型（无额外依赖）
+    lxml         lxml的HTMLParser target接口，同样不建树（安装了lxml时为默认）
+    html.parser  BeautifulSoup(html, 'html.parser')建树后再转换（与旧实现行为最接近）
+
+默认后端可用环境变量 STORY_HTML_PARSER 或 set_default_backend() 修改。
+script/style的内容不计入文本（与旧代码先decompose再get_text一致），但保留在page.scripts中。
+
+支持的选择器: tag、.class、#id、[attr]、[attr="v"]、[attr*="v"]
+
+用法:
+    page = parse_page(html)
+    title = first_text(page, ['h1', '.title'], strip=True, min_len=3)
+    python page_parser.py --corpus ./http_cache --repeat 20   # 各后端的解析提取基准
+"""
+
+import argparse
+import functools
+import html.parser
+import importlib.util
+import os
+import re
+import time
+import tracemalloc
+
+BACKENDS = ('stream', 'lxml', 'html.parser')
+# 装了lxml（requirements.txt中已列出）时默认用lxml，否则用标准库流式分词
+DEFAULT_BACKEND = os.environ.get('STORY_HTML_PARSER') or (
+    'lxml' if importlib.util.find_spec('lxml') is not None else 'stream')
+
+# 不计入文本的元素
+SKIP_TEXT_TAGS = frozenset({'script', 'style'})
+# 保留空白的元素
+PRESERVE_WHITESPACE_TAGS = frozenset({'pre', 'textarea'})
+# 没有结束标签的元素
+VOID_TAGS = frozenset({'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                       'param', 'source', 'track', 'wbr'})
+
+SELECTOR_RE = re.compile(
+    r'^(?:(?P<tag>[a-zA-Z][a-zA-Z0-9]*)'
+    r'|\.(?P<cls>[\w-]+)'
+    r'|#(?P<id>[\w-]+)'
+    r'|\[(?P<attr>[\w-]+)(?:(?P<op>\*?=)["\']?(?P<value>[^"\'\]]*)["\']?)?\])$'
+)
+
+
+class Node:
+    """页面中的一个元素；start/end为文本片段表中的范围，index/last为元素表中自身及最后一个后代的位置"""
+
+    __slots__ = ('tag', 'attrs', 'start', 'end', 'index', 'last', 'removed')
+
+    def __init__(self, tag, attrs, start, index):
+        self.tag = tag
+        self.attrs = attrs
+        self.start = start
+        self.end = start
+        self.index = index
+        self.last = index
+        self.removed = False
+
+    def get(self, name, default=None):
+        return self.attrs.get(name, default)
+
+    @property
+    def classes(self):
+        return self.attrs.get('class', '').split()
+
+    def __repr__(self):
+        return f"Node({self.tag!r}, {self.attrs!r})"
+
+
+class ParsedPage:
+    """扁平页面模型"""
+
+    def __init__(self, nodes, chunks, scripts, backend):
+        self.nodes = nodes
+        self.chunks = chunks
+        self.scripts = scripts
+        self.backend = backend
+
+    def text(self, node=None, strip=False, separator=''):
+        """元素（默认整页）的文本；strip同BeautifulSoup的get_text(strip=True)"""
+        chunks = self.chunks if node is None else self.chunks[node.start:node.end]
+        if strip:
+            return separator.join(piece for piece in (chunk.strip() for chunk in chunks) if piece)
+        return separator.join(chunks)
+
+    get_text = text
+
+    def select(self, selector):
+        """按文档顺序返回匹配选择器的元素"""
+        match = compile_selector(selector)
+        return [node for node in self.nodes if not node.removed and match(node)]
+
+    def select_one(self, selector):
+        match = compile_selector(selector)
+        for node in self.nodes:
+            if not node.removed and match(node):
+                return node
+        return None
+
+    def find_all(self, tags=None, **attrs):
+        """按标签（字符串或列表）及属性过滤；属性值可以是字符串、True或已编译的正则"""
+        if isinstance(tags, str):
+            tags = (tags,)
+        result = []
+        for node in self.nodes:
+            if node.removed or (tags and node.tag not in tags):
+                continue
+            if all(_attr_matches(node.attrs.get(name), expected) for name, expected in attrs.items()):
+                result.append(node)
+        return result
+
+    def find(self, tags=None, **attrs):
+        found = self.find_all(tags, **attrs)
+        return found[0] if found else None
+
+    @property
+    def title(self):
+        node = self.find('title')
+        return self.text(node, strip=True) if node else None
+
+    def decompose(self, tags):
+        """移除这些标签的元素及其后代（同BeautifulSoup的decompose）"""
+        tags = frozenset(tags)
+        for node in self.nodes:
+            if node.removed or node.tag not in tags:
+                continue
+            for index in range(node.start, node.end):
+                self.chunks[index] = ''
+            for descendant in self.nodes[node.index:node.last + 1]:
+                descendant.removed = True
+
+
+def _attr_matches(value, expected):
+    if expected is True:
+        return value is not None
+    if value is None:
+        return False
+    if hasattr(expected, 'search'):
+        return expected.search(value) is not None
+    return value == expected
+
+
+@functools.lru_cache(maxsize=256)
+def compile_selector(selector):
+    """把简单选择器编译为判断函数"""
+    match = SELECTOR_RE.match(selector.strip())
+    if match is None:
+        raise ValueError(f"不支持的选择器: {selector}")
+    if match.group('tag'):
+        tag = match.group('tag').lower()
+        return lambda node: node.tag == tag
+    if match.group('cls'):
+        cls = match.group('cls')
+        return lambda node: cls in node.attrs.get('class', '').split()
+    if match.group('id'):
+        element_id = match.group('id')
+        return lambda node: node.attrs.get('id') == element_id
+    attr, op, value = match.group('attr').lower(), match.group('op'), match.group('value')
+    if op is None:
+        return lambda node: attr in node.attrs
+    if op == '*=':
+        return lambda node: value in node.attrs.get(attr, '')
+    return lambda node: node.attrs.get(attr) == value
+
+
+def first_text(page, selectors, strip=False, min_len=1, max_len=None, exclude=()):
+    """依次尝试选择器，返回第一个长度在[min_len, max_len]内的元素文本"""
+    for selector in selectors:
+        for node in page.select(selector):
+            text = page.text(node, strip=strip)
+            if not strip:
+                text = text.strip()
+            if len(text) >= min_len and (max_len is None or len(text) <= max_len) and text not in exclude:
+                return text
+    return None
+
+
+class PageBuilder:
+    """把解析事件组装成ParsedPage（各后端共用）"""
+
+    def __init__(self):
+        self.nodes = []
+        self.chunks = []
+        self.scripts = []
+        self._open = []
+        self._skip = 0
+        self._preserve = 0
+
+    def start(self, tag, attrs):
+        tag = tag.lower()
+        node = Node(tag, attrs, len(self.chunks), len(self.nodes))
+        self.nodes.append(node)
+        if tag in VOID_TAGS:
+            return
+        self._open.append(node)
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve += 1
+        if tag in SKIP_TEXT_TAGS:
+            self._skip += 1
+            if tag == 'script':
+                self.scripts.append([])
+
+    def end(self, tag):
+        tag = tag.lower()
+        if tag in VOID_TAGS:
+            return
+        # 找到最近的同名元素，顺带关闭中间未闭合的元素
+        for position in range(len(self._open) - 1, -1, -1):
+            if self._open[position].tag == tag:
+                break
+        else:
+            return
+        while len(self._open) > position:
+            self._close(self._open.pop())
+
+    def _close(self, node):
+        node.end = len(self.chunks)
+        node.last = len(self.nodes) - 1
+        if node.tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve -= 1
+        if node.tag in SKIP_TEXT_TAGS:
+            self._skip -= 1
+
+    def data(self, text):
+        if not text:
+            return
+        if self._skip:
+            if self.scripts and self._open and self._open[-1].tag == 'script':
+                self.scripts[-1].append(text)
+            return
+        if not self._preserve and text.isspace():
+            # 与BeautifulSoup一致：只含空白的文本折叠为一个换行或空格
+            text = '\n' if '\n' in text else ' '
+        self.chunks.append(text)
+
+    def finish(self, backend):
+        while self._open:
+            self._close(self._open.pop())
+        scripts = [''.join(parts) for parts in self.scripts]
+        return ParsedPage(self.nodes, self.chunks, scripts, backend)
+
+
+def _attrs_dict(attrs):
+    result = {}
+    for name, value in attrs:
+        name = name.lower()
+        if name not in result:
+            result[name] = '' if value is None else value
+    return result
+
+
+class _StreamParser(html.parser.HTMLParser):
+    def __init__(self, builder):
+        super().__init__(convert_charrefs=True)
+        self.builder = builder
+
+    def handle_starttag(self, tag, attrs):
+        self.builder.start(tag, _attrs_dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.builder.start(tag, _attrs_dict(attrs))
+        self.builder.end(tag)
+
+    def handle_endtag(self, tag):
+        self.builder.end(tag)
+
+    def handle_data(self, data):
+        self.builder.data(data)
+
+
+def _parse_stream(markup):
+    builder = PageBuilder()
+    parser = _StreamParser(builder)
+    parser.feed(markup)
+    parser.close()
+    return builder.finish('stream')
+
+
+class _LxmlTarget:
+    def __init__(self, builder):
+        self.builder = builder
+
+    def start(self, tag, attrib):
+        self.builder.start(tag, {name.lower(): value for name, value in attrib.items()})
+
+    def end(self, tag):
+        self.builder.end(tag)
+
+    def data(self, data):
+        self.builder.data(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return None
+
+
+def _parse_lxml(markup):
+    try:
+        from lxml import etree
+    except ImportError:
+        raise RuntimeError("lxml后端需要安装lxml: pip install lxml") from None
+    builder = PageBuilder()
+    parser = etree.HTMLParser(target=_LxmlTarget(builder))
+    parser.feed(markup)
+    parser.close()
+    return builder.finish('lxml')
+
+
+def _parse_bs4(markup):
+    from bs4 import BeautifulSoup, Comment, Declaration, Doctype, ProcessingInstruction, Tag
+
+    skipped = (Comment, Declaration, Doctype, ProcessingInstruction)
+    builder = PageBuilder()
+
+    def walk(element):
+        for child in element.children:
+            if isinstance(child, Tag):
+                attrs = {name.lower(): ' '.join(value) if isinstance(value, list) else value
+                         for name, value in child.attrs.items()}
+                builder.start(child.name, attrs)
+                walk(child)
+                builder.end(child.name)
+            elif not isinstance(child, skipped):
+                builder.data(str(child))
+
+    walk(BeautifulSoup(markup, 'html.parser'))
+    return builder.finish('html.parser')
+
+
+_PARSERS = {
+    'stream': _parse_stream,
+    'lxml': _parse_lxml,
+    'html.parser': _parse_bs4,
+}
+
+
+def set_default_backend(backend):
+    """修改进程内的默认解析后端"""
+    global DEFAULT_BACKEND
+    if backend not in _PARSERS:
+        raise ValueError(f"未知的解析后端: {backend}（可选: {', '.join(BACKENDS)}）")
+    DEFAULT_BACKEND = backend
+
+
+def parse_page(markup, backend=None):
+    """解析一个页面（str或bytes，bytes按utf-8解码）"""
+    if isinstance(markup, bytes):
+        markup = markup.decode('utf-8', errors='replace')
+    return _PARSERS[backend or DEFAULT_BACKEND](markup)
+
+
+# ---- 基准测试 ----
+
+# 与final_crawler.extract_story_from_html相同的选择器
+BENCH_TITLE_SELECTORS = ['h1', 'h2', '.title', '.story-title', '.content-title', '.article-title',
+                         '.post-title', '[class*="title"]', '[id*="title"]']
+BENCH_CONTENT_SELECTORS = ['.content', '.story-content', '.article-content', '.post-content', '.text',
+                           '.story-text', 'main', '.main-content', '#content', '[class*="content"]',
+                           '[class*="story"]', '[class*="article"]', '[class*="text"]']
+
+
+def _extract_legacy(markup):
+    """旧写法：BeautifulSoup建树后逐个select_one，再对原始HTML跑一遍正则"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(markup, 'html.parser')
+    for script in soup(['script', 'style']):
+        script.decompose()
+    title = None
+    for selector in BENCH_TITLE_SELECTORS:
+        element = soup.select_one(selector)
+        if element and len(element.get_text().strip()) > 2:
+            title = element.get_text().strip()
+            break
+    content = None
+    for selector in BENCH_CONTENT_SELECTORS:
+        element = soup.select_one(selector)
+        if element and len(element.get_text().strip()) > 50:
+            content = element.get_text().strip()
+            break
+    if not content:
+        content = '\n'.join(p.get_text().strip() for p in soup.find_all('p') if p.get_text().strip())
+    story_ids = re.findall(r'showStory\((\d+)\)', markup)
+    return title, content, story_ids
+
+
+def _extract_page(markup, backend):
+    """新写法：解析一次，在页面模型上完成同样的提取"""
+    page = parse_page(markup, backend)
+    title = first_text(page, BENCH_TITLE_SELECTORS, min_len=3)
+    content = first_text(page, BENCH_CONTENT_SELECTORS, min_len=51)
+    if not content:
+        content = '\n'.join(text for text in (page.text(p).strip() for p in page.find_all('p')) if text)
+    onclick = re.compile(r'showStory\((\d+)\)')
+    story_ids = [onclick.search(node.attrs['onclick']).group(1)
+                 for node in page.find_all(onclick=onclick)]
+    for script in page.scripts:
+        story_ids.extend(onclick.findall(script))
+    return title, content, story_ids
+
+
+def load_corpus(paths):
+    """读取语料：.html文件、含.html文件的目录或http_cache缓存目录"""
+    import zlib
+
+    pages = []
+    for path in paths:
+        if os.path.isdir(os.path.join(path, 'blobs')):
+            for root, _, files in os.walk(os.path.join(path, 'blobs')):
+                for name in sorted(files):
+                    with open(os.path.join(root, name), 'rb') as f:
+                        body = zlib.decompress(f.read())
+                    if b'<' in body[:1024]:
+                        pages.append(body.decode('utf-8', errors='replace'))
+        elif os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(('.html', '.htm')):
+                    with open(os.path.join(path, name), encoding='utf-8', errors='replace') as f:
+                        pages.append(f.read())
+        elif os.path.exists(path):
+            with open(path, encoding='utf-8', errors='replace') as f:
+                pages.append(f.read())
+    return pages
+
+
+def benchmark(pages, repeat=10, backends=BACKENDS):
+    """各方式的页面/秒与每页分配字节数（tracemalloc单独测量峰值，不计入计时）"""
+    total_bytes = sum(len(page.encode('utf-8')) for page in pages)
+    runners = [('legacy bs4', _extract_legacy)]
+    for backend in backends:
+        if backend == 'lxml':
+            try:
+                import lxml  # noqa: F401
+            except ImportError:
+                print("⚠️ 未安装lxml，跳过lxml后端")
+                continue
+        runners.append((backend, functools.partial(_extract_page, backend=backend)))
+
+    baseline = _extract_legacy(pages[0])
+    results = {}
+    for name, run in runners:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for page in pages:
+                run(page)
+        elapsed = time.perf_counter() - started
+
+        # 每页处理期间新分配内存的峰值
+        tracemalloc.start()
+        peaks = []
+        for page in pages:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            run(page)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+
+        count = len(pages) * repeat
+        same = run(pages[0])[:2] == baseline[:2]
+        results[name] = {
+            'pages_per_sec': count / elapsed,
+            'mb_per_sec': total_bytes * repeat / elapsed / 1024 / 1024,
+            'bytes_per_page': sum(peaks) / len(peaks),
+            'peak_bytes': max(peaks),
+            'same_as_legacy': same,
+        }
+    return results, total_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTML解析后端基准测试')
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser.add_argument('--corpus', nargs='*',
+                        default=[os.path.join(here, 'http_cache'), here],
+                        help='语料：.html文件、目录或http_cache目录 (默认: 缓存目录与本目录下的.html)')
+    parser.add_argument('--repeat', type=int, default=10, help='每个页面重复解析次数 (默认: 10)')
+    parser.add_argument('--backends', default=','.join(BACKENDS), help=f'后端列表 (默认: {",".join(BACKENDS)})')
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        print("❌ 没有找到页面，请用 --corpus 指定")
+        return
+    results, total_bytes = benchmark(pages, args.repeat, [name for name in args.backends.split(',') if name])
+    print(f"📄 语料: {len(pages)} 个页面, {total_bytes / 1024:.1f} KB, 每页重复 {args.repeat} 次")
+    print(f"{'方式':<14}{'页面/秒':>10}{'MB/秒':>9}{'平均分配(KB)':>14}{'最大分配(KB)':>14}  与旧实现一致")
+    for name, result in results.items():
+        print(f"{name:<14}{result['pages_per_sec']:>10.1f}{result['mb_per_sec']:>9.2f}"
+              f"{result['bytes_per_page'] / 1024:>14.1f}{result['peak_bytes'] / 1024:>14.1f}  "
+              f"{'是' if result['same_as_legacy'] else '否'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,20 @@
 # -*- coding: utf-8 -*-
 """
 基于requests的大规模爬虫 - 专门爬取 storynook.cn 的所有故事
-避免ChromeDriver版本问题，使用HTTP请求直接获取数据
+避免ChromeDriver版本问题，使用HTTP请求直接获取数据（经由共享异步抓取引擎）
 """
 
-import time
 import json
 import re
 import sqlite3
+import threading
 from datetime import datetime
-import requests
-from bs4 import BeautifulSoup
 import logging
-from urllib.parse import urljoin, urlparse
-import random
+from urllib.parse import urljoin
+
+from crawl_engine import CrawlEngine, CrawlRequest
+from http_cache import DEFAULT_CACHE_DIR, HttpCache
+from page_parser import parse_page
 
 # 配置日志
 logging.basicConfig(
@@ -28,9 +29,13 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class RequestsMassCrawler:
-    def __init__(self):
+    def __init__(self, concurrency=4, rate=1.0, cache_dir=DEFAULT_CACHE_DIR, offline=False):
         self.base_url = "https://storynook.cn/"
-        self.session = requests.Session()
+        # 共享抓取引擎：连接池、限速（取代每页之间的随机休眠）、重试与磁盘缓存（offline时只回放缓存）
+        cache = HttpCache(cache_dir, offline=offline) if cache_dir else None
+        self.engine = CrawlEngine(concurrency=concurrency, per_host=concurrency, rate=rate, timeout=15, cache=cache)
+        # 处理器在引擎的线程池中执行，合并结果时加锁
+        self.lock = threading.Lock()
         self.all_stories = {}  # 使用字典去重
         self.story_contents = {}
         self.crawl_stats = {
@@ -41,41 +46,37 @@ class RequestsMassCrawler:
             "errors": 0
         }
         
-        # 设置请求头，模拟真实浏览器
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        })
-        
-    def get_page_content(self, url, max_retries=3):
-        """获取页面内容"""
-        for attempt in range(max_retries):
-            try:
-                response = self.session.get(url, timeout=15)
-                response.raise_for_status()
-                response.encoding = 'utf-8'
-                return response.text
-            except Exception as e:
-                logger.warning(f"获取页面失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(random.uniform(1, 3))
-                else:
-                    self.crawl_stats["errors"] += 1
-                    return None
+    def get_page_content(self, url):
+        """获取页面内容（重试由引擎处理）"""
+        return self.page_text(self.engine.fetch_one(url))
+    
+    def page_text(self, result):
+        """成功的抓取结果按utf-8解码，失败时记录错误并返回None"""
+        if result.error is None and result.status < 400:
+            return result.text('utf-8')
+        logger.warning(f"获取页面失败 ({result.attempts} 次尝试): {result.url} - {result.error or result.status}")
+        with self.lock:
+            self.crawl_stats["errors"] += 1
         return None
     
+    def handle_listing_page(self, result):
+        """引擎处理器：从列表页提取故事，返回新故事数"""
+        html_content = self.page_text(result)
+        if not html_content:
+            return None
+        with self.lock:
+            new_stories = self.extract_stories_from_html(html_content)
+            self.crawl_stats["pages_crawled"] += 1
+        return new_stories
+    
     def extract_stories_from_html(self, html_content):
-        """从HTML内容中提取故事信息"""
+        """从HTML内容中提取故事信息（页面只解析一次）"""
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
+            page = parse_page(html_content)
             new_stories_count = 0
             
             # 方法1: 查找包含showStory的onclick属性
-            elements_with_onclick = soup.find_all(attrs={"onclick": re.compile(r'showStory\(\d+\)')})
+            elements_with_onclick = page.find_all(onclick=re.compile(r'showStory\(\d+\)'))
             
             for element in elements_with_onclick:
                 try:
@@ -83,7 +84,7 @@ class RequestsMassCrawler:
                     story_id_match = re.search(r'showStory\((\d+)\)', onclick)
                     if story_id_match:
                         story_id = int(story_id_match.group(1))
-                        title = element.get_text(strip=True)
+                        title = page.text(element, strip=True)
                         
                         if story_id not in self.all_stories and title:
                             self.all_stories[story_id] = {
@@ -97,9 +98,9 @@ class RequestsMassCrawler:
                 except Exception as e:
                     continue
             
-            # 方法2: 直接从HTML源码中正则提取
-            onclick_pattern = r'onclick=["\']showStory\((\d+)\)["\'][^>]*>([^<]+)'
-            matches = re.findall(onclick_pattern, html_content)
+            # 方法2: 脚本中拼接的HTML模板（页面上的元素已由方法1处理）
+            onclick_pattern = re.compile(r'onclick=["\']showStory\((\d+)\)["\'][^>]*>([^<]+)')
+            matches = [match for script in page.scripts for match in onclick_pattern.findall(script)]
             
             for story_id, title in matches:
                 try:
@@ -118,11 +119,11 @@ class RequestsMassCrawler:
                     continue
             
             # 方法3: 查找可能的故事链接
-            story_links = soup.find_all('a', href=re.compile(r'story|tale'))
+            story_links = page.find_all('a', href=re.compile(r'story|tale'))
             for link in story_links:
                 try:
                     href = link.get('href', '')
-                    title = link.get_text(strip=True)
+                    title = page.text(link, strip=True)
                     
                     # 尝试从href中提取ID
                     id_match = re.search(r'(\d+)', href)
@@ -147,60 +148,81 @@ class RequestsMassCrawler:
             logger.error(f"HTML解析失败: {e}")
             return 0
     
-    def try_get_story_content_api(self, story_id):
-        """尝试通过API获取故事内容"""
-        api_urls = [
+    def story_content_urls(self, story_id):
+        """可能返回故事内容的地址，按顺序尝试"""
+        return [
             f"{self.base_url}api/story/{story_id}",
             f"{self.base_url}story/{story_id}",
             f"{self.base_url}get_story.php?id={story_id}",
             f"{self.base_url}story.php?id={story_id}",
         ]
+    
+    def story_content_request(self, story_id, index=0):
+        urls = self.story_content_urls(story_id)
+        if index >= len(urls):
+            return None
+        return CrawlRequest(urls[index], key=story_id, meta={'index': index}, handler=self.handle_story_content)
+    
+    def extract_story_content(self, result):
+        """从接口或页面响应中提取故事内容"""
+        if not result.ok:
+            return None
+        text = result.text('utf-8')
         
-        for api_url in api_urls:
-            try:
-                response = self.session.get(api_url, timeout=10)
-                if response.status_code == 200:
-                    # 尝试JSON解析
-                    try:
-                        data = response.json()
-                        if isinstance(data, dict) and 'content' in data:
-                            return data['content']
-                        elif isinstance(data, dict) and 'story' in data:
-                            return data['story']
-                    except:
-                        pass
-                    
-                    # 尝试HTML解析
-                    if len(response.text) > 100:
-                        soup = BeautifulSoup(response.text, 'html.parser')
-                        
-                        # 查找可能的内容容器
-                        content_selectors = [
-                            '.story-content',
-                            '.content',
-                            '#content',
-                            '.story-text',
-                            '.text',
-                            'p'
-                        ]
-                        
-                        for selector in content_selectors:
-                            elements = soup.select(selector)
-                            if elements:
-                                content = ' '.join([elem.get_text(strip=True) for elem in elements])
-                                if len(content) > 50:
-                                    return content
-                        
-                        # 如果没有找到特定容器，尝试获取所有文本
-                        all_text = soup.get_text(strip=True)
-                        if len(all_text) > 100:
-                            return all_text
-                            
-            except Exception as e:
-                continue
+        # 尝试JSON解析
+        try:
+            data = json.loads(text)
+            if isinstance(data, dict) and 'content' in data:
+                return data['content']
+            elif isinstance(data, dict) and 'story' in data:
+                return data['story']
+        except ValueError:
+            pass
+        
+        # 尝试HTML解析
+        if len(text) > 100:
+            page = parse_page(text)
+            
+            # 查找可能的内容容器
+            content_selectors = [
+                '.story-content',
+                '.content',
+                '#content',
+                '.story-text',
+                '.text',
+                'p'
+            ]
+            
+            for selector in content_selectors:
+                elements = page.select(selector)
+                if elements:
+                    content = ' '.join([page.text(elem, strip=True) for elem in elements])
+                    if len(content) > 50:
+                        return content
+            
+            # 如果没有找到特定容器，尝试获取所有文本
+            all_text = page.text(strip=True)
+            if len(all_text) > 100:
+                return all_text
         
         return None
     
+    def handle_story_content(self, result):
+        """引擎处理器：取到内容返回(故事id, 内容)，否则继续尝试下一个地址"""
+        try:
+            content = self.extract_story_content(result)
+        except Exception as e:
+            logger.debug(f"解析 {result.url} 失败: {e}")
+            content = None
+        if content:
+            return (result.key, content)
+        return self.story_content_request(result.key, result.meta['index'] + 1)
+    
+    def try_get_story_content_api(self, story_id):
+        """尝试通过API获取故事内容"""
+        found = self.engine.crawl([self.story_content_request(story_id)])
+        return found[0][1] if found else None
+    
     def crawl_main_page_variations(self):
         """爬取主页的各种变体"""
         urls_to_try = [
@@ -213,26 +235,8 @@ class RequestsMassCrawler:
             f"{self.base_url}list.html",
         ]
         
-        total_new_stories = 0
-        
-        for url in urls_to_try:
-            try:
-                logger.info(f"正在爬取: {url}")
-                html_content = self.get_page_content(url)
-                
-                if html_content:
-                    new_stories = self.extract_stories_from_html(html_content)
-                    total_new_stories += new_stories
-                    self.crawl_stats["pages_crawled"] += 1
-                    
-                    # 随机延迟，避免被封
-                    time.sleep(random.uniform(1, 3))
-                
-            except Exception as e:
-                logger.error(f"爬取 {url} 失败: {e}")
-                continue
-        
-        return total_new_stories
+        logger.info(f"正在爬取 {len(urls_to_try)} 个主页变体...")
+        return sum(self.engine.crawl(urls_to_try, self.handle_listing_page))
     
     def try_pagination_discovery(self):
         """尝试发现分页"""
@@ -241,7 +245,7 @@ class RequestsMassCrawler:
             if not html_content:
                 return []
             
-            soup = BeautifulSoup(html_content, 'html.parser')
+            page = parse_page(html_content)
             pagination_urls = []
             
             # 查找分页链接
@@ -252,7 +256,7 @@ class RequestsMassCrawler:
                 r'/page/(\d+)',
             ]
             
-            all_links = soup.find_all('a', href=True)
+            all_links = page.find_all('a', href=True)
             for link in all_links:
                 href = link.get('href', '')
                 for pattern in pagination_patterns:
@@ -290,36 +294,10 @@ class RequestsMassCrawler:
             return []
     
     def crawl_pagination_pages(self, pagination_urls):
-        """爬取分页页面"""
-        total_new_stories = 0
-        
-        for i, url in enumerate(pagination_urls):
-            try:
-                logger.info(f"正在爬取分页 {i+1}/{len(pagination_urls)}: {url}")
-                html_content = self.get_page_content(url)
-                
-                if html_content:
-                    new_stories = self.extract_stories_from_html(html_content)
-                    total_new_stories += new_stories
-                    self.crawl_stats["pages_crawled"] += 1
-                    
-                    # 如果连续几页都没有新故事，可能已经到底了
-                    if new_stories == 0 and i > 5:
-                        consecutive_empty = 0
-                        for j in range(max(0, i-3), i):
-                            if j < len(pagination_urls):
-                                consecutive_empty += 1
-                        if consecutive_empty >= 3:
-                            logger.info("连续多页无新故事，停止分页爬取")
-                            break
-                    
-                    # 随机延迟
-                    time.sleep(random.uniform(2, 5))
-                
-            except Exception as e:
-                logger.error(f"爬取分页 {url} 失败: {e}")
-                continue
-        
+        """爬取分页页面（并发抓取，限速由引擎控制）"""
+        logger.info(f"正在爬取 {len(pagination_urls)} 个分页...")
+        total_new_stories = sum(self.engine.crawl(pagination_urls, self.handle_listing_page))
+        logger.info(f"引擎统计: {self.engine.summary()}")
         return total_new_stories
     
     def get_stories_content_batch(self, max_stories=100):
@@ -328,36 +306,24 @@ class RequestsMassCrawler:
             story_ids = list(self.all_stories.keys())[:max_stories]
             logger.info(f"开始获取 {len(story_ids)} 个故事的内容...")
             
+            requests = [self.story_content_request(story_id) for story_id in story_ids]
             success_count = 0
             
-            for i, story_id in enumerate(story_ids):
-                try:
-                    content = self.try_get_story_content_api(story_id)
-                    
-                    if content and len(content) > 50:
-                        self.story_contents[story_id] = {
-                            "id": story_id,
-                            "content": content,
-                            "length": len(content),
-                            "extracted_at": datetime.now().isoformat()
-                        }
-                        
-                        # 更新故事信息
-                        if story_id in self.all_stories:
-                            self.all_stories[story_id]["content_length"] = len(content)
-                            self.all_stories[story_id]["has_content"] = True
-                        
-                        success_count += 1
-                    
-                    if (i + 1) % 10 == 0:
-                        logger.info(f"已处理 {i + 1}/{len(story_ids)} 个故事，成功: {success_count}")
+            for story_id, content in self.engine.crawl(requests):
+                if len(content) > 50:
+                    self.story_contents[story_id] = {
+                        "id": story_id,
+                        "content": content,
+                        "length": len(content),
+                        "extracted_at": datetime.now().isoformat()
+                    }
                     
-                    # 随机延迟
-                    time.sleep(random.uniform(0.5, 2))
+                    # 更新故事信息
+                    if story_id in self.all_stories:
+                        self.all_stories[story_id]["content_length"] = len(content)
+                        self.all_stories[story_id]["has_content"] = True
                     
-                except Exception as e:
-                    logger.warning(f"获取故事 {story_id} 内容失败: {e}")
-                    continue
+                    success_count += 1
             
             logger.info(f"内容获取完成，成功获取 {success_count} 个故事内容")
             self.crawl_stats["stories_with_content"] = success_count
@@ -4,18 +4,18 @@
 智能故事爬虫 - 让requests自动处理压缩
 """
 
-import requests
 import sqlite3
 import json
 import time
-import random
 import logging
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from bs4 import BeautifulSoup
 import re
 import os
 
+from crawl_engine import CrawlEngine, CrawlRequest, DEFAULT_HEADERS
+from http_cache import DEFAULT_CACHE_DIR, HttpCache
+from page_parser import first_text, parse_page
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -28,23 +28,17 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class SmartStoryCrawler:
-    def __init__(self, base_url="https://storynook.cn", max_stories=100):
+    def __init__(self, base_url="https://storynook.cn", max_stories=100, rate=2.0,
+                 cache_dir=DEFAULT_CACHE_DIR, offline=False):
         self.base_url = base_url
         self.max_stories = max_stories
         self.db_path = "smart_stories.db"
         self.json_path = "smart_stories.json"
         
-        # 创建session，让requests自动处理压缩
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Cache-Control': 'max-age=0'
-        })
+        # 共享抓取引擎，自动处理压缩；HTTP缓存做条件请求，offline时只回放缓存
+        cache = HttpCache(cache_dir, offline=offline) if cache_dir else None
+        self.engine = CrawlEngine(headers=dict(DEFAULT_HEADERS, **{'Cache-Control': 'max-age=0'}),
+                                  rate=rate, timeout=30, cache=cache)
         
         # 统计信息
         self.stats = {
@@ -98,27 +92,30 @@ class SmartStoryCrawler:
     def fetch_story(self, story_id):
         """获取单个故事内容"""
         url = f"{self.base_url}/?id={story_id}"
+        return self.parse_story_page(self.engine.fetch_one(CrawlRequest(url, key=story_id)))
+    
+    def parse_story_page(self, result):
+        """解析故事页面的抓取结果"""
+        story_id = result.key
         
         try:
-            # 随机延迟
-            time.sleep(random.uniform(0.5, 2.0))
-            
-            # 让requests自动处理解压
-            response = self.session.get(url, timeout=30)
+            if result.error is not None:
+                logger.error(f"故事 {story_id}: 请求失败 - {result.error}")
+                return None
             
             # 检查响应状态
-            if response.status_code != 200:
-                logger.warning(f"故事 {story_id}: HTTP {response.status_code}")
+            if result.status != 200:
+                logger.warning(f"故事 {story_id}: HTTP {result.status}")
                 return None
             
             # 检查内容类型
-            content_type = response.headers.get('content-type', '').lower()
+            content_type = result.content_type
             if 'text/html' not in content_type:
                 logger.warning(f"故事 {story_id}: 非HTML内容 - {content_type}")
                 return None
             
             # 获取解压后的文本内容
-            html_content = response.text
+            html_content = result.text()
             
             # 检查内容长度
             if len(html_content) < 100:
@@ -132,11 +129,11 @@ class SmartStoryCrawler:
                     f.write(html_content)
                 logger.info(f"调试文件已保存: {debug_file}")
             
-            # 解析HTML
-            soup = BeautifulSoup(html_content, 'html.parser')
+            # 解析HTML（只解析一次）
+            page = parse_page(html_content)
             
             # 提取故事数据
-            story_data = self.extract_story_data(soup, story_id)
+            story_data = self.extract_story_data(page, story_id)
             
             if story_data:
                 logger.info(f"✅ 故事 {story_id}: {story_data['title'][:30]}...")
@@ -145,68 +142,44 @@ class SmartStoryCrawler:
                 logger.warning(f"❌ 故事 {story_id}: 无法提取内容")
                 return None
                 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"故事 {story_id}: 请求失败 - {e}")
-            return None
         except Exception as e:
             logger.error(f"故事 {story_id}: 处理失败 - {e}")
             return None
     
-    def extract_story_data(self, soup, story_id):
-        """从HTML中提取故事数据"""
+    def extract_story_data(self, page, story_id):
+        """从解析后的页面（page_parser.ParsedPage）中提取故事数据"""
         try:
-            # 移除script和style标签
-            for script in soup(["script", "style", "nav", "header", "footer"]):
-                script.decompose()
+            # 移除导航、页眉页脚（script和style不计入文本）
+            page.decompose(["nav", "header", "footer"])
             
             # 尝试多种标题提取方法
-            title = None
-            
             # 方法1: 常见标题标签
             title_selectors = ['h1', 'h2', '.title', '.story-title', 'title']
-            for selector in title_selectors:
-                elements = soup.select(selector)
-                for element in elements:
-                    text = element.get_text(strip=True)
-                    if text and 5 <= len(text) <= 100:
-                        title = text
-                        break
-                if title:
-                    break
+            title = first_text(page, title_selectors, strip=True, min_len=5, max_len=100)
             
             # 方法2: 从页面标题提取
             if not title:
-                page_title = soup.find('title')
-                if page_title:
-                    title_text = page_title.get_text(strip=True)
+                title_text = page.title
+                if title_text is not None:
                     # 移除网站名称
                     title = title_text.split(' - ')[0].split(' | ')[0]
             
             # 尝试多种内容提取方法
-            content = None
-            
             # 方法1: 常见内容容器
             content_selectors = [
                 '.content', '.story-content', '.post-content', '.entry-content',
                 'article', '.article', 'main', '.main'
             ]
             
-            for selector in content_selectors:
-                elements = soup.select(selector)
-                for element in elements:
-                    text = element.get_text(strip=True)
-                    if text and len(text) > 200:  # 内容应该足够长
-                        content = text
-                        break
-                if content:
-                    break
+            # 内容应该足够长
+            content = first_text(page, content_selectors, strip=True, min_len=201)
             
             # 方法2: 查找最长的文本块
             if not content:
-                all_elements = soup.find_all(['p', 'div', 'span'])
+                all_elements = page.find_all(['p', 'div', 'span'])
                 longest_text = ""
                 for element in all_elements:
-                    text = element.get_text(strip=True)
+                    text = page.text(element, strip=True)
                     if len(text) > len(longest_text):
                         longest_text = text
                 
@@ -215,7 +188,7 @@ class SmartStoryCrawler:
             
             # 方法3: 获取所有可见文本
             if not content:
-                all_text = soup.get_text()
+                all_text = page.text()
                 lines = [line.strip() for line in all_text.splitlines() if line.strip()]
                 # 过滤掉导航、菜单等短行
                 content_lines = [line for line in lines if len(line) > 20]
@@ -229,7 +202,7 @@ class SmartStoryCrawler:
             if not content or len(content) < 100:
                 logger.warning(f"故事 {story_id}: 内容提取失败或太短")
                 # 输出调试信息
-                logger.debug(f"故事 {story_id}: HTML长度 = {len(soup.get_text())}")
+                logger.debug(f"故事 {story_id}: HTML长度 = {len(page.text())}")
                 logger.debug(f"故事 {story_id}: 提取的内容长度 = {len(content) if content else 0}")
                 return None
             
@@ -318,22 +291,21 @@ class SmartStoryCrawler:
         except Exception as e:
             logger.error(f"保存数据库失败: {e}")
     
-    def process_story(self, story_id):
-        """处理单个故事"""
+    def process_story(self, result):
+        """引擎处理器：解析并保存单个故事"""
         with self.lock:
             self.stats['total_processed'] += 1
         
-        story_data = self.fetch_story(story_id)
+        story_data = self.parse_story_page(result)
         
         if story_data:
             self.save_to_database(story_data)
-            with self.lock:
-                self.stats['successful'] += 1
-            return story_data
-        else:
-            with self.lock:
-                self.stats['failed'] += 1
-            return None
+        with self.lock:
+            self.stats['successful' if story_data else 'failed'] += 1
+            # 每10个故事显示一次进度
+            if self.stats['total_processed'] % 10 == 0:
+                self.print_progress()
+        return story_data
     
     def crawl_stories(self, start_id=1, end_id=None, max_workers=4):
         """爬取故事"""
@@ -341,34 +313,12 @@ class SmartStoryCrawler:
             end_id = self.max_stories
         
         logger.info(f"开始爬取故事 {start_id} 到 {end_id}")
-        logger.info(f"使用 {max_workers} 个线程")
+        logger.info(f"并发请求数: {max_workers}, 限速: {self.engine.rate} 次/秒")
         
-        story_ids = list(range(start_id, end_id + 1))
-        stories = []
-        
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交任务
-            future_to_id = {
-                executor.submit(self.process_story, story_id): story_id 
-                for story_id in story_ids
-            }
-            
-            # 处理结果
-            for future in as_completed(future_to_id):
-                story_id = future_to_id[future]
-                try:
-                    result = future.result()
-                    if result:
-                        stories.append(result)
-                    
-                    # 每10个故事显示一次进度
-                    if self.stats['total_processed'] % 10 == 0:
-                        self.print_progress()
-                        
-                except Exception as e:
-                    logger.error(f"处理故事 {story_id} 时出错: {e}")
-                    with self.lock:
-                        self.stats['failed'] += 1
+        self.engine.concurrency = self.engine.per_host = max_workers
+        requests = (CrawlRequest(f"{self.base_url}/?id={story_id}", key=story_id)
+                    for story_id in range(start_id, end_id + 1))
+        stories = self.engine.crawl(requests, self.process_story)
         
         # 保存到JSON
         self.save_to_json(stories)
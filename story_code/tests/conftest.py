@@ -0,0 +1,11 @@
+"""测试时把 code/ 和 website/ 下的模块加入导入路径（两者都是平铺的脚本目录）"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for directory in ('code', 'website'):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
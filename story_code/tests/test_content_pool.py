@@ -0,0 +1,53 @@
+"""正文数据库连接池"""
+
+import sqlite3
+import threading
+
+from server import ContentDatabasePool
+
+
+def _make_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS story_contents (id INTEGER PRIMARY KEY, content TEXT)')
+    conn.executemany('INSERT OR REPLACE INTO story_contents VALUES (?, ?)', rows)
+    conn.commit()
+    return conn
+
+
+def test_pool_is_bounded_and_shared_across_threads(tmp_path):
+    writer = _make_db(str(tmp_path / 'a.db'), [(1, '从前有座山')])
+    pool = ContentDatabasePool(['a.db'], str(tmp_path), pool_size=2)
+    opened = []
+    errors = []
+    connect = pool._connect
+    pool._connect = lambda path: opened.append(path) or connect(path)
+
+    def read():
+        try:
+            for _ in range(20):
+                assert pool.get_content(1) == '从前有座山'
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert 1 <= len(opened) <= 2
+    writer.close()
+
+
+def test_default_connections_see_committed_writes(tmp_path):
+    writer = _make_db(str(tmp_path / 'a.db'), [(1, '旧内容')])
+    pool = ContentDatabasePool(['a.db'], str(tmp_path), check_interval=0)
+    assert not pool.immutable
+    assert pool.get_content(1) == '旧内容'
+    # 爬虫仍在以WAL写入：已提交的修改要对池中已有的连接可见
+    writer.execute("UPDATE story_contents SET content = '新内容' WHERE id = 1")
+    writer.execute("INSERT INTO story_contents VALUES (2, '第二个故事')")
+    writer.commit()
+    assert pool.get_contents([1, 2]) == {1: '新内容', 2: '第二个故事'}
+    writer.close()
@@ -0,0 +1,51 @@
+"""id空间探索的上界探测"""
+
+import pytest
+
+from crawl_discovery import IdSpaceExplorer
+from crawl_frontier import CrawlFrontier
+
+
+def _explorer(tmp_path, live_ids, **options):
+    frontier = CrawlFrontier(str(tmp_path / 'frontier.db'))
+    crawled = []
+
+    def crawl_ids(story_ids):
+        for story_id in story_ids:
+            crawled.append(story_id)
+            if story_id in live_ids:
+                frontier.mark_done(story_id)
+            else:
+                frontier.mark_empty(story_id)
+
+    return IdSpaceExplorer(frontier, crawl_ids, window=8, **options), crawled
+
+
+@pytest.mark.parametrize('live_ids, expected', [
+    (set(range(1, 6)), 5),
+    ({1}, 1),
+    ({7}, 7),
+    (set(range(1, 301)), 300),
+    (set(range(1, 101)) | set(range(300, 701)), 700),
+    (set(), 0),
+])
+def test_find_upper_bound(tmp_path, live_ids, expected):
+    explorer, _ = _explorer(tmp_path, live_ids, max_id_limit=100000)
+    assert explorer.find_upper_bound(0) == expected
+
+
+def test_find_upper_bound_from_known_max(tmp_path):
+    live_ids = set(range(1, 51)) | {52, 53}
+    explorer, crawled = _explorer(tmp_path, live_ids, max_id_limit=100000)
+    explorer.crawl_ids(range(1, 51))
+    del crawled[:]
+    assert explorer.find_upper_bound(50) == 53
+    assert min(crawled) == 51
+
+
+def test_run_sweeps_below_upper_bound(tmp_path):
+    live_ids = set(range(1, 40)) | set(range(150, 600))
+    explorer, _ = _explorer(tmp_path, live_ids, block_size=20, max_id_limit=100000)
+    report = explorer.run()
+    assert report['upper_bound'] == 599
+    assert explorer.frontier.count(1, 599) == len(live_ids)
@@ -0,0 +1,46 @@
+"""抓取边界的续传与重试安排"""
+
+import time
+
+from crawl_engine import CrawlRequest, FetchResult
+from crawl_frontier import CrawlFrontier, DONE, EMPTY, FAILED, PENDING, RETRY_AFTER
+
+
+def _result(story_id, status=200, headers=None, error=None):
+    return FetchResult(CrawlRequest(f'http://example.com/?id={story_id}', key=story_id),
+                       status=status, headers=headers, error=error)
+
+
+def test_resume_only_returns_unfinished_ids(tmp_path):
+    path = str(tmp_path / 'frontier.db')
+    frontier = CrawlFrontier(path)
+    assert frontier.add_range(1, 10) == 10
+    frontier.record(_result(1), True)
+    frontier.record(_result(2), False)
+    frontier.record(_result(3, status=404), False)
+    frontier.close()
+
+    # 中断后重新打开：已完成/空页不再抓取，重复加入区间不会重置状态
+    resumed = CrawlFrontier(path)
+    assert resumed.add_range(1, 12) == 2
+    assert resumed.due() == [4, 5, 6, 7, 8, 9, 10, 11, 12]
+    counts = resumed.counts()
+    assert counts[DONE] == 1 and counts[EMPTY] == 2 and counts[PENDING] == 9
+    resumed.close()
+
+
+def test_failures_back_off_and_give_up(tmp_path):
+    frontier = CrawlFrontier(str(tmp_path / 'frontier.db'), max_attempts=2, retry_base=60.0)
+    frontier.add_ids([1, 2])
+    frontier.record(_result(1, status=None, error=OSError('reset')), False)
+    frontier.record(_result(2, status=503, headers={'Retry-After': '30'}), False)
+    now = time.time()
+    assert frontier.due(now=now) == []
+    assert frontier.due(now=now + 31) == [2]
+    assert frontier.due(now=now + 61) == [1, 2]
+    assert frontier.counts()[FAILED] == 1 and frontier.counts()[RETRY_AFTER] == 1
+
+    frontier.record(_result(1, status=500), False)
+    # 超过max_attempts后不再重试
+    assert frontier.due(now=now + 10 ** 6) == [2]
+    frontier.close()
@@ -0,0 +1,136 @@
+"""StoryWriter提交回调与抓取边界恢复"""
+
+import sqlite3
+import threading
+
+import pytest
+
+from crawl_engine import CrawlRequest, FetchResult
+from crawl_frontier import CrawlFrontier, DONE
+from crawl_writer import StoryWriter, _create_schema
+
+
+def _story(story_id, category='童话故事'):
+    return {'story_id': story_id, 'title': f'故事{story_id}', 'content': '内容' * 20,
+            'category': category, 'url': f'http://example.com/?id={story_id}', 'word_count': 40}
+
+
+def _result(story_id):
+    return FetchResult(CrawlRequest(f'http://example.com/?id={story_id}', key=story_id), status=200)
+
+
+def _record_on_commit(frontier, story_id):
+    return lambda: frontier.record(_result(story_id), True)
+
+
+def test_frontier_marked_only_after_commit(tmp_path):
+    db_path = str(tmp_path / 'stories.db')
+    _create_schema(db_path)
+    frontier = CrawlFrontier(str(tmp_path / 'frontier.db'))
+    frontier.add_ids([1, 2, 3])
+    writer = StoryWriter(db_path, flush_interval=0.05)
+
+    # 让写入线程停在提交之前
+    release = threading.Event()
+    write_batch = writer._write_batch
+
+    def blocked_write(conn, stories):
+        release.wait(10)
+        write_batch(conn, stories)
+
+    writer._write_batch = blocked_write
+    for story_id in (1, 2):
+        writer.put(_story(story_id), _record_on_commit(frontier, story_id))
+
+    # 还在队列/事务中的故事不算完成，此时中断后恢复会重新抓取
+    assert frontier.due() == [1, 2, 3]
+
+    release.set()
+    writer.flush()
+    assert frontier.due() == [3]
+    assert frontier.counts()[DONE] == 2
+    writer.close()
+    frontier.close()
+
+
+def test_failed_write_keeps_id_pending_across_restart(tmp_path):
+    db_path = str(tmp_path / 'stories.db')
+    # 没有建表：写入必然失败
+    sqlite3.connect(db_path).close()
+    frontier_path = str(tmp_path / 'frontier.db')
+    frontier = CrawlFrontier(frontier_path)
+    frontier.add_ids([7])
+    writer = StoryWriter(db_path, categories_table=None, flush_interval=0.05)
+    writer.put(_story(7), _record_on_commit(frontier, 7))
+    writer.close()
+    assert writer.stats()['errors'] == 1
+    frontier.close()
+
+    resumed = CrawlFrontier(frontier_path)
+    assert resumed.due() == [7]
+    resumed.close()
+
+
+def test_close_commits_queued_rows_and_category_counts(tmp_path):
+    db_path = str(tmp_path / 'stories.db')
+    _create_schema(db_path)
+    committed = []
+    writer = StoryWriter(db_path, batch_size=2, flush_interval=0.05)
+    for story_id in range(1, 6):
+        writer.put(_story(story_id, '寓言故事' if story_id % 2 else '童话故事'),
+                   lambda story_id=story_id: committed.append(story_id))
+    # 同一id换分类：计数要先减后加
+    writer.put(_story(1, '童话故事'), lambda: committed.append(1))
+    writer.close()
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT COUNT(*) FROM stories').fetchone()[0] == 5
+    assert dict(conn.execute('SELECT name, story_count FROM categories')) == {'寓言故事': 2, '童话故事': 3}
+    conn.close()
+    assert sorted(committed) == [1, 1, 2, 3, 4, 5]
+
+
+def test_malformed_story_does_not_kill_writer(tmp_path):
+    db_path = str(tmp_path / 'stories.db')
+    _create_schema(db_path)
+    writer = StoryWriter(db_path, flush_interval=0.05)
+
+    # 缺少唯一键（KeyError）和类型不对（TypeError）的记录只计入errors
+    writer.put({'title': '没有编号'})
+    writer.put(None)
+    writer.put(_story(1))
+    writer.flush()
+    assert writer._thread.is_alive()
+    assert writer.errors == 2 and writer.written == 1
+
+    writer.put(_story(2))
+    writer.close()
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM stories").fetchone()[0] == 2
+    conn.close()
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_dead_writer_thread_is_restarted(tmp_path):
+    db_path = str(tmp_path / 'stories.db')
+    _create_schema(db_path)
+    writer = StoryWriter(db_path, flush_interval=0.05)
+    write = writer._write
+
+    def crash(conn, items):
+        raise SystemExit
+
+    writer._write = crash
+    writer.put(_story(1))
+    writer._thread.join(5)
+    assert not writer._thread.is_alive()
+
+    # 下一次put()重启写入线程，flush()不会一直等待
+    writer._write = write
+    writer.put(_story(2))
+    writer.flush()
+    assert writer.written == 1
+    writer.close()
+    conn = sqlite3.connect(db_path)
+    assert [row[0] for row in conn.execute("SELECT story_id FROM stories")] == [2]
+    conn.close()
@@ -0,0 +1,44 @@
+"""故事页处理：保存失败时不能把有故事的页面记为空页"""
+
+import threading
+
+from crawl_engine import CrawlRequest, FetchResult
+from crawl_frontier import CrawlFrontier, DONE, EMPTY
+
+
+class _BrokenWriter:
+    def put(self, story, on_commit=None):
+        raise RuntimeError('写入线程不可用')
+
+
+def _crawler(monkeypatch, tmp_path, frontier):
+    # final_crawler在导入时于当前目录创建日志文件
+    monkeypatch.chdir(tmp_path)
+    from final_crawler import FinalStoryCrawler
+
+    crawler = FinalStoryCrawler.__new__(FinalStoryCrawler)
+    crawler.offline = False
+    crawler.frontier = frontier
+    crawler.writer = _BrokenWriter()
+    crawler.stats_lock = threading.Lock()
+    crawler.stats = {'total_attempted': 0, 'successful_downloads': 0, 'failed_downloads': 0,
+                     'empty_stories': 0, 'categories_found': set()}
+    crawler.story_data = {}
+    crawler.extract_story_from_html = lambda html, story_id, url: {
+        'story_id': story_id, 'title': '小红帽', 'content': '从前有个小姑娘', 'category': '童话故事',
+        'url': url, 'word_count': 7}
+    return crawler
+
+
+def test_writer_failure_is_retried_not_marked_empty(monkeypatch, tmp_path):
+    frontier = CrawlFrontier(str(tmp_path / 'frontier.db'))
+    frontier.add_ids([5])
+    crawler = _crawler(monkeypatch, tmp_path, frontier)
+    result = FetchResult(CrawlRequest('http://example.com/?id=5', key=5), status=200, body=b'<html></html>')
+
+    assert crawler.collect_story(result) is None
+    counts = frontier.counts()
+    assert counts[EMPTY] == 0 and counts[DONE] == 0
+    assert frontier.due(now=float('inf')) == [5]
+    assert crawler.stats['failed_downloads'] == 1 and crawler.stats['successful_downloads'] == 0
+    frontier.close()
@@ -0,0 +1,71 @@
+"""ETag校验与Range解析"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import server
+from server import StoryHandler, make_etag, match_etag
+
+TAG = 'f-18c2-1f4'
+LAST_MODIFIED = 'Sat, 17 Oct 2026 08:00:00 GMT'
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    (f'"{TAG}"', f'"{TAG}"'),
+    (f'W/"{TAG}"', f'"{TAG}"'),
+    (f'"other", W/"{TAG}-gzip"', f'"{TAG}-gzip"'),
+    ('*', f'"{TAG}"'),
+    ('"other"', None),
+    (f'"{TAG}-deflate"', None),
+    (f'"{TAG}x"', None),
+])
+def test_match_etag(header, expected):
+    assert match_etag(header, TAG) == expected
+
+
+def test_match_etag_uses_offered_encodings(monkeypatch):
+    # 没有装brotli时仍会提供 .br 旁路文件，其ETag要能命中304
+    monkeypatch.setattr(server, 'SUPPORTED_ENCODINGS', ('gzip',))
+    assert match_etag(f'"{TAG}-br"', TAG) is None
+    assert match_etag(f'"{TAG}-br"', TAG, ['br', 'gzip']) == make_etag(TAG, 'br')
+    assert match_etag(f'"{TAG}-gzip"', TAG, ['br']) is None
+
+
+def parse_range(header, size=1000, if_range=None):
+    headers = {'Range': header}
+    if if_range is not None:
+        headers['If-Range'] = if_range
+    return StoryHandler.parse_range(SimpleNamespace(headers=headers), size, make_etag(TAG), LAST_MODIFIED)
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=900-', (900, 999)),
+    ('bytes=-100', (900, 999)),
+    ('bytes=-5000', (0, 999)),
+    ('bytes=500-5000', (500, 999)),
+    ('bytes=999-999', (999, 999)),
+    ('bytes=1000-', False),
+    ('bytes=10-5', False),
+    ('bytes=-0', False),
+    ('bytes=0-1,5-6', None),
+    ('items=0-1', None),
+    ('bytes=abc-', None),
+    ('bytes=5', None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header) == expected
+
+
+def test_parse_range_if_range():
+    assert parse_range('bytes=0-9', if_range=make_etag(TAG)) == (0, 9)
+    assert parse_range('bytes=0-9', if_range=LAST_MODIFIED) == (0, 9)
+    # 验证器不匹配时忽略Range，返回完整内容
+    assert parse_range('bytes=0-9', if_range='"stale"') is None
+
+
+def test_parse_range_empty_file():
+    assert parse_range('bytes=0-', size=0) is False
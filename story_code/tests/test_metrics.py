@@ -0,0 +1,39 @@
+"""缓存命中计数：按线程计数，输出时汇总"""
+
+import threading
+import time
+
+from metrics import MetricsRegistry
+
+
+def test_cache_counts_are_summed_across_threads():
+    metrics = MetricsRegistry()
+    release = threading.Event()
+
+    def count():
+        for i in range(1000):
+            metrics.cache_event('response', i % 4 != 0)
+        metrics.cache_event('catalog', False, count=5)
+        release.wait(10)
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    metrics.cache_event('response', True)
+
+    # 线程还在运行时汇总各线程的计数
+    deadline = time.time() + 10
+    while metrics.to_dict()['caches'].get('catalog', {}).get('misses') != 40 and time.time() < deadline:
+        time.sleep(0.01)
+    caches = metrics.to_dict()['caches']
+    assert caches['response']['hits'] == 8 * 750 + 1 and caches['response']['misses'] == 8 * 250
+
+    # 线程结束后计数并入合计，不会丢失
+    release.set()
+    for thread in threads:
+        thread.join()
+    caches = metrics.to_dict()['caches']
+    assert caches['response'] == {'hits': 6001, 'misses': 2000, 'hit_ratio': round(6001 / 8001, 4)}
+    assert caches['catalog']['misses'] == 40
+    assert len(metrics._live_caches) == 1
+    assert 'story_cache_requests_total{cache="response",result="hit"} 6001' in metrics.to_prometheus()
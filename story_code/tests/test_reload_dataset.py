@@ -0,0 +1,40 @@
+"""零停机重新加载：全部就绪后才替换，失败时不改动当前数据"""
+
+import server
+
+
+def _trace(monkeypatch, calls, fail=None):
+    for name, store in (('catalog', server.CATALOG), ('db', server.CONTENT_DB),
+                        ('shards', server.CONTENT_SHARDS), ('related', server.RELATED)):
+        for method in ('build', 'swap', 'prepare_reload', 'publish'):
+            original = getattr(store, method, None)
+            if original is None:
+                continue
+
+            def traced(*args, _name=f'{name}.{method}', _original=original):
+                calls.append(_name)
+                if _name == fail:
+                    raise RuntimeError('预检失败')
+                return _original(*args)
+
+            monkeypatch.setattr(store, method, traced)
+    monkeypatch.setattr(server.SEARCH, 'index_for', lambda snapshot: None)
+
+
+def test_publishes_only_after_everything_is_prepared(monkeypatch):
+    calls = []
+    _trace(monkeypatch, calls)
+    report = server.reload_dataset('test')
+    assert report['status'] == 'ok'
+    assert calls == ['catalog.build', 'db.prepare_reload', 'shards.prepare_reload', 'related.prepare_reload',
+                     'catalog.swap', 'db.publish', 'shards.publish', 'related.publish']
+
+
+def test_failed_prepare_keeps_current_data(monkeypatch):
+    before = server.CATALOG.get()
+    calls = []
+    _trace(monkeypatch, calls, fail='related.prepare_reload')
+    report = server.reload_dataset('test')
+    assert report['status'] == 'failed'
+    assert not any(call.endswith(('.swap', '.publish')) for call in calls)
+    assert server.CATALOG.get() is before
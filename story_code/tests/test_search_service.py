@@ -0,0 +1,69 @@
+"""检索索引：后台构建与特殊字符路径"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+from search_index import StorySearchIndex
+from server import SearchService
+
+DOCUMENTS = [
+    (1, '小红帽', '小红帽去看外婆', '从前有个小姑娘，大家都叫她小红帽。'),
+    (2, '龟兔赛跑', '兔子和乌龟比赛', '骄傲的兔子在路边睡着了，乌龟坚持爬到了终点。'),
+]
+
+
+def test_reader_handles_uri_special_characters(tmp_path):
+    directory = tmp_path / 'a?b#c%20d'
+    directory.mkdir()
+    index = StorySearchIndex(str(directory / 'search_index.db'))
+    index.sync(DOCUMENTS, 'v1')
+    total, hits = index.search('兔子')
+    assert total == 1 and hits[0]['id'] == 2
+
+
+def test_first_build_runs_in_background(tmp_path):
+    service = SearchService(str(tmp_path / 'search_index.db'))
+    release = threading.Event()
+
+    def documents(snapshot):
+        release.wait(10)
+        return iter(DOCUMENTS)
+
+    service._documents = documents
+    snapshot = SimpleNamespace(digest='v1')
+
+    # 构建期间立即返回None（接口应答503），不阻塞请求线程
+    started = time.perf_counter()
+    assert service.index_for(snapshot) is None
+    assert service.index_for(snapshot) is None
+    assert time.perf_counter() - started < 1
+
+    release.set()
+    deadline = time.time() + 10
+    while service.index_for(snapshot) is None and time.time() < deadline:
+        time.sleep(0.01)
+    index = service.index_for(snapshot)
+    assert index is not None
+    assert index.search('小红帽')[0] == 1
+
+    # 目录变化后继续用旧索引应答，后台同步
+    assert service.index_for(SimpleNamespace(digest='v2')) is index
+
+
+def test_non_builder_waits_for_builder_version(tmp_path):
+    path = str(tmp_path / 'search_index.db')
+    reader = SearchService(path, builder=False, meta_check_interval=0)
+    snapshot = SimpleNamespace(digest='v1')
+
+    # 非构建进程不建索引：文件还不存在时返回None，也不会启动同步线程
+    assert reader.index_for(snapshot) is None
+    assert not reader._syncing
+
+    StorySearchIndex(path).sync(DOCUMENTS, 'v1')
+    index = reader.index_for(snapshot)
+    assert index is not None
+    assert index.search('乌龟')[0] == 1
+
+    # 目录已更新而构建进程还没同步完时返回None
+    assert reader.index_for(SimpleNamespace(digest='v2')) is None
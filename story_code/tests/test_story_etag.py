@@ -0,0 +1,70 @@
+"""故事详情/批量接口：304重新验证不查询正文"""
+
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import server
+
+
+class CountingStore:
+    """记录正文查询次数的正文来源"""
+
+    def __init__(self, contents):
+        self.contents = contents
+        self.lookups = 0
+        self.revision = 'r1'
+
+    def version(self):
+        return self.revision
+
+    def get_content(self, story_id):
+        self.lookups += 1
+        return self.contents.get(story_id)
+
+    def get_contents(self, story_ids):
+        self.lookups += 1
+        return {story_id: self.contents[story_id] for story_id in story_ids if story_id in self.contents}
+
+
+@pytest.fixture
+def site(monkeypatch):
+    snapshot = server.CATALOG.get()
+    story_ids = [record['id'] for record in snapshot.stories[:2]]
+    store = CountingStore({story_id: f'正文{story_id}' for story_id in story_ids})
+    monkeypatch.setattr(server.CONTENT, 'stores', [store])
+    httpd = server.create_server(0, 'threaded', 4)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}', store, story_ids
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fetch(url, etag=None):
+    request = urllib.request.Request(url, headers={'If-None-Match': etag} if etag else {})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers.get('ETag'), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get('ETag'), b''
+
+
+@pytest.mark.parametrize('path', ['/api/story?id={0}', '/api/stories/batch?ids={0},{1}'])
+def test_revalidation_skips_content_lookup(site, path):
+    base, store, story_ids = site
+    url = base + path.format(*story_ids)
+    status, etag, body = fetch(url)
+    assert status == 200 and etag
+    assert f'正文{story_ids[0]}' in body.decode('utf-8')
+    lookups = store.lookups
+
+    status, _, _ = fetch(url, etag)
+    assert status == 304
+    assert store.lookups == lookups
+
+    # 正文来源变化后ETag随之变化
+    store.revision = 'r2'
+    status, new_etag, _ = fetch(url, etag)
+    assert status == 200 and new_etag != etag
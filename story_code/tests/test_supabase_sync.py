@@ -0,0 +1,164 @@
+"""Supabase同步：键集分页、水位线增量合并与全量重同步"""
+
+import json
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from supabase_direct_crawler import SupabaseDirectCrawler
+
+
+def _compare(value, condition):
+    operator, _, argument = condition.partition('.')
+    argument = argument.strip('"')
+    if isinstance(value, int):
+        argument = int(argument)
+    if operator == 'gt':
+        return value > argument
+    if operator == 'lte':
+        return value <= argument
+    raise ValueError(condition)
+
+
+class FakePostgREST(BaseHTTPRequestHandler):
+    """只实现爬虫用到的PostgREST子集：select/order/limit、gt/lte、or=()、Prefer: count=exact"""
+
+    tables = {}
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        table = parsed.path.rsplit('/', 1)[1]
+        query = parse_qs(parsed.query)
+        self.requests.append((table, query))
+        rows = list(self.tables[table])
+        for column, values in query.items():
+            if column in ('select', 'order', 'limit', 'offset'):
+                continue
+            if column == 'or':
+                conditions = [condition.partition('.') for condition in values[0][1:-1].split(',')]
+                if any(name not in row for row in rows for name, _, _ in conditions):
+                    self.send_error(400)
+                    return
+                rows = [row for row in rows if any(_compare(row[name], rest) for name, _, rest in conditions)]
+                continue
+            for value in values:
+                rows = [row for row in rows if _compare(row[column], value)]
+        if 'order' in query:
+            column, _, direction = query['order'][0].partition('.')
+            rows.sort(key=lambda row: row[column], reverse=direction == 'desc')
+        total = len(rows)
+        rows = rows[:int(query.get('limit', [len(rows)])[0])]
+        if query.get('select', ['*'])[0] != '*':
+            rows = [{column: row[column] for column in query['select'][0].split(',')} for row in rows]
+        body = json.dumps(rows).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        exact = 'count=exact' in self.headers.get('Prefer', '')
+        self.send_header('Content-Range', f"0-{len(rows) - 1}/{total if exact else '*'}")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def supabase(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tables = {
+        'story_category': [{'id': i, 'name': f'分类{i}', 'sort_id': i, 'is_book': 0} for i in range(1, 4)],
+        'story_main': [{'id': i, 'category_id': i % 3 + 1, 'title': f'故事{i}', 'excerpt': '简介',
+                        'category_name': '童话', 'length': i, 'updated_at': '2026-01-01T00:00:00'}
+                       for i in range(1, 61)],
+        # 每个故事两行正文，让同一story_id的行跨过分页边界
+        'story_content': [{'id': i, 'story_id': (i + 1) // 2, 'content': f'正文{i}'} for i in range(1, 121)],
+    }
+    handler = type('Handler', (FakePostgREST,), {'tables': tables, 'requests': []})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}', tables, handler.requests
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _crawl(url, incremental=False):
+    crawler = SupabaseDirectCrawler(max_workers=3, page_size=7)
+    crawler.supabase_url = url
+    crawler.rest_url = f'{url}/rest/v1'
+    assert crawler.run_full_crawl(incremental=incremental)
+    return crawler
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_full_sync_keeps_every_row(supabase):
+    url, tables, _ = supabase
+    _crawl(url)
+    assert _load('supabase_stories.json') == tables['story_main']
+    assert _load('supabase_categories.json') == tables['story_category']
+    contents = _load('supabase_story_contents.json')
+    assert len(contents) == 120
+    assert [row['id'] for row in contents] == list(range(1, 121))
+    state = _load('supabase_sync_state.json')
+    assert state['story_main']['max_key'] == 60
+    assert state['story_main']['max_updated'] == '2026-01-01T00:00:00'
+    assert state['story_content']['updated_column'] is None
+
+
+def test_incremental_merges_new_and_updated_rows(supabase):
+    url, tables, requests = supabase
+    _crawl(url)
+    tables['story_main'][4].update(title='改过的故事5', updated_at='2026-02-01T00:00:00')
+    tables['story_main'].append({'id': 61, 'category_id': 1, 'title': '新故事', 'excerpt': '简介',
+                                 'category_name': '童话', 'length': 1, 'updated_at': '2026-01-01T00:00:00'})
+    tables['story_content'] += [{'id': 121, 'story_id': 61, 'content': '新正文'},
+                                {'id': 122, 'story_id': 3, 'content': '补充正文'}]
+    del requests[:]
+
+    crawler = _crawl(url, incremental=True)
+    assert crawler.fetched == {'story_category': 0, 'story_main': 2, 'story_content': 2}
+    filters = [query['or'][0] for table, query in requests if table == 'story_main' and 'or' in query]
+    assert filters and all(f == '(id.gt.60,updated_at.gt."2026-01-01T00:00:00")' for f in filters)
+
+    stories = _load('supabase_stories.json')
+    assert len(stories) == 61 and stories[4]['title'] == '改过的故事5' and stories[-1]['id'] == 61
+    contents = _load('supabase_story_contents.json')
+    assert len(contents) == 122
+    assert [row['id'] for row in contents if row['story_id'] == 3] == [5, 6, 122]
+    with open('supabase_stories.ndjson', encoding='utf-8') as f:
+        assert [json.loads(line)['id'] for line in f] in ([5, 61], [61, 5])
+    state = _load('supabase_sync_state.json')
+    assert state['story_main']['max_key'] == 61
+    assert state['story_main']['max_updated'] == '2026-02-01T00:00:00'
+    assert state['story_content']['max_key'] == 122
+
+
+def test_full_resync_removes_deleted_rows(supabase):
+    url, tables, _ = supabase
+    _crawl(url)
+    del tables['story_main'][10:20]
+    _crawl(url)
+    assert len(_load('supabase_stories.json')) == 50
+    conn = sqlite3.connect('supabase_complete_stories.db')
+    assert conn.execute('SELECT COUNT(*) FROM stories').fetchone()[0] == 50
+    conn.close()
+
+
+def test_watermark_for_another_key_forces_full_sync(supabase):
+    url, _, _ = supabase
+    _crawl(url)
+    state = _load('supabase_sync_state.json')
+    state['story_content'].update(key='story_id', max_key=60)
+    with open('supabase_sync_state.json', 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    crawler = _crawl(url, incremental=True)
+    assert crawler.fetched['story_content'] == 120
+    assert _load('supabase_sync_state.json')['story_content']['key'] == 'id'
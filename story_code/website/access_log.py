@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+故事服务器访问日志
+请求线程只把一条记录放进有界队列（队列满时直接丢弃并计数，绝不阻塞），
+由后台线程批量写成JSON行（路由、状态码、字节数、耗时），写文件时按大小轮转。
+成功请求可按比例采样，4xx/5xx与事件日志始终记录。
+"""
+
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+# 后台线程每次最多合并写入的记录数
+WRITE_BATCH = 512
+
+
+class AccessLog:
+    """非阻塞访问日志
+
+    path为None时写到标准输出；否则追加写入文件，超过max_bytes时轮转为
+    path.1 … path.N（保留backups个）。sample_rate为成功请求的采样比例（0~1）。
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS,
+                 sample_rate=1.0, queue_size=DEFAULT_QUEUE_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.sample_rate = sample_rate
+        self.queue_size = queue_size
+        self.enabled = True
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def configure(self, path=None, max_bytes=None, backups=None, sample_rate=None, enabled=None):
+        """调整配置；已启动的写线程会先把队列写完再退出，下一条记录时按新配置重启"""
+        self.close()
+        if path is not None:
+            self.path = path
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if backups is not None:
+            self.backups = backups
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, sample_rate))
+        if enabled is not None:
+            self.enabled = enabled
+
+    def _ensure_started(self):
+        # fork出的工作进程继承了队列对象但没有写线程，按pid判断后重建
+        if self._pid == os.getpid():
+            return self._queue
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                                name='access-log', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+        return self._queue
+
+    def _put(self, entry):
+        try:
+            self._ensure_started().put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def record(self, route, method, path, status, bytes_sent, seconds, client=None):
+        """记录一次请求（在请求线程中调用）"""
+        if not self.enabled:
+            return
+        if status < 400 and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return
+        self._put({
+            'ts': time.time(),
+            'type': 'access',
+            'route': route,
+            'method': method,
+            'path': path,
+            'status': status,
+            'bytes': bytes_sent,
+            'duration_ms': round(seconds * 1000, 3),
+            'client': client,
+        })
+
+    def event(self, message, level='info', **fields):
+        """记录一条事件日志（加载数据、错误等），不参与采样"""
+        if not self.enabled:
+            return
+        entry = {'ts': time.time(), 'type': 'event', 'level': level, 'message': message}
+        entry.update(fields)
+        self._put(entry)
+
+    def stats(self):
+        pending = self._queue.qsize() if self._queue is not None and self._pid == os.getpid() else 0
+        return {
+            'written': self.written,
+            'dropped': self.dropped,
+            'sampled_out': self.sampled_out,
+            'pending': pending,
+        }
+
+    def close(self, timeout=5.0):
+        """写完队列中剩余的记录后停止写线程"""
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None:
+                self._pid = None
+                return
+            log_queue, thread = self._queue, self._thread
+            self._pid = None
+            self._queue = self._thread = None
+        try:
+            log_queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def _open(self):
+        if self.path is None:
+            return sys.stdout
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        return open(self.path, 'a', encoding='utf-8')
+
+    def _rotate(self, stream):
+        """关闭当前文件并依次改名为 .1 … .N"""
+        stream.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        return self._open()
+
+    def _run(self, log_queue):
+        stream = self._open()
+        size = stream.tell() if stream is not sys.stdout else 0
+        running = True
+        while running:
+            entries = [log_queue.get()]
+            while len(entries) < WRITE_BATCH:
+                try:
+                    entries.append(log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in entries:
+                running = False
+                entries = [entry for entry in entries if entry is not None]
+            if not entries:
+                continue
+            text = ''.join(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+                           for entry in entries)
+            try:
+                stream.write(text)
+                stream.flush()
+            except (OSError, ValueError):
+                self.dropped += len(entries)
+                continue
+            self.written += len(entries)
+            if stream is not sys.stdout:
+                size += len(text.encode('utf-8'))
+                if self.max_bytes and size >= self.max_bytes:
+                    try:
+                        stream = self._rotate(stream)
+                        size = 0
+                    except OSError as e:
+                        print(f"❌ 访问日志轮转失败: {e}", file=sys.stderr)
+                        stream = self._open()
+                        size = stream.tell()
+        if stream is not sys.stdout:
+            stream.close()
+
+
+# 进程级访问日志
+ACCESS_LOG = AccessLog()
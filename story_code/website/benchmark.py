@@ -0,0 +1,545 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+故事服务器压测脚本
+在进程内启动 server.py，并以 1/16/64 个并发客户端（keep-alive 连接）
+压测指定路由，输出 req/s 与 p50/p99 延迟。
+
+多进程扩展性测试（--workers-scaling）会以子进程方式启动 server.py --workers N，
+并用多个客户端进程施压，避免客户端自身受GIL限制成为瓶颈。
+
+合成数据集测试（--synthetic）为每个规模生成故事目录JSON与对应的SQLite正文库，
+把进程内服务器切换到该数据集后逐个路由压测，输出吞吐、延迟分位数与内存（RSS），
+并可用 --json-out 保存结果、--compare 与之前（如上一个提交）的结果对比。
+
+用法:
+    python benchmark.py --mode threaded
+    python benchmark.py --mode pool --threads 32 --levels 1,16,64
+    python benchmark.py --url http://127.0.0.1:8000   # 压测已启动的服务器
+    python benchmark.py --workers-scaling 1,2,4,8 --levels 64 --client-procs 8
+    python benchmark.py --synthetic 2000,20000,200000 --levels 1,16 --json-out bench.json
+    python benchmark.py --synthetic 20000 --routes story,batch --compare bench.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote, urlparse
+
+import related_index
+import server
+
+
+DEFAULT_PATHS = ['/api/stories', '/api/story?id=1', '/api/categories', '/index.html']
+
+# 合成数据集
+SYNTHETIC_CATEGORIES = ['睡前故事', '童话故事', '寓言故事', '成语故事', '神话故事', '民间故事',
+                        '儿童故事', '历史故事', '名人故事', '哲理故事', '爱情故事', '经典故事']
+SYNTHETIC_CHARS = ('的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面'
+                   '而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去'
+                   '把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或'
+                   '但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品'
+                   '式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先'
+                   '回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清'
+                   '狐狸兔子小猪老鼠月亮公主王子爷爷奶奶森林花园')
+# 可单独压测的路由；路径模板中的 {id}/{ids}/{q} 每次请求随机取值
+ROUTE_TEMPLATES = {
+    'stories': '/api/stories',
+    'page': '/api/stories?limit=20&offset={offset}',
+    'story': '/api/story?id={id}',
+    'categories': '/api/categories',
+    'batch': '/api/stories/batch?ids={ids}',
+    'search': '/api/search?q={q}',
+    'related': '/api/story/related?id={id}',
+    'static': '/index.html',
+}
+DEFAULT_ROUTES = 'stories,page,story,categories,batch'
+# 每个路由预先生成的不同路径数（客户端轮流请求）
+PATHS_PER_ROUTE = 1000
+
+
+def percentile(sorted_values, pct):
+    """计算已排序列表的百分位数"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def client_worker(host, port, paths, deadline, latencies, errors, lock):
+    """单个客户端：复用一条keep-alive连接循环发请求直到截止时间"""
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    local_latencies = []
+    local_errors = 0
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 500:
+                local_errors += 1
+            if response.will_close:
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+        except (OSError, http.client.HTTPException):
+            local_errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        local_latencies.append(time.perf_counter() - start)
+    conn.close()
+    with lock:
+        latencies.extend(local_latencies)
+        errors[0] += local_errors
+
+
+def drive_clients(host, port, paths, concurrency, duration):
+    """在当前进程中用concurrency个客户端线程施压，返回(延迟列表, 错误数)"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=client_worker,
+                         args=(host, port, paths, deadline, latencies, errors, lock),
+                         daemon=True)
+        for _ in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors[0]
+
+
+def run_level(host, port, paths, concurrency, duration, client_procs=1):
+    """以指定并发数压测一轮，返回统计结果；client_procs>1时把客户端分摊到多个进程"""
+    started = time.perf_counter()
+    if client_procs <= 1:
+        latencies, error_count = drive_clients(host, port, paths, concurrency, duration)
+    else:
+        procs = min(client_procs, concurrency)
+        shares = [concurrency // procs + (1 if i < concurrency % procs else 0) for i in range(procs)]
+        latencies, error_count = [], 0
+        with ProcessPoolExecutor(max_workers=procs) as executor:
+            futures = [executor.submit(drive_clients, host, port, paths, share, duration) for share in shares]
+            for future in futures:
+                part, part_errors = future.result()
+                latencies.extend(part)
+                error_count += part_errors
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': error_count,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def start_background_server(mode, threads):
+    """在后台线程中启动服务器，返回(server, port)"""
+    httpd = server.create_server(0, mode, threads, host='127.0.0.1')
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, httpd.server_address[1]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(host, port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def wait_until_serving(host, port, paths, timeout=300.0, streak=20):
+    """等待各路径不再返回503（检索索引构建中）：每次新建连接，让请求分散到各工作进程，
+    连续streak次都成功才算就绪；超时返回False"""
+    deadline = time.monotonic() + timeout
+    ok = 0
+    while time.monotonic() < deadline:
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        try:
+            conn.request('GET', paths[ok % len(paths)])
+            response = conn.getresponse()
+            response.read()
+            ok = ok + 1 if response.status != 503 else 0
+        except (OSError, http.client.HTTPException):
+            ok = 0
+        finally:
+            conn.close()
+        if ok >= streak:
+            return True
+        if ok == 0:
+            time.sleep(0.2)
+    return False
+
+
+def start_subprocess_server(workers, mode, threads, port):
+    """以子进程方式启动多进程服务器"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+    proc = subprocess.Popen(
+        [sys.executable, script, '--port', str(port), '--workers', str(workers),
+         '--mode', mode, '--threads', str(threads), '--no-browser'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    if not wait_for_port('127.0.0.1', port):
+        proc.terminate()
+        raise RuntimeError(f"服务器未能在端口 {port} 启动")
+    return proc
+
+
+def run_workers_scaling(worker_counts, levels, args, paths):
+    """对每个工作进程数分别启动服务器并压测，输出吞吐随进程数的变化"""
+    print(f"🖥️  本机CPU核数: {os.cpu_count()}")
+    summary = []
+    for workers in worker_counts:
+        port = free_port()
+        proc = start_subprocess_server(workers, args.mode, args.threads, port)
+        try:
+            # 等第一个工作进程建好检索索引、其他进程读到新版本（压测路径含检索时）
+            if not wait_until_serving('127.0.0.1', port, paths):
+                print("⚠️  等待服务就绪超时，结果中可能包含503")
+            # 预热：让各工作进程完成目录加载
+            run_level('127.0.0.1', port, paths, max(levels), 1.0, args.client_procs)
+            results = []
+            for level in levels:
+                print(f"⏱️  {workers} 个工作进程, 并发 {level} 压测 {args.duration:.0f} 秒...")
+                results.append(run_level('127.0.0.1', port, paths, level, args.duration, args.client_procs))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+        print_results(f"{workers} 个工作进程 × {args.mode}", results)
+        summary.append((workers, results[-1]))
+
+    base = summary[0][1]['rps'] or 1.0
+    print(f"\n📈 扩展性（并发 {levels[-1]}）")
+    print(f"{'进程数':>6} {'req/s':>10} {'加速比':>8} {'p99(ms)':>10}")
+    for workers, result in summary:
+        print(f"{workers:>6} {result['rps']:>10.1f} {result['rps'] / base:>8.2f} {result['p99_ms']:>10.2f}")
+
+
+def rss_mb():
+    """(当前RSS, 峰值RSS)，单位MB；不支持的平台返回None"""
+    current = peak = None
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux为KB，macOS为字节
+        peak = peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    except (ImportError, OSError):
+        pass
+    return (round(current, 1) if current else None), (round(peak, 1) if peak else None)
+
+
+def generate_dataset(directory, count, content_chars=400, seed=42):
+    """生成count个故事的目录JSON（stories.json）与SQLite正文库（contents.db）
+
+    生成参数记在dataset.json中，参数相同的已有数据集直接复用。
+    """
+    os.makedirs(directory, exist_ok=True)
+    catalog_path = os.path.join(directory, 'stories.json')
+    db_path = os.path.join(directory, 'contents.db')
+    params_path = os.path.join(directory, 'dataset.json')
+    params = {'count': count, 'content_chars': content_chars, 'seed': seed}
+    if os.path.exists(catalog_path) and os.path.exists(db_path):
+        try:
+            with open(params_path, encoding='utf-8') as f:
+                if json.load(f) == params:
+                    return catalog_path, db_path
+        except (OSError, ValueError):
+            pass
+
+    rng = random.Random(seed)
+    # 先生成一段长文本，每个故事从中截取一段，生成速度与规模线性相关
+    corpus = ''.join(rng.choice(SYNTHETIC_CHARS) for _ in range(200000))
+    stories = []
+    tmp_db = db_path + '.tmp'
+    if os.path.exists(tmp_db):
+        os.remove(tmp_db)
+    conn = sqlite3.connect(tmp_db)
+    conn.execute("CREATE TABLE story_contents (id INTEGER PRIMARY KEY, content TEXT)")
+    rows = []
+    for story_id in range(1, count + 1):
+        length = rng.randint(content_chars // 2, content_chars * 3 // 2)
+        start = rng.randrange(len(corpus) - length)
+        content = corpus[start:start + length]
+        category_id = rng.randrange(len(SYNTHETIC_CATEGORIES))
+        stories.append({
+            'id': story_id,
+            'title': corpus[start + 3:start + 3 + rng.randint(3, 8)],
+            'excerpt': content[:80],
+            'category_id': category_id + 1,
+            'category_name': SYNTHETIC_CATEGORIES[category_id],
+            'length': length,
+        })
+        rows.append((story_id, content))
+        if len(rows) >= 10000:
+            conn.executemany("INSERT INTO story_contents (id, content) VALUES (?, ?)", rows)
+            rows = []
+    conn.executemany("INSERT INTO story_contents (id, content) VALUES (?, ?)", rows)
+    conn.commit()
+    conn.close()
+    os.replace(tmp_db, db_path)
+    with open(catalog_path, 'w', encoding='utf-8') as f:
+        json.dump(stories, f, ensure_ascii=False, separators=(',', ':'))
+    with open(params_path, 'w', encoding='utf-8') as f:
+        json.dump(params, f)
+    return catalog_path, db_path
+
+
+def use_dataset(catalog_path, db_path, workdir, routes):
+    """把进程内服务器切换到指定数据集（目录、正文库、检索与相关故事索引都指向workdir）
+
+    被测路由需要的离线索引在这里先建好，建索引耗时不计入压测结果。
+    """
+    server.CATALOG.data_files = [catalog_path]
+    server.CONTENT_DB.db_paths = [db_path]
+    server.CONTENT.stores = [server.CONTENT_DB]
+    server.SEARCH.db_path = os.path.join(workdir, 'search_index.db')
+    server.SEARCH._index = None
+    server.RELATED.path = os.path.join(workdir, 'related_index.bin')
+    server.CATALOG.invalidate()
+    server.CONTENT_DB.reload()
+    snapshot = server.CATALOG.get()
+
+    if 'search' in routes:
+        started = time.perf_counter()
+        # 索引在后台线程中构建，等它与当前目录一致后再开始计时，否则压测的是503
+        server.SEARCH.builder = True
+        server.SEARCH.wait_until_ready(snapshot)
+        print(f"🔎 检索索引就绪: {time.perf_counter() - started:.1f} 秒")
+    if 'related' in routes and not os.path.exists(server.RELATED.path):
+        started = time.perf_counter()
+        contents = server.CONTENT.get_contents([record['id'] for record in snapshot.stories])
+        documents = [(record['id'], record.get('category_id'), record.get('title') or '',
+                      contents.get(record['id'], '')) for record in snapshot.stories]
+        related = related_index.compute_related(documents)
+        related_index.write_index(server.RELATED.path, [doc[0] for doc in documents], related,
+                                  related_index.DEFAULT_K, snapshot.digest or '')
+        print(f"🔗 相关故事索引就绪: {time.perf_counter() - started:.1f} 秒")
+    server.RELATED.reload()
+    return snapshot
+
+
+def route_paths(route, count, rng, max_id):
+    """按路由模板生成count个具体路径"""
+    template = ROUTE_TEMPLATES[route]
+    words = ['小猪', '狐狸', '月亮', '公主', '老爷爷', '小兔子']
+    paths = []
+    for _ in range(count):
+        paths.append(template.format(
+            id=rng.randint(1, max_id),
+            offset=rng.randrange(0, max(1, max_id - 20)),
+            ids=','.join(str(rng.randint(1, max_id)) for _ in range(20)),
+            q=quote(rng.choice(words)),
+        ))
+    return paths
+
+
+def run_synthetic_suite(args, levels):
+    """对每个合成规模、每个路由、每个并发级别压测，返回结果记录列表"""
+    sizes = [int(x) for x in args.synthetic.split(',') if x.strip()]
+    routes = [r.strip() for r in args.routes.split(',') if r.strip()]
+    unknown = [r for r in routes if r not in ROUTE_TEMPLATES]
+    if unknown:
+        raise SystemExit(f"未知的路由: {', '.join(unknown)}（可选: {', '.join(ROUTE_TEMPLATES)}）")
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='story_bench_')
+    server.ACCESS_LOG.configure(enabled=False)
+    httpd, port = start_background_server(args.mode, args.threads)
+    records = []
+    try:
+        for size in sizes:
+            workdir = os.path.join(data_dir, f"synthetic_{size}_{args.content_chars}")
+            started = time.perf_counter()
+            catalog_path, db_path = generate_dataset(workdir, size, args.content_chars)
+            generated = time.perf_counter() - started
+            started = time.perf_counter()
+            snapshot = use_dataset(catalog_path, db_path, workdir, routes)
+            loaded = time.perf_counter() - started
+            print(f"\n📦 数据集 {size} 个故事: 生成 {generated:.1f} 秒, 加载目录与索引 {loaded:.2f} 秒, "
+                  f"RSS {rss_mb()[0]} MB")
+
+            rng = random.Random(size)
+            results = []
+            for route in routes:
+                paths = route_paths(route, PATHS_PER_ROUTE, rng, len(snapshot.stories))
+                # 预热：构建缓存等只做一次的工作不计入结果；确认路由已能正常应答（不再返回503）
+                if not wait_until_serving('127.0.0.1', port, paths[:1], timeout=60.0, streak=1):
+                    print(f"⚠️  {route} 预热超时，结果中可能包含503")
+                run_level('127.0.0.1', port, paths[:1], 1, 0.2)
+                for level in levels:
+                    print(f"⏱️  {route} 并发 {level} 压测 {args.duration:.0f} 秒...")
+                    result = run_level('127.0.0.1', port, paths, level, args.duration, args.client_procs)
+                    current, peak = rss_mb()
+                    result.update({'dataset': size, 'route': route, 'rss_mb': current, 'peak_rss_mb': peak})
+                    results.append(result)
+            print_suite_results(size, results)
+            records.extend(results)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return records
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def save_results(path, args, records):
+    """保存结果JSON（含提交号与环境信息，便于跨提交对比）"""
+    payload = {
+        'revision': git_revision(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'mode': args.mode,
+        'threads': args.threads,
+        'duration': args.duration,
+        'results': records,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已保存: {path}")
+
+
+def compare_results(path, records):
+    """与之前保存的结果逐项对比（按数据集、路由、并发匹配）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r['dataset'], r['route'], r['concurrency']): r for r in baseline.get('results', [])}
+    print(f"\n🆚 与 {path}（提交 {baseline.get('revision') or '?'}）对比")
+    print(f"{'数据集':>8} {'路由':<11} {'并发':>4} {'req/s':>10} {'变化':>8} {'p99(ms)':>9} {'变化':>8}")
+    for r in records:
+        old = previous.get((r['dataset'], r['route'], r['concurrency']))
+        if old is None:
+            continue
+        rps_delta = (r['rps'] / old['rps'] - 1) * 100 if old['rps'] else 0.0
+        p99_delta = (r['p99_ms'] / old['p99_ms'] - 1) * 100 if old['p99_ms'] else 0.0
+        print(f"{r['dataset']:>8} {r['route']:<11} {r['concurrency']:>4} {r['rps']:>10.1f} {rps_delta:>+7.1f}% "
+              f"{r['p99_ms']:>9.2f} {p99_delta:>+7.1f}%")
+
+
+def print_suite_results(size, results):
+    print(f"\n📊 数据集 {size} 个故事")
+    print(f"{'路由':<11} {'并发':>4} {'请求数':>8} {'错误':>5} {'req/s':>10} {'p50(ms)':>9} "
+          f"{'p90(ms)':>9} {'p99(ms)':>9} {'RSS(MB)':>8}")
+    for r in results:
+        print(f"{r['route']:<11} {r['concurrency']:>4} {r['requests']:>8} {r['errors']:>5} {r['rps']:>10.1f} "
+              f"{r['p50_ms']:>9.2f} {r['p90_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['rss_mb'] or 0:>8.1f}")
+
+
+def print_results(title, results):
+    """打印结果表格"""
+    print(f"\n📊 {title}")
+    print(f"{'并发':>6} {'请求数':>8} {'错误':>6} {'req/s':>10} {'p50(ms)':>10} {'p99(ms)':>10}")
+    for r in results:
+        print(f"{r['concurrency']:>6} {r['requests']:>8} {r['errors']:>6} "
+              f"{r['rps']:>10.1f} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='故事服务器压测')
+    parser.add_argument('--mode', choices=server.SERVER_MODES, default='threaded', help='进程内服务器的服务模式')
+    parser.add_argument('--threads', type=int, default=server.DEFAULT_WORKERS, help='pool模式的工作线程数')
+    parser.add_argument('--levels', default='1,16,64', help='并发客户端数列表，逗号分隔 (默认: 1,16,64)')
+    parser.add_argument('--duration', type=float, default=5.0, help='每个并发级别的压测秒数 (默认: 5)')
+    parser.add_argument('--paths', default=','.join(DEFAULT_PATHS), help='轮流请求的路径，逗号分隔')
+    parser.add_argument('--url', help='压测已运行的服务器（如 http://127.0.0.1:8000），不启动进程内服务器')
+    parser.add_argument('--client-procs', type=int, default=1, help='客户端进程数 (默认: 1)')
+    parser.add_argument('--workers-scaling', help='多进程扩展性测试的工作进程数列表，如 1,2,4,8')
+    parser.add_argument('--synthetic', help='合成数据集规模列表，如 2000,20000,200000')
+    parser.add_argument('--routes', default=DEFAULT_ROUTES,
+                        help=f"合成数据集测试的路由，逗号分隔，可选 {','.join(ROUTE_TEMPLATES)} (默认: {DEFAULT_ROUTES})")
+    parser.add_argument('--content-chars', type=int, default=400, help='合成故事的平均正文字数 (默认: 400)')
+    parser.add_argument('--data-dir', help='合成数据集目录（保留并复用生成的数据），默认使用临时目录')
+    parser.add_argument('--json-out', help='把结果保存为JSON文件')
+    parser.add_argument('--compare', help='与之前保存的结果JSON对比')
+    args = parser.parse_args()
+
+    levels = [int(x) for x in args.levels.split(',') if x.strip()]
+    paths = [p for p in args.paths.split(',') if p.strip()]
+
+    if args.synthetic:
+        records = run_synthetic_suite(args, levels)
+        if args.compare:
+            compare_results(args.compare, records)
+        if args.json_out:
+            save_results(args.json_out, args, records)
+        return
+
+    if args.workers_scaling:
+        worker_counts = [int(x) for x in args.workers_scaling.split(',') if x.strip()]
+        run_workers_scaling(worker_counts, levels, args, paths)
+        return
+
+    httpd = None
+    if args.url:
+        parsed = urlparse(args.url)
+        host, port = parsed.hostname, parsed.port or 80
+        title = f"外部服务器 {args.url}"
+    else:
+        # 进程内服务器与客户端共享GIL，结果用于横向对比各模式，而非绝对吞吐
+        server.ACCESS_LOG.configure(enabled=False)
+        httpd, port = start_background_server(args.mode, args.threads)
+        host = '127.0.0.1'
+        title = f"模式 {args.mode}" + (f" ({args.threads} 线程)" if args.mode == 'pool' else "")
+
+    results = []
+    try:
+        for level in levels:
+            print(f"⏱️  并发 {level} 压测 {args.duration:.0f} 秒...")
+            results.append(run_level(host, port, paths, level, args.duration, args.client_procs))
+    finally:
+        if httpd:
+            httpd.shutdown()
+            httpd.server_close()
+
+    print_results(title, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全文检索基准测试
+分别在真实语料（story/ 下约2000个故事及正文分片）和合成的10万故事语料上
+建立FTS5索引，测量建索引耗时、增量同步耗时以及各类查询的延迟分位数。
+
+用法:
+    python benchmark_search.py
+    python benchmark_search.py --synthetic 100000 --rounds 50
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from search_index import StorySearchIndex
+
+
+STORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'story')
+
+# 查询集合：双字词走逐字短语索引，三字及以上走trigram索引
+QUERIES = ['小猪', '狐狸', '小老鼠', '大灰狼', '月亮', '公主', '老爷爷', '小兔子 胡萝卜', '王子 公主', '从前有']
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def load_real_corpus(story_dir):
+    """读取 stories_optimized.json 与 contents/batch_N.json，返回文档列表"""
+    with open(os.path.join(story_dir, 'stories_optimized.json'), 'r', encoding='utf-8') as f:
+        stories = json.load(f)
+    contents = {}
+    for path in glob.glob(os.path.join(story_dir, 'contents', 'batch_*.json')):
+        with open(path, 'r', encoding='utf-8') as f:
+            for item in json.load(f):
+                contents[item.get('story_id', item.get('id'))] = item.get('content', '')
+    return [(s['id'], s.get('title'), s.get('excerpt'), contents.get(s['id'], '')) for s in stories]
+
+
+def make_synthetic_corpus(real_docs, count, seed=42):
+    """用真实正文的片段拼接出count个合成故事，保持中文字频分布"""
+    rng = random.Random(seed)
+    texts = [doc[3] or doc[2] or '' for doc in real_docs if (doc[3] or doc[2])]
+    titles = [doc[1] for doc in real_docs if doc[1]]
+    for story_id in range(1, count + 1):
+        base = rng.choice(texts)
+        start = rng.randrange(max(1, len(base) - 200))
+        other = rng.choice(texts)
+        content = base[start:start + 600] + other[:400]
+        yield (story_id, rng.choice(titles) + str(story_id % 97), content[:60], content)
+
+
+def bench_queries(index, rounds):
+    """每个查询重复rounds次，返回每个查询的延迟统计"""
+    results = []
+    for query in QUERIES:
+        latencies = []
+        total = 0
+        for _ in range(rounds):
+            started = time.perf_counter()
+            total, _ = index.search(query, limit=20)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        results.append({
+            'query': query,
+            'hits': total,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        })
+    return results
+
+
+def run_corpus(name, docs, rounds, workdir):
+    db_path = os.path.join(workdir, f"{name}.db")
+    index = StorySearchIndex(db_path)
+    docs = list(docs)
+
+    build = index.sync(docs, version='v1')
+    # 修改1%的文档后再次同步，测量增量路径
+    changed = [(d[0], d[1], d[2], (d[3] or '') + '（修订）') if i % 100 == 0 else d for i, d in enumerate(docs)]
+    incremental = index.sync(changed, version='v2')
+
+    print(f"\n📚 语料 {name}: {len(docs)} 个故事, 索引文件 {os.path.getsize(db_path) / 1024 / 1024:.1f} MB")
+    print(f"   全量建索引 {build['seconds']:.2f} 秒; 增量同步 {incremental['updated']} 个变更 {incremental['seconds']:.2f} 秒")
+    print(f"   {'查询':<12} {'命中':>7} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9}")
+    for r in bench_queries(index, rounds):
+        print(f"   {r['query']:<12} {r['hits']:>7} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}")
+    index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全文检索基准测试')
+    parser.add_argument('--story-dir', default=STORY_DIR, help='真实语料目录（含stories_optimized.json与contents/）')
+    parser.add_argument('--synthetic', type=int, default=100000, help='合成语料故事数 (默认: 100000，0为跳过)')
+    parser.add_argument('--rounds', type=int, default=30, help='每个查询重复次数 (默认: 30)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='story_search_bench_')
+    try:
+        real_docs = load_real_corpus(args.story_dir)
+        run_corpus('real', real_docs, args.rounds, workdir)
+        if args.synthetic:
+            run_corpus(f'synthetic_{args.synthetic}', make_synthetic_corpus(real_docs, args.synthetic),
+                       args.rounds, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
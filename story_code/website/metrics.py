@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+故事服务器进程内指标
+按路由统计请求数、状态码、发送字节数与延迟直方图，记录各缓存命中率和数据库查询耗时，
+可输出为Prometheus文本格式或JSON（见 server.py 的 /api/metrics）。
+"""
+
+import threading
+import time
+import weakref
+
+
+# 直方图桶上界（秒），与Prometheus默认桶相近，补充了亚毫秒级的桶
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """固定桶直方图，分位数由桶内线性插值估算"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        index = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for index, count in enumerate(self.counts):
+            upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+            if count and cumulative + count >= rank:
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = upper
+        return self.buckets[-1]
+
+    def summary_ms(self):
+        """JSON输出用的毫秒摘要"""
+        result = {f"p{int(q * 100)}": round(self.quantile(q) * 1000, 3) for q in QUANTILES}
+        result['mean'] = round(self.total / self.count * 1000, 3) if self.count else 0.0
+        return result
+
+
+class RouteStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.statuses = {}
+        self.bytes_sent = 0
+
+
+class _ThreadCaches:
+    """一个线程的缓存计数；线程结束、本对象被回收时把计数并入已结束线程的合计"""
+
+    __slots__ = ('counters', '__weakref__')
+
+    def __init__(self):
+        self.counters = {}
+
+
+class MetricsRegistry:
+    """线程安全的指标登记处
+
+    缓存命中计数在热路径上，按线程分别计数（只有本线程写，不需要加锁），输出指标时汇总。
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._local = threading.local()
+        self._live_caches = {}
+        self._retired_caches = {}
+        self._db = Histogram()
+        self._db_errors = 0
+
+    def observe_request(self, route, status, seconds, bytes_sent):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = RouteStats()
+            stats.latency.observe(seconds)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.bytes_sent += bytes_sent
+
+    def cache_event(self, name, hit, count=1):
+        """记录缓存命中/未命中（只写本线程的计数，不加锁）"""
+        try:
+            caches = self._local.caches.counters
+        except AttributeError:
+            caches = self._thread_caches()
+        counters = caches.get(name)
+        if counters is None:
+            counters = caches[name] = [0, 0]
+        counters[0 if hit else 1] += count
+
+    def _thread_caches(self):
+        """为当前线程登记一份计数，线程结束时由_retire_caches并入合计"""
+        holder = self._local.caches = _ThreadCaches()
+        counters = holder.counters
+        with self._lock:
+            self._live_caches[id(counters)] = counters
+        weakref.finalize(holder, self._retire_caches, counters)
+        return counters
+
+    def _retire_caches(self, counters):
+        with self._lock:
+            self._live_caches.pop(id(counters), None)
+            _add_caches(self._retired_caches, counters)
+
+    def _cache_totals(self):
+        """汇总各线程的缓存计数（调用方持有_lock）"""
+        totals = {}
+        _add_caches(totals, self._retired_caches)
+        for counters in list(self._live_caches.values()):
+            _add_caches(totals, counters)
+        return totals
+
+    def observe_db(self, seconds, error=False):
+        with self._lock:
+            self._db.observe(seconds)
+            if error:
+                self._db_errors += 1
+
+    def to_dict(self):
+        """JSON格式的指标快照"""
+        with self._lock:
+            routes = {}
+            for route, stats in sorted(self._routes.items()):
+                routes[route] = {
+                    'count': stats.latency.count,
+                    'status': {str(code): n for code, n in sorted(stats.statuses.items())},
+                    'errors': sum(n for code, n in stats.statuses.items() if code >= 500),
+                    'bytes_sent': stats.bytes_sent,
+                    'latency_ms': stats.latency.summary_ms(),
+                }
+            caches = {}
+            for name, (hits, misses) in sorted(self._cache_totals().items()):
+                total = hits + misses
+                caches[name] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_ratio': round(hits / total, 4) if total else None,
+                }
+            return {
+                'uptime_seconds': round(time.time() - self.started, 1),
+                'routes': routes,
+                'caches': caches,
+                'db': {
+                    'queries': self._db.count,
+                    'errors': self._db_errors,
+                    'total_ms': round(self._db.total * 1000, 3),
+                    'latency_ms': self._db.summary_ms(),
+                },
+            }
+
+    def to_prometheus(self):
+        """Prometheus文本格式（0.0.4）"""
+        lines = []
+        with self._lock:
+            lines.append('# HELP story_uptime_seconds Seconds since the server process started.')
+            lines.append('# TYPE story_uptime_seconds gauge')
+            lines.append(f'story_uptime_seconds {time.time() - self.started:.1f}')
+
+            lines.append('# HELP story_http_requests_total Requests handled, by route and status.')
+            lines.append('# TYPE story_http_requests_total counter')
+            for route, stats in sorted(self._routes.items()):
+                for code, n in sorted(stats.statuses.items()):
+                    lines.append(f'story_http_requests_total{{route="{route}",status="{code}"}} {n}')
+
+            lines.append('# HELP story_http_response_bytes_total Response body bytes sent, by route.')
+            lines.append('# TYPE story_http_response_bytes_total counter')
+            for route, stats in sorted(self._routes.items()):
+                lines.append(f'story_http_response_bytes_total{{route="{route}"}} {stats.bytes_sent}')
+
+            lines.append('# HELP story_http_request_duration_seconds Request latency, by route.')
+            lines.append('# TYPE story_http_request_duration_seconds histogram')
+            for route, stats in sorted(self._routes.items()):
+                lines.extend(_histogram_lines('story_http_request_duration_seconds', stats.latency, f'route="{route}",'))
+
+            lines.append('# HELP story_http_request_duration_quantile_seconds Estimated latency quantiles, by route.')
+            lines.append('# TYPE story_http_request_duration_quantile_seconds gauge')
+            for route, stats in sorted(self._routes.items()):
+                for q in QUANTILES:
+                    lines.append(f'story_http_request_duration_quantile_seconds{{route="{route}",quantile="{q}"}} '
+                                 f'{stats.latency.quantile(q):.6f}')
+
+            lines.append('# HELP story_cache_requests_total Cache lookups, by cache and result.')
+            lines.append('# TYPE story_cache_requests_total counter')
+            for name, (hits, misses) in sorted(self._cache_totals().items()):
+                lines.append(f'story_cache_requests_total{{cache="{name}",result="hit"}} {hits}')
+                lines.append(f'story_cache_requests_total{{cache="{name}",result="miss"}} {misses}')
+
+            lines.append('# HELP story_db_query_duration_seconds SQLite content query latency.')
+            lines.append('# TYPE story_db_query_duration_seconds histogram')
+            lines.extend(_histogram_lines('story_db_query_duration_seconds', self._db, ''))
+            lines.append('# HELP story_db_query_errors_total Failed SQLite content queries.')
+            lines.append('# TYPE story_db_query_errors_total counter')
+            lines.append(f'story_db_query_errors_total {self._db_errors}')
+        return '\n'.join(lines) + '\n'
+
+
+def _add_caches(totals, counters):
+    # 其他线程可能正在新增缓存名，先复制一份再遍历
+    for name, (hits, misses) in list(counters.items()):
+        total = totals.setdefault(name, [0, 0])
+        total[0] += hits
+        total[1] += misses
+
+
+def _histogram_lines(name, histogram, labels):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {histogram.count}')
+    plain_labels = labels.rstrip(',')
+    suffix = f'{{{plain_labels}}}' if plain_labels else ''
+    lines.append(f'{name}_sum{suffix} {histogram.total:.6f}')
+    lines.append(f'{name}_count{suffix} {histogram.count}')
+    return lines
+
+
+# 进程级指标登记处
+METRICS = MetricsRegistry()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+相关故事索引
+离线为每个故事计算top-k相关故事：正文按汉字二元组（英文按单词）建立TF-IDF向量，
+余弦相似度加上同分类加分；同分类候选不足k个时用同分类中id相邻的故事补齐。
+
+结果写成紧凑的定长数组文件，服务器以mmap方式打开，按id直接定位到一行，
+查询为O(1)。文件格式（小端）:
+    头部   4s magic, I 格式版本, I k, I 行数, i 最小id, i 最大id, 16s 目录摘要
+    槽位表 int32[最大id-最小id+1]   id → 行号（-1表示没有）
+    邻居表 int32[行数*k]            相关故事id（-1填充）
+    分数表 float32[行数*k]
+
+用法:
+    python related_index.py                      # 用server.py的数据源构建 related_index.bin
+    python related_index.py --k 12 --data-source story --out /tmp/related.bin
+"""
+
+import argparse
+import array
+import heapq
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+
+MAGIC = b'SREL'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIIIii16s')
+DEFAULT_K = 10
+# 每个文档保留的最高权重词数，控制倒排表规模
+MAX_TERMS = 64
+# 出现在超过该比例文档中的词视为停用词
+MAX_DF = 0.1
+# 同分类加分（余弦相似度在0~1之间）
+CATEGORY_WEIGHT = 0.15
+# 标题词的重复次数（提高标题在向量中的权重）
+TITLE_WEIGHT = 3
+
+CJK_RUN_RE = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+WORD_RE = re.compile(r'[A-Za-z0-9]{2,}')
+
+
+def tokenize(text):
+    """汉字连续段切成二元组，英文数字按单词"""
+    if not text:
+        return []
+    tokens = []
+    for run in CJK_RUN_RE.findall(text):
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(word.lower() for word in WORD_RE.findall(text))
+    return tokens
+
+
+def build_vectors(documents, max_terms=MAX_TERMS, max_df=MAX_DF):
+    """documents: [(id, category, title, text)]，返回每个文档的 {词: 权重}（L2归一化）"""
+    counts = []
+    df = Counter()
+    for _, _, title, text in documents:
+        counter = Counter(tokenize(text))
+        for token in tokenize(title):
+            counter[token] += TITLE_WEIGHT
+        counts.append(counter)
+        df.update(counter.keys())
+
+    total = len(documents)
+    limit = max(2, int(total * max_df))
+    vectors = []
+    for counter in counts:
+        weights = {}
+        for token, count in counter.items():
+            freq = df[token]
+            # 只出现在一个文档里的词无法产生相似度
+            if freq < 2 or freq > limit:
+                continue
+            weights[token] = (1.0 + math.log(count)) * math.log(total / freq)
+        if len(weights) > max_terms:
+            weights = dict(heapq.nlargest(max_terms, weights.items(), key=lambda item: item[1]))
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        vectors.append({token: w / norm for token, w in weights.items()})
+    return vectors
+
+
+def compute_related(documents, k=DEFAULT_K, category_weight=CATEGORY_WEIGHT,
+                    max_terms=MAX_TERMS, max_df=MAX_DF):
+    """返回与documents顺序对应的 [[(相关id, 分数), ...]]"""
+    vectors = build_vectors(documents, max_terms, max_df)
+    postings = defaultdict(list)
+    for index, vector in enumerate(vectors):
+        for token, weight in vector.items():
+            postings[token].append((index, weight))
+
+    by_category = defaultdict(list)
+    for index, (_, category, _, _) in enumerate(documents):
+        by_category[category].append(index)
+
+    results = []
+    for index, vector in enumerate(vectors):
+        scores = defaultdict(float)
+        for token, weight in vector.items():
+            for other, other_weight in postings[token]:
+                scores[other] += weight * other_weight
+        scores.pop(index, None)
+
+        category = documents[index][1]
+        if category is not None:
+            for other in scores:
+                if documents[other][1] == category:
+                    scores[other] += category_weight
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+        if len(top) < k and category is not None:
+            # 文本上没有足够的相似故事时，用同分类中id相邻的故事补齐
+            chosen = {other for other, _ in top}
+            chosen.add(index)
+            story_id = documents[index][0]
+            siblings = sorted((other for other in by_category[category] if other not in chosen),
+                              key=lambda other: abs(documents[other][0] - story_id))
+            top.extend((other, category_weight) for other in siblings[:k - len(top)])
+        results.append([(documents[other][0], score) for other, score in top])
+    return results
+
+
+def _native(values):
+    """数组转为小端字节"""
+    if sys.byteorder != 'little':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def write_index(path, story_ids, related, k, digest=''):
+    """写入索引文件（先写临时文件再原子替换，已mmap旧文件的进程不受影响）"""
+    min_id = min(story_ids) if story_ids else 0
+    max_id = max(story_ids) if story_ids else -1
+    slots = array.array('i', [-1]) * (max_id - min_id + 1)
+    neighbors = array.array('i', [-1]) * (len(story_ids) * k)
+    scores = array.array('f', [0.0]) * (len(story_ids) * k)
+    for row, (story_id, items) in enumerate(zip(story_ids, related)):
+        slots[story_id - min_id] = row
+        for column, (other, score) in enumerate(items[:k]):
+            neighbors[row * k + column] = other
+            scores[row * k + column] = score
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, k, len(story_ids), min_id, max_id,
+                            digest.encode('ascii')[:16]))
+        f.write(_native(slots))
+        f.write(_native(neighbors))
+        f.write(_native(scores))
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+class RelatedTable:
+    """一个已打开的索引文件（不可变，替换时整体换引用）"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.k, self.rows, self.min_id, self.max_id, digest = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"不是相关故事索引文件: {path}")
+        self.digest = digest.rstrip(b'\0').decode('ascii')
+        span = self.max_id - self.min_id + 1
+        cells = self.rows * self.k
+        offset = HEADER.size
+        self.slots = self._array('i', offset, span)
+        offset += span * 4
+        self.neighbors = self._array('i', offset, cells)
+        offset += cells * 4
+        self.scores = self._array('f', offset, cells)
+
+    def _array(self, typecode, offset, count):
+        view = memoryview(self._mmap)[offset:offset + count * 4]
+        if sys.byteorder == 'little':
+            return view.cast(typecode)
+        values = array.array(typecode, view.tobytes())
+        values.byteswap()
+        return values
+
+    def related(self, story_id, limit=None):
+        """返回 [(相关id, 分数)]，未收录的id返回None"""
+        if not self.min_id <= story_id <= self.max_id:
+            return None
+        row = self.slots[story_id - self.min_id]
+        if row < 0:
+            return None
+        start = row * self.k
+        count = self.k if limit is None else min(limit, self.k)
+        result = []
+        for column in range(start, start + count):
+            other = self.neighbors[column]
+            if other < 0:
+                break
+            result.append((other, round(self.scores[column], 4)))
+        return result
+
+
+class RelatedStoriesIndex:
+    """服务器侧的相关故事索引：按mtime/大小检测文件替换并重新mmap"""
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._table = None
+        self._signature = None
+        self._next_check = 0.0
+
+    def _stat_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime, stat.st_size
+        except OSError:
+            return None
+
+    def reload(self):
+        """立即重新检查文件，返回当前表（可能为None）"""
+        return self.publish(self.prepare_reload())
+
+    def prepare_reload(self):
+        """在调用线程中打开索引文件（不改动当前表），结果交给publish()替换"""
+        signature = self._stat_signature()
+        return signature, self._open(signature)
+
+    def publish(self, prepared):
+        """换上prepare_reload()打开的表，返回该表（可能为None）"""
+        signature, table = prepared
+        with self._lock:
+            self._signature = signature
+            self._table = table
+            self._next_check = time.monotonic() + self.check_interval
+        return table
+
+    def _open(self, signature):
+        try:
+            return RelatedTable(self.path) if signature else None
+        except (OSError, ValueError, struct.error) as e:
+            print(f"❌ 打开相关故事索引失败: {e}")
+            return None
+
+    def table(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return self._table
+        with self._lock:
+            if now < self._next_check:
+                return self._table
+            self._next_check = now + self.check_interval
+            signature = self._stat_signature()
+            if signature != self._signature:
+                self._signature = signature
+                self._table = self._open(signature)
+            return self._table
+
+
+def default_related_path():
+    """默认索引文件位置（与server.py同目录）"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'related_index.bin')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='构建相关故事索引')
+    parser.add_argument('--out', default=default_related_path(), help='输出文件 (默认: 本目录下 related_index.bin)')
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help=f'每个故事保留的相关故事数 (默认: {DEFAULT_K})')
+    parser.add_argument('--data-source', default='auto', help='与server.py相同的数据源: auto/crawler/story')
+    parser.add_argument('--category-weight', type=float, default=CATEGORY_WEIGHT,
+                        help=f'同分类加分 (默认: {CATEGORY_WEIGHT})')
+    args = parser.parse_args()
+
+    # 复用服务器的目录与正文存储，保证与线上数据源一致
+    import server
+    os.chdir(os.path.dirname(os.path.abspath(server.__file__)))
+    server.configure_data_source(args.data_source)
+    snapshot = server.CATALOG.get()
+
+    started = time.perf_counter()
+    documents = []
+    for record in snapshot.stories:
+        story_id = record.get('id')
+        if story_id is None:
+            continue
+        content = server.CONTENT.get_content(story_id) or snapshot.contents.get(story_id)
+        text = ' '.join(part for part in (record.get('excerpt'), content) if part)
+        documents.append((story_id, record.get('category_id') or record.get('category_name'),
+                          record.get('title') or '', text))
+    loaded = time.perf_counter()
+
+    related = compute_related(documents, args.k, args.category_weight)
+    computed = time.perf_counter()
+    size = write_index(args.out, [doc[0] for doc in documents], related, args.k, snapshot.digest or '')
+    server.ACCESS_LOG.close()
+
+    print(f"🔗 相关故事索引: {len(documents)} 个故事, k={args.k}, 文件 {size / 1024:.1f} KB")
+    print(f"   读取正文 {loaded - started:.2f} 秒, 计算相似度 {computed - loaded:.2f} 秒 → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
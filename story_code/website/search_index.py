@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+故事全文检索索引
+基于SQLite FTS5，对标题、摘要、正文建立trigram索引（中文无需分词），
+bm25排序并返回高亮片段。索引按内容哈希增量同步：目录变化时只改动有变化的故事。
+
+trigram分词器要求每个检索词至少3个字符。更短的词（中文里很常见的双字词）
+走第二张无内容（contentless）FTS5表：汉字逐字切分为词元，检索词作为相邻字
+短语匹配，同样使用bm25排序，高亮片段在Python中生成。
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+SNIPPET_ELLIPSIS = '…'
+SNIPPET_TOKENS = 32
+# 短词路径生成片段时，命中位置前后保留的字符数
+SNIPPET_CONTEXT = 24
+# bm25列权重：标题 > 摘要 > 正文
+BM25_WEIGHTS = (10.0, 3.0, 1.0)
+MIN_TRIGRAM_TERM = 3
+
+# 逐字切分的CJK字符范围
+CJK_CHAR_RE = re.compile(r'([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff])')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS story_fts USING fts5(
+    title, excerpt, content,
+    tokenize = 'trigram'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS story_chars USING fts5(
+    title, excerpt, content,
+    content = '',
+    tokenize = 'unicode61'
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def document_hash(title, excerpt, content):
+    """文档内容哈希，用于增量同步"""
+    digest = hashlib.sha1()
+    for part in (title, excerpt, content):
+        digest.update((part or '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def split_terms(query):
+    """按空白拆分检索词，去掉空词"""
+    return [term for term in query.split() if term]
+
+
+def split_chars(text):
+    """在每个汉字两侧加空格，使unicode61把每个汉字当作独立词元"""
+    return CJK_CHAR_RE.sub(r' \1 ', text or '')
+
+
+def build_match_expression(terms, per_char=False):
+    """把检索词转成FTS5 MATCH表达式：每个词作为短语，词之间为AND"""
+    if per_char:
+        terms = [' '.join(split_chars(term).split()) for term in terms]
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def highlight_text(text, terms):
+    """在文本中标记所有检索词（短词路径使用）"""
+    if not text:
+        return text
+    for term in sorted(set(terms), key=len, reverse=True):
+        text = text.replace(term, f"{HIGHLIGHT_START}{term}{HIGHLIGHT_END}")
+    return text
+
+
+def make_snippet(text, terms):
+    """截取第一个命中位置附近的文本并高亮（短词路径使用）"""
+    if not text:
+        return ''
+    positions = [text.find(term) for term in terms]
+    positions = [p for p in positions if p >= 0]
+    if not positions:
+        return text[:SNIPPET_CONTEXT * 2] + (SNIPPET_ELLIPSIS if len(text) > SNIPPET_CONTEXT * 2 else '')
+    first = min(positions)
+    start = max(0, first - SNIPPET_CONTEXT)
+    end = min(len(text), first + SNIPPET_CONTEXT * 2)
+    snippet = highlight_text(text[start:end], terms)
+    if start > 0:
+        snippet = SNIPPET_ELLIPSIS + snippet
+    if end < len(text):
+        snippet += SNIPPET_ELLIPSIS
+    return snippet
+
+
+class StorySearchIndex:
+    """故事全文检索索引
+
+    写入（同步）使用单独的连接并加锁；查询使用每线程一条连接，
+    数据库为WAL模式，同步期间查询不被阻塞。
+    readonly=True时不打开写连接（由其他进程负责构建），只能查询和读取meta。
+    """
+
+    def __init__(self, db_path, readonly=False):
+        self.db_path = db_path
+        self.readonly = readonly
+        self.synced_version = None
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        if readonly:
+            self._writer = None
+            return
+        self._writer = sqlite3.connect(db_path, check_same_thread=False)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._writer.executescript(SCHEMA)
+        self._writer.commit()
+
+    def _reader(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{quote(self.db_path)}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def get_meta(self, key):
+        if self.readonly:
+            # 构建进程可能还没建好文件或表
+            try:
+                row = self._reader().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                return None
+        else:
+            row = self._writer.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _delete(self, conn, story_id):
+        """从两张索引表中删除文档；无内容表需要用原文执行'delete'命令"""
+        row = conn.execute(
+            "SELECT title, excerpt, content FROM story_fts WHERE rowid = ?", (story_id,)
+        ).fetchone()
+        if row is None:
+            return
+        conn.execute(
+            "INSERT INTO story_chars (story_chars, rowid, title, excerpt, content) VALUES ('delete', ?, ?, ?, ?)",
+            (story_id, split_chars(row[0]), split_chars(row[1]), split_chars(row[2]))
+        )
+        conn.execute("DELETE FROM story_fts WHERE rowid = ?", (story_id,))
+
+    def sync(self, documents, version=None):
+        """增量同步索引
+
+        documents: 可迭代的 (id, title, excerpt, content)，代表完整的当前目录。
+        返回 {'added', 'updated', 'removed', 'unchanged', 'seconds'}。
+        """
+        if self.readonly:
+            raise RuntimeError("只读索引不能同步")
+        started = time.perf_counter()
+        stats = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        with self._write_lock:
+            conn = self._writer
+            existing = dict(conn.execute("SELECT id, hash FROM documents"))
+            seen = set()
+            with conn:
+                for story_id, title, excerpt, content in documents:
+                    if story_id in seen:
+                        continue
+                    seen.add(story_id)
+                    digest = document_hash(title, excerpt, content)
+                    old = existing.get(story_id)
+                    if old == digest:
+                        stats['unchanged'] += 1
+                        continue
+                    if old is not None:
+                        self._delete(conn, story_id)
+                        stats['updated'] += 1
+                    else:
+                        stats['added'] += 1
+                    conn.execute(
+                        "INSERT INTO story_fts (rowid, title, excerpt, content) VALUES (?, ?, ?, ?)",
+                        (story_id, title or '', excerpt or '', content or '')
+                    )
+                    conn.execute(
+                        "INSERT INTO story_chars (rowid, title, excerpt, content) VALUES (?, ?, ?, ?)",
+                        (story_id, split_chars(title), split_chars(excerpt), split_chars(content))
+                    )
+                    conn.execute("INSERT OR REPLACE INTO documents (id, hash) VALUES (?, ?)", (story_id, digest))
+
+                removed = [story_id for story_id in existing if story_id not in seen]
+                for story_id in removed:
+                    self._delete(conn, story_id)
+                    conn.execute("DELETE FROM documents WHERE id = ?", (story_id,))
+                stats['removed'] = len(removed)
+                if version is not None:
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(version),))
+
+            if stats['added'] or stats['updated'] or stats['removed']:
+                conn.execute("INSERT INTO story_fts (story_fts) VALUES ('optimize')")
+                conn.execute("INSERT INTO story_chars (story_chars) VALUES ('optimize')")
+                conn.commit()
+            self.synced_version = version
+        stats['seconds'] = time.perf_counter() - started
+        return stats
+
+    def search(self, query, limit=20, offset=0):
+        """检索，返回(总命中数, [{id, title, snippet, score}])"""
+        terms = split_terms(query)
+        if not terms:
+            return 0, []
+        if all(len(term) >= MIN_TRIGRAM_TERM for term in terms):
+            return self._search_trigram(terms, limit, offset)
+        return self._search_chars(terms, limit, offset)
+
+    def _search_trigram(self, terms, limit, offset):
+        conn = self._reader()
+        expression = build_match_expression(terms)
+        total = conn.execute("SELECT count(*) FROM story_fts WHERE story_fts MATCH ?", (expression,)).fetchone()[0]
+        rows = conn.execute(
+            f"""
+            SELECT rowid,
+                   highlight(story_fts, 0, ?, ?),
+                   snippet(story_fts, -1, ?, ?, ?, ?),
+                   bm25(story_fts, {', '.join(str(w) for w in BM25_WEIGHTS)}) AS score
+            FROM story_fts
+            WHERE story_fts MATCH ?
+            ORDER BY score
+            LIMIT ? OFFSET ?
+            """,
+            (HIGHLIGHT_START, HIGHLIGHT_END, HIGHLIGHT_START, HIGHLIGHT_END,
+             SNIPPET_ELLIPSIS, SNIPPET_TOKENS, expression, limit, offset)
+        ).fetchall()
+        return total, [
+            {'id': row[0], 'title': row[1], 'snippet': row[2], 'score': round(-row[3], 4)}
+            for row in rows
+        ]
+
+    def _search_chars(self, terms, limit, offset):
+        """短词路径：逐字索引上的相邻字短语匹配，原文从trigram表按rowid取回"""
+        conn = self._reader()
+        expression = build_match_expression(terms, per_char=True)
+        total = conn.execute("SELECT count(*) FROM story_chars WHERE story_chars MATCH ?", (expression,)).fetchone()[0]
+        rows = conn.execute(
+            f"""
+            SELECT c.rowid, f.title, f.excerpt, f.content,
+                   bm25(story_chars, {', '.join(str(w) for w in BM25_WEIGHTS)}) AS score
+            FROM story_chars AS c
+            JOIN story_fts AS f ON f.rowid = c.rowid
+            WHERE story_chars MATCH ?
+            ORDER BY score
+            LIMIT ? OFFSET ?
+            """,
+            (expression, limit, offset)
+        ).fetchall()
+        results = []
+        for story_id, title, excerpt, content, score in rows:
+            body = content if any(term in content for term in terms) else excerpt
+            results.append({
+                'id': story_id,
+                'title': highlight_text(title, terms),
+                'snippet': make_snippet(body, terms),
+                'score': round(-score, 4),
+            })
+        return total, results
+
+    def close(self):
+        self._writer.close()
+
+
+def default_index_path():
+    """默认索引文件位置（与server.py同目录）"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search_index.db')
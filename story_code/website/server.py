@@ -3,18 +3,1107 @@
 
 import http.server
 import socketserver
+import email.utils
 import os
+import errno
 import json
+import signal
+import socket
+import sys
 import sqlite3
-from urllib.parse import urlparse, parse_qs
+import argparse
+import queue
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs, quote
 import threading
 import webbrowser
 import time
+import re
+import base64
+import gzip
+import hashlib
+from types import MappingProxyType
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from search_index import StorySearchIndex, default_index_path
+from metrics import METRICS
+from access_log import ACCESS_LOG
+from related_index import RelatedStoriesIndex, default_related_path
+
+# 支持的服务模式
+SERVER_MODES = ('single', 'threaded', 'pool')
+DEFAULT_WORKERS = 16
+DEFAULT_KEEPALIVE_TIMEOUT = 5
+
+# /api/stories 分页参数
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+STORY_LIST_PARAMS = ('limit', 'offset', 'cursor', 'category', 'fields')
+# /api/stories/batch 单次最多返回的故事数
+MAX_BATCH_IDS = 100
+# 检索索引首次构建期间 /api/search 返回503时建议的重试间隔（秒）
+SEARCH_RETRY_AFTER = 2
+
+# 小于该字节数的响应不压缩
+MIN_COMPRESS_SIZE = 1024
+# 服务端支持的压缩算法，按优先级排列
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+# 各API路由的Cache-Control策略，可通过 --cache-control ROUTE=VALUE 覆盖
+DEFAULT_CACHE_CONTROL = 'no-cache'
+ROUTE_CACHE_CONTROL = {
+    '/api/stories': 'public, max-age=60',
+    '/api/story': 'public, max-age=300',
+    '/api/story/related': 'public, max-age=300',
+    '/api/categories': 'public, max-age=300',
+    '/api/search': 'public, max-age=60',
+    '/api/stories/batch': 'public, max-age=300',
+    '/api/metrics': 'no-store',
+    '/api/admin/reload': 'no-store',
+}
+
+# 静态文件：文件名含内容哈希（如 app.3f2a9c1e.js）的资源可长期缓存，其余每次校验
+HASHED_ASSET_RE = re.compile(r'[.-][0-9a-f]{8,}\.[A-Za-z0-9]+$')
+HASHED_ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+STATIC_CACHE_CONTROL = 'no-cache'
+# 预压缩旁路文件（file.br / file.gz）的扩展名，按优先级排列
+SIDECAR_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# 指标中单独统计的API路由，其余API路径归入api_other，静态文件归入static
+API_ROUTES = frozenset(ROUTE_CACHE_CONTROL)
+
+
+class ApiError(Exception):
+    """API参数错误等可预期的失败，由handle_api_request转换为对应状态码"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+def get_sample_stories():
+    """获取示例故事数据"""
+    return [
+        {
+            "id": 1,
+            "title": "小红帽",
+            "category_name": "童话故事",
+            "excerpt": "从前有个可爱的小姑娘，她总是戴着一顶红色的帽子，所以大家都叫她小红帽。",
+            "length": 1200,
+            "content": "从前有个可爱的小姑娘，她总是戴着一顶红色的帽子，所以大家都叫她小红帽。\n\n有一天，妈妈让小红帽去看望生病的奶奶，并给她带去一些好吃的食物。小红帽高高兴兴地出发了。\n\n在去奶奶家的路上，小红帽遇到了一只大灰狼。大灰狼问她要去哪里，小红帽天真地告诉了它。\n\n大灰狼听后，眼珠一转，想出了一个坏主意。它抄近路先到了奶奶家，把奶奶吞进了肚子里，然后穿上奶奶的衣服躺在床上等小红帽。\n\n小红帽到了奶奶家，发现奶奶的样子很奇怪。她问：'奶奶，您的耳朵怎么这么大？''为了更好地听你说话，我的孩子。'\n\n'奶奶，您的眼睛怎么这么大？''为了更好地看你，我的孩子。'\n\n'奶奶，您的嘴巴怎么这么大？''为了更好地吃掉你！'说完，大灰狼就扑向了小红帽。\n\n幸好这时候猎人路过，听到了呼救声，赶紧冲进屋里救出了小红帽和奶奶。从此以后，小红帽再也不随便和陌生人说话了。"
+        },
+        {
+            "id": 2,
+            "title": "三只小猪",
+            "category_name": "童话故事",
+            "excerpt": "三只小猪要盖房子，老大用稻草，老二用木头，老三用砖头。",
+            "length": 1500,
+            "content": "从前有三只小猪，他们要离开妈妈独自生活。\n\n老大很懒，用稻草盖了一座房子。老二也不太勤快，用木头盖了一座房子。只有老三很勤劳，用砖头盖了一座结实的房子。\n\n有一天，大灰狼来了。它先到了老大的稻草房子前，用力一吹，房子就倒了。老大赶紧跑到老二家。\n\n大灰狼又来到老二的木头房子前，用力一撞，房子也倒了。两只小猪赶紧跑到老三家。\n\n大灰狼来到老三的砖头房子前，又吹又撞，房子纹丝不动。大灰狼气得要从烟囱爬进去。\n\n聪明的老三早就在烟囱下面放了一口大锅，锅里装满了开水。大灰狼掉进锅里，被烫得哇哇叫着逃跑了。\n\n从此以后，三只小猪快快乐乐地生活在一起，老大和老二也学会了要勤劳。"
+        },
+        {
+            "id": 3,
+            "title": "龟兔赛跑",
+            "category_name": "寓言故事",
+            "excerpt": "骄傲的兔子和坚持不懈的乌龟进行了一场赛跑。",
+            "length": 800,
+            "content": "从前，有一只跑得很快的兔子和一只爬得很慢的乌龟。\n\n兔子总是嘲笑乌龟爬得慢，乌龟很不服气，就向兔子挑战赛跑。\n\n比赛开始了，兔子一下子就跑得很远，回头看看，乌龟还在后面慢慢地爬着。\n\n兔子想：'乌龟爬得这么慢，我先睡一觉也不会输。'于是它在路边睡着了。\n\n乌龟虽然爬得慢，但是它一直坚持不懈地向前爬，一步一步地超过了睡觉的兔子。\n\n等兔子醒来的时候，乌龟已经到达了终点。兔子后悔极了。\n\n这个故事告诉我们：坚持不懈的努力比天赋更重要，骄傲使人落后。"
+        }
+    ]
+
+
+def freeze_record(record):
+    """返回记录的只读视图，防止共享目录被请求处理代码修改"""
+    return MappingProxyType(dict(record))
+
+
+def json_default(obj):
+    """json.dumps的回调：把只读记录视图序列化为普通对象"""
+    if isinstance(obj, MappingProxyType):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def join_story_content(record, content):
+    """在响应时把正文拼接到基础记录上，返回新字典，不修改基础记录"""
+    story = dict(record)
+    if content:
+        story['content'] = content
+    return story
+
+
+def encode_json(data):
+    """紧凑JSON序列化为UTF-8字节"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=json_default).encode('utf-8')
+
+
+def compress_body(body, encoding, best=False):
+    """按指定算法压缩；best=True用于会被缓存的响应，用更高压缩级别换更小体积"""
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=9 if best else 6, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(body, quality=11 if best else 5)
+    return body
+
+
+def negotiate_encoding(accept_encoding, supported=SUPPORTED_ENCODINGS):
+    """根据Accept-Encoding从supported中选择压缩算法，不接受任何压缩时返回'identity'"""
+    if not accept_encoding:
+        return 'identity'
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name] = q
+    wildcard = accepted.get('*', 0.0)
+    best, best_q = 'identity', 0.0
+    for encoding in supported:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def short_hash(*parts):
+    """对若干字符串/字节计算sha1，返回前16位十六进制"""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+
+def make_etag(tag, encoding='identity'):
+    """生成强ETag；压缩后的表示附加编码后缀，以区分不同字节内容"""
+    if encoding == 'identity':
+        return f'"{tag}"'
+    return f'"{tag}-{encoding}"'
+
+
+def match_etag(if_none_match, tag, encodings=None):
+    """判断If-None-Match是否命中（弱比较，忽略W/前缀和编码后缀）
+
+    encodings为该资源实际会提供的压缩编码（默认为服务端能即时压缩的编码；
+    静态文件应传入磁盘上存在的预压缩旁路文件的编码）。
+    命中时返回应在304中回送的ETag，否则返回None。
+    """
+    if encodings is None:
+        encodings = SUPPORTED_ENCODINGS
+    if not if_none_match:
+        return None
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return make_etag(tag)
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        value = candidate.strip('"')
+        if value == tag:
+            return make_etag(tag)
+        base, _, suffix = value.rpartition('-')
+        if base == tag and suffix in encodings:
+            return make_etag(tag, suffix)
+    return None
+
+
+class EncodedBody:
+    """一份已序列化的响应体，以及按需生成并缓存的各压缩版本"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._encoded = {'identity': raw}
+        self._lock = threading.Lock()
+
+    def get(self, encoding):
+        """返回(实际编码, 字节)"""
+        if len(self.raw) < MIN_COMPRESS_SIZE:
+            return 'identity', self.raw
+        body = self._encoded.get(encoding)
+        METRICS.cache_event('compressed_body', body is not None)
+        if body is None:
+            with self._lock:
+                body = self._encoded.get(encoding)
+                if body is None:
+                    body = self._encoded[encoding] = compress_body(self.raw, encoding, best=True)
+        return encoding, body
+
+
+class ResponseCache:
+    """按名称缓存大且少变的响应体，版本（如目录版本）变化时重建"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, version, build):
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == version:
+            METRICS.cache_event('response', True)
+            return entry[1]
+        METRICS.cache_event('response', False)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry[0] != version:
+                entry = (version, EncodedBody(encode_json(build())))
+                self._entries[name] = entry
+        return entry[1]
+
+
+class CatalogSnapshot:
+    """某一时刻的故事目录（加载完成后只读）
+
+    stories   只读记录元组（不含正文），保持数据文件中的顺序
+    by_id     id -> 记录，详情查询为O(1)
+    contents  id -> 正文，数据文件中内嵌的正文单独存放，响应时再拼接
+    category_ids  分类名 -> 该分类下的id元组（保持目录顺序），用于分页过滤
+    """
+
+    def __init__(self, stories, source=None, mtime=None, size=None, version=0, digest=None):
+        self.source = source
+        self.mtime = mtime
+        self.size = size
+        self.version = version
+        # 数据内容的哈希，用作ETag基础，重启或多进程下保持一致
+        self.digest = digest or short_hash('sample')
+        self.loaded_at = time.time()
+        self._record_digests = {}
+
+        records = []
+        by_id = {}
+        contents = {}
+        seen = {}
+        category_ids = {}
+        for story in stories:
+            story = dict(story)
+            content = story.pop('content', None)
+            record = freeze_record(story)
+            records.append(record)
+            story_id = record.get('id')
+            if story_id is not None and story_id not in by_id:
+                by_id[story_id] = record
+                if content:
+                    contents[story_id] = content
+                category_ids.setdefault(record.get('category_name', '未分类'), []).append(story_id)
+            # 分类列表按首次出现顺序预先计算
+            seen.setdefault(record.get('category_name', '未分类'), None)
+
+        self.stories = tuple(records)
+        self.by_id = MappingProxyType(by_id)
+        self.contents = MappingProxyType(contents)
+        self.categories = tuple(seen)
+        self.category_ids = MappingProxyType({name: tuple(ids) for name, ids in category_ids.items()})
+
+    def get(self, story_id):
+        """按id获取基础记录"""
+        return self.by_id.get(story_id)
+
+    def record_digest(self, story_id):
+        """记录内容的哈希（按快照缓存）"""
+        digest = self._record_digests.get(story_id)
+        if digest is None:
+            record = self.by_id[story_id]
+            digest = short_hash(*(f"{key}={record[key]!r}" for key in sorted(record)))
+            self._record_digests[story_id] = digest
+        return digest
+
+    def page(self, offset, limit, category=None):
+        """返回(该页记录列表, 过滤后总数)"""
+        if category is None:
+            return self.stories[offset:offset + limit], len(self.stories)
+        ids = self.category_ids.get(category, ())
+        by_id = self.by_id
+        return [by_id[story_id] for story_id in ids[offset:offset + limit]], len(ids)
+
+
+def encode_cursor(offset, category):
+    """生成不透明的分页游标"""
+    payload = json.dumps({'o': offset, 'c': category}, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析分页游标，返回(offset, category)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        offset = int(payload['o'])
+        category = payload.get('c')
+    except (ValueError, KeyError, TypeError, UnicodeError):
+        raise ApiError(400, "Invalid cursor")
+    if offset < 0:
+        raise ApiError(400, "Invalid cursor")
+    return offset, category
+
+
+def parse_id_list(value):
+    """解析逗号分隔或JSON列表形式的id，去重并保持顺序"""
+    if isinstance(value, str):
+        value = [part for part in value.split(',') if part.strip()]
+    if not isinstance(value, list) or not value:
+        raise ApiError(400, "Missing ids")
+    ids = []
+    seen = set()
+    for item in value:
+        try:
+            story_id = int(str(item).strip())
+        except ValueError:
+            raise ApiError(400, f"Invalid id: {item}")
+        if story_id not in seen:
+            seen.add(story_id)
+            ids.append(story_id)
+    if len(ids) > MAX_BATCH_IDS:
+        raise ApiError(400, f"Too many ids (max {MAX_BATCH_IDS})")
+    return ids
+
+
+def project_record(record, fields):
+    """按fields投影记录，id始终保留"""
+    if fields is None:
+        return record
+    return {key: record[key] for key in fields if key in record}
+
+
+def parse_int_param(query_params, name, default, minimum=0, maximum=None):
+    """解析整数查询参数，非法时抛出ApiError(400)"""
+    value = query_params.get(name, [None])[0]
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ApiError(400, f"Invalid {name}")
+    if value < minimum:
+        raise ApiError(400, f"Invalid {name}")
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
+
+
+class StoryCatalog:
+    """进程级故事目录：只加载一次，数据文件mtime或大小变化时重新加载并原子替换"""
+
+    def __init__(self, data_files, base_dir, check_interval=1.0):
+        self.data_files = data_files
+        self.base_dir = base_dir
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def _find_source(self):
+        """返回第一个存在的数据文件及其(mtime, size)"""
+        for file_path in self.data_files:
+            full_path = os.path.join(self.base_dir, file_path)
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue
+            return full_path, st.st_mtime_ns, st.st_size
+        return None, None, None
+
+    def invalidate(self):
+        """下次get()时立即重新检查数据文件"""
+        self._next_check = 0.0
+
+    def build(self):
+        """在调用线程中加载一份新快照但不替换当前快照；加载失败时抛出RuntimeError"""
+        source, mtime, size = self._find_source()
+        snapshot = self._load(source, mtime, size, self._snapshot)
+        if snapshot is None:
+            raise RuntimeError(f"加载 {source} 失败")
+        return snapshot
+
+    def swap(self, snapshot):
+        """原子替换当前快照，处理中的请求继续使用各自持有的旧快照"""
+        with self._lock:
+            self._snapshot = snapshot
+            self._next_check = time.monotonic() + self.check_interval
+
+    def _is_stale(self, snapshot, source, mtime, size):
+        return (snapshot is None or snapshot.source != source
+                or snapshot.mtime != mtime or snapshot.size != size)
+
+    def get(self):
+        """获取当前目录快照，必要时重新加载"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now < self._next_check:
+            METRICS.cache_event('catalog', True)
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and now < self._next_check:
+                METRICS.cache_event('catalog', True)
+                return snapshot
+            self._next_check = now + self.check_interval
+            source, mtime, size = self._find_source()
+            stale = self._is_stale(snapshot, source, mtime, size)
+            METRICS.cache_event('catalog', not stale)
+            if stale:
+                new_snapshot = self._load(source, mtime, size, snapshot)
+                if new_snapshot is not None:
+                    # 单次引用赋值，处理中的请求继续使用旧快照
+                    self._snapshot = snapshot = new_snapshot
+            return snapshot
+
+    def _load(self, source, mtime, size, previous):
+        """加载数据文件，失败时保留上一个快照"""
+        version = previous.version + 1 if previous else 1
+        if source is None:
+            if previous is not None and previous.source is None:
+                return previous
+            ACCESS_LOG.event("📝 使用示例数据")
+            return CatalogSnapshot(get_sample_stories(), version=version)
+
+        try:
+            with open(source, 'rb') as f:
+                raw = f.read()
+            data = json.loads(raw.decode('utf-8'))
+        except Exception as e:
+            ACCESS_LOG.event(f"❌ 加载 {source} 失败: {e}", level='error')
+            if previous is not None:
+                return None
+            ACCESS_LOG.event("📝 使用示例数据")
+            return CatalogSnapshot(get_sample_stories(), version=version)
+
+        ACCESS_LOG.event(f"✅ 加载数据文件: {os.path.relpath(source, self.base_dir)}",
+                         stories=len(data), version=version)
+        return CatalogSnapshot(data, source, mtime, size, version, digest=short_hash(raw))
+
+
+class ContentDatabasePool:
+    """只读SQLite正文库连接池
+
+    每个数据库文件一个有界连接池（最多pool_size条只读连接，各线程共享、用完归还），
+    连接用URI mode=ro打开；immutable=True时加immutable=1跳过加锁和变更检测，
+    只适用于不再写入的冻结快照（爬虫仍在以WAL写入的库不能用，否则会读到旧页或不一致的页）。
+    查询语句固定，由sqlite3的语句缓存复用预编译结果；每个数据库只探测一次
+    表结构，并记住每个id位于哪个数据库（或都不存在）。
+    数据库文件的mtime或大小变化时作废连接、表结构与位置缓存。
+    """
+
+    # 按优先级探测的正文表（白名单，表名会拼入SQL）
+    CONTENT_TABLES = ('story_contents', 'stories')
+    MISSING = -1
+
+    def __init__(self, db_files, base_dir, immutable=False, pool_size=8, check_interval=1.0,
+                 max_locations=100000):
+        self.db_paths = [os.path.join(base_dir, f) for f in db_files]
+        self.immutable = immutable
+        self.pool_size = pool_size
+        self.check_interval = check_interval
+        self.max_locations = max_locations
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._signature = None
+        self._next_check = 0.0
+        self._tables = {}
+        self._locations = {}
+
+    def _stat_signature(self):
+        signature = []
+        for path in self.db_paths:
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def _check_files(self):
+        """定期检查数据库文件是否变化，变化时作废所有缓存"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            signature = self._stat_signature()
+            if signature != self._signature:
+                self._signature = signature
+                self._tables = {}
+                self._locations = {}
+                self._generation += 1
+                self._retire_pools()
+            # 签名就绪后再推迟下次检查，其他线程跳过检查时不会看到未初始化的签名
+            self._next_check = now + self.check_interval
+
+    def version(self):
+        """正文库内容的版本（各数据库文件mtime与大小的哈希），用于在查询正文之前计算ETag"""
+        self._check_files()
+        return short_hash(repr(self._signature))
+
+    def _retire_pools(self):
+        """换上新的连接池（调用方持有_lock）；旧池的空闲连接立即关闭，借出的连接归还时关闭"""
+        old_pools, self._pools = self._pools, {}
+        for pool in old_pools.values():
+            while True:
+                try:
+                    pool['idle'].get_nowait().close()
+                except queue.Empty:
+                    break
+
+    def reload(self):
+        """在调用线程中预先探测各数据库的表结构，然后一次性替换连接代次与缓存
+
+        各线程在下一次查询时关闭旧连接、打开新连接；正在执行的查询不受影响。
+        返回可用数据库个数。
+        """
+        return self.publish(self.prepare_reload())
+
+    def prepare_reload(self):
+        """预检各数据库的表结构（不改动当前状态），结果交给publish()替换"""
+        signature = self._stat_signature()
+        tables = {}
+        for path, mtime, _ in signature:
+            if mtime is None:
+                continue
+            try:
+                conn = self._connect(path)
+                try:
+                    tables[path] = self._probe_table(conn)
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                ACCESS_LOG.event(f"❌ 数据库预检失败 {os.path.basename(path)}: {e}", level='error')
+                tables[path] = None
+        return signature, tables
+
+    def publish(self, prepared):
+        """换上prepare_reload()的结果，返回可用数据库个数"""
+        signature, tables = prepared
+        with self._lock:
+            self._signature = signature
+            self._tables = tables
+            self._locations = {}
+            self._generation += 1
+            self._retire_pools()
+            self._next_check = time.monotonic() + self.check_interval
+        return sum(1 for table in tables.values() if table)
+
+    def _connect(self, path):
+        uri = f"file:{quote(path)}?mode=ro"
+        if self.immutable:
+            uri += "&immutable=1"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=16)
+
+    def _pool(self, path):
+        pool = self._pools.get(path)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(path)
+                if pool is None:
+                    pool = self._pools[path] = {
+                        'idle': queue.LifoQueue(),
+                        'slots': threading.BoundedSemaphore(self.pool_size),
+                    }
+        return pool
+
+    @contextmanager
+    def _connection(self, path):
+        """从该数据库的连接池借一条只读连接，池满时等待其他线程归还"""
+        pool = self._pool(path)
+        pool['slots'].acquire()
+        conn = None
+        try:
+            try:
+                conn = pool['idle'].get_nowait()
+            except queue.Empty:
+                conn = self._connect(path)
+            yield conn
+        finally:
+            if conn is not None:
+                if self._pools.get(path) is pool:
+                    pool['idle'].put(conn)
+                else:
+                    conn.close()
+            pool['slots'].release()
+
+    def _content_table(self, path, conn):
+        """探测数据库中存放正文的表，结果按数据库缓存"""
+        tables = self._tables
+        if path in tables:
+            return tables[path]
+        found = tables[path] = self._probe_table(conn)
+        return found
+
+    def _probe_table(self, conn):
+        for table in self.CONTENT_TABLES:
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            if 'content' in columns:
+                return table
+        return None
+
+    def _query(self, index, story_id):
+        path = self.db_paths[index]
+        started = time.perf_counter()
+        try:
+            with self._connection(path) as conn:
+                table = self._content_table(path, conn)
+                if table is None:
+                    return None
+                result = conn.execute(f"SELECT content FROM {table} WHERE id = ?", (story_id,)).fetchone()
+        except sqlite3.Error as e:
+            METRICS.observe_db(time.perf_counter() - started, error=True)
+            ACCESS_LOG.event(f"数据库查询失败 {os.path.basename(path)}: {e}", level='error')
+            return None
+        METRICS.observe_db(time.perf_counter() - started)
+        return result[0] if result and result[0] else None
+
+    def _query_many(self, index, story_ids):
+        """一次IN查询取回多个id的正文，返回{id: content}
+
+        占位符个数向上取整到2的幂（用最后一个id填充），让语句缓存能复用少数几种SQL。
+        """
+        path = self.db_paths[index]
+        found = {}
+        started = time.perf_counter()
+        try:
+            with self._connection(path) as conn:
+                table = self._content_table(path, conn)
+                if table is None:
+                    return found
+                for start in range(0, len(story_ids), MAX_BATCH_IDS):
+                    chunk = list(story_ids[start:start + MAX_BATCH_IDS])
+                    size = 1
+                    while size < len(chunk):
+                        size *= 2
+                    chunk += [chunk[-1]] * (size - len(chunk))
+                    placeholders = ','.join('?' * size)
+                    for story_id, content in conn.execute(
+                            f"SELECT id, content FROM {table} WHERE id IN ({placeholders})", chunk):
+                        if content:
+                            found[story_id] = content
+        except sqlite3.Error as e:
+            METRICS.observe_db(time.perf_counter() - started, error=True)
+            ACCESS_LOG.event(f"数据库查询失败 {os.path.basename(path)}: {e}", level='error')
+            return found
+        METRICS.observe_db(time.perf_counter() - started)
+        return found
+
+    def _remember(self, story_id, location):
+        locations = self._locations
+        if len(locations) >= self.max_locations:
+            locations.clear()
+        locations[story_id] = location
+
+    def get_content(self, story_id):
+        """按id获取正文，不存在时返回None"""
+        self._check_files()
+        signature = self._signature
+        location = self._locations.get(story_id)
+        METRICS.cache_event('content_location', location is not None)
+        if location == self.MISSING:
+            return None
+        if location is not None:
+            content = self._query(location, story_id)
+            if content is not None:
+                return content
+
+        for index, (_, mtime, _) in enumerate(signature):
+            if mtime is None or index == location:
+                continue
+            content = self._query(index, story_id)
+            if content is not None:
+                self._remember(story_id, index)
+                return content
+
+        self._remember(story_id, self.MISSING)
+        return None
+
+    def get_contents(self, story_ids):
+        """批量获取正文，返回{id: content}（不存在的id不出现在结果中）
+
+        已知位置的id按数据库分组各发一次IN查询，其余id按优先级逐库查询。
+        """
+        self._check_files()
+        signature = self._signature
+        locations = self._locations
+        result = {}
+        pending = []
+        by_location = {}
+        for story_id in story_ids:
+            location = locations.get(story_id)
+            METRICS.cache_event('content_location', location is not None)
+            if location == self.MISSING:
+                continue
+            if location is None:
+                pending.append(story_id)
+            else:
+                by_location.setdefault(location, []).append(story_id)
+
+        for index, ids in by_location.items():
+            found = self._query_many(index, ids)
+            result.update(found)
+            # 位置缓存失效（如正文被删除）的id重新走完整查找
+            pending.extend(story_id for story_id in ids if story_id not in found)
+
+        for index, (_, mtime, _) in enumerate(signature):
+            if not pending:
+                break
+            if mtime is None:
+                continue
+            found = self._query_many(index, pending)
+            for story_id, content in found.items():
+                result[story_id] = content
+                self._remember(story_id, index)
+            pending = [story_id for story_id in pending if story_id not in found]
+
+        for story_id in pending:
+            self._remember(story_id, self.MISSING)
+        return result
+
+
+class ShardedContentStore:
+    """story/contents/batch_N.json 正文分片
+
+    id -> (分片号, 分片内位置) 的索引惰性建立：按前端同样的规则
+    ceil(id / batch_size) 猜测分片，未命中时依据已加载分片的id范围向前或向后
+    查找，最后才扫描其余分片。已解析的分片放在有上限的LRU中，
+    详情请求只加载包含该故事的那一个分片。
+    """
+
+    BATCH_FILE_RE = re.compile(r'^batch_(\d+)\.json$')
+
+    def __init__(self, contents_dir, base_dir, batch_size=100, max_batches=8, check_interval=1.0):
+        self.contents_dir = os.path.join(base_dir, contents_dir)
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._signature = None
+        self._batches = {}
+        self._index = {}
+        self._ranges = {}
+        self._cache = OrderedDict()
+
+    def _scan(self):
+        """列出分片文件，返回{分片号: (路径, mtime, size)}"""
+        batches = {}
+        try:
+            names = os.listdir(self.contents_dir)
+        except OSError:
+            return batches
+        for name in names:
+            match = self.BATCH_FILE_RE.match(name)
+            if not match:
+                continue
+            path = os.path.join(self.contents_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            batches[int(match.group(1))] = (path, st.st_mtime_ns, st.st_size)
+        return batches
+
+    def _check_files(self):
+        """定期检查分片目录，文件变化时清空索引与缓存"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            batches = self._scan()
+            signature = tuple(sorted(batches.items()))
+            if signature != self._signature:
+                self._reset(batches, signature)
+
+    def version(self):
+        """分片内容的版本（各分片文件mtime与大小的哈希）"""
+        self._check_files()
+        return short_hash(repr(self._signature))
+
+    def _reset(self, batches, signature):
+        self._signature = signature
+        self._batches = batches
+        self._index = {}
+        self._ranges = {}
+        self._cache = OrderedDict()
+
+    def reload(self):
+        """重新扫描分片目录并清空索引与缓存，返回分片个数"""
+        return self.publish(self.prepare_reload())
+
+    def prepare_reload(self):
+        """扫描分片目录（不改动当前状态），结果交给publish()替换"""
+        return self._scan()
+
+    def publish(self, batches):
+        """换上prepare_reload()扫描到的分片并清空索引与缓存，返回分片个数"""
+        with self._lock:
+            self._reset(batches, tuple(sorted(batches.items())))
+            self._next_check = time.monotonic() + self.check_interval
+        return len(batches)
+
+    def _load_batch(self, number):
+        """加载（或从LRU取回）一个分片，并把其中所有id登记到索引"""
+        with self._lock:
+            items = self._cache.get(number)
+            if items is not None:
+                self._cache.move_to_end(number)
+                METRICS.cache_event('content_shard', True)
+                return items
+        METRICS.cache_event('content_shard', False)
+        path = self._batches[number][0]
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except Exception as e:
+            ACCESS_LOG.event(f"❌ 加载正文分片 {os.path.basename(path)} 失败: {e}", level='error')
+            items = []
+        ids = []
+        for offset, item in enumerate(items):
+            story_id = item.get('story_id', item.get('id'))
+            if story_id is not None:
+                ids.append((story_id, offset))
+        with self._lock:
+            for story_id, offset in ids:
+                self._index.setdefault(story_id, (number, offset))
+            if ids:
+                self._ranges[number] = (min(i for i, _ in ids), max(i for i, _ in ids))
+            else:
+                self._ranges[number] = None
+            self._cache[number] = items
+            while len(self._cache) > self.max_batches:
+                self._cache.popitem(last=False)
+        return items
+
+    def _candidates(self, story_id):
+        """按可能性顺序生成待查分片号"""
+        numbers = sorted(self._batches)
+        if not numbers:
+            return
+        tried = set()
+        guess = (story_id - 1) // self.batch_size + 1 if story_id > 0 else numbers[0]
+        guess = min(max(guess, numbers[0]), numbers[-1])
+        # 分片按id递增排列：根据已建索引分片的id范围向前或向后移动
+        number = guess
+        while number in self._batches and number not in tried:
+            tried.add(number)
+            yield number
+            id_range = self._ranges.get(number)
+            if not id_range:
+                break
+            if story_id < id_range[0]:
+                number -= 1
+            elif story_id > id_range[1]:
+                number += 1
+            else:
+                break
+        for number in numbers:
+            if number not in tried:
+                yield number
+
+    def _item(self, story_id):
+        location = self._index.get(story_id)
+        if location is not None:
+            number, offset = location
+            items = self._load_batch(number)
+            if offset < len(items):
+                return items[offset]
+            return None
+        for number in self._candidates(story_id):
+            # 已建过索引的分片不含该id（否则上面已命中），无需再加载
+            if number in self._ranges:
+                continue
+            self._load_batch(number)
+            location = self._index.get(story_id)
+            if location is not None:
+                return self._load_batch(location[0])[location[1]]
+        return None
+
+    def get_content(self, story_id):
+        """按id获取正文，不存在时返回None"""
+        self._check_files()
+        item = self._item(story_id)
+        if item:
+            return item.get('content') or None
+        return None
+
+    def get_contents(self, story_ids):
+        """批量获取正文，返回{id: content}"""
+        result = {}
+        for story_id in story_ids:
+            content = self.get_content(story_id)
+            if content:
+                result[story_id] = content
+        return result
+
+
+class ContentStoreChain:
+    """依次查询多个正文来源，返回第一个找到的正文"""
+
+    def __init__(self, stores):
+        self.stores = stores
+
+    def version(self):
+        """所有正文来源的组合版本：任一来源的文件变化都会改变"""
+        return short_hash(*(store.version() for store in self.stores))
+
+    def get_content(self, story_id):
+        for store in self.stores:
+            content = store.get_content(story_id)
+            if content:
+                return content
+        return None
+
+    def get_contents(self, story_ids):
+        result = {}
+        pending = list(story_ids)
+        for store in self.stores:
+            if not pending:
+                break
+            result.update(store.get_contents(pending))
+            pending = [story_id for story_id in pending if story_id not in result]
+        return result
+
+
+class SearchService:
+    """全文检索服务：懒加载索引，目录变化时增量同步
+
+    同步总在后台线程中进行（服务启动时即开始）：从未建过索引时同步完成前
+    index_for()返回None（接口应答503），已有旧索引时继续用旧索引应答。
+    索引版本记为目录内容哈希，重启后无需重建。
+    多进程模式下只有builder=True的进程（第一个工作进程）构建索引，其他进程
+    以只读方式打开，按meta_check_interval重读索引版本，与当前目录一致前返回None。
+    """
+
+    def __init__(self, db_path, builder=True, meta_check_interval=1.0):
+        self.db_path = db_path
+        self.builder = builder
+        self.meta_check_interval = meta_check_interval
+        self._index = None
+        self._lock = threading.Lock()
+        self._syncing = False
+        self._next_meta_check = 0.0
+
+    def _documents(self, snapshot):
+        for record in snapshot.stories:
+            story_id = record.get('id')
+            if story_id is None:
+                continue
+            content = CONTENT.get_content(story_id) or snapshot.contents.get(story_id)
+            yield story_id, record.get('title'), record.get('excerpt'), content
+
+    def _sync(self, index, snapshot):
+        try:
+            stats = index.sync(self._documents(snapshot), snapshot.digest)
+            ACCESS_LOG.event(f"🔎 检索索引已同步: 新增 {stats['added']} 更新 {stats['updated']} "
+                             f"删除 {stats['removed']} ({stats['seconds']:.2f} 秒)",
+                             version=snapshot.digest, **stats)
+        except sqlite3.Error as e:
+            ACCESS_LOG.event(f"❌ 检索索引同步失败: {e}", level='error', version=snapshot.digest)
+        finally:
+            self._syncing = False
+
+    def index_for(self, snapshot):
+        """返回可用于查询的索引，必要时在后台触发同步；索引还从未建成时返回None"""
+        index = self._index
+        if index is not None and index.synced_version == snapshot.digest:
+            return index
+        with self._lock:
+            if self._index is None:
+                self._index = StorySearchIndex(self.db_path, readonly=not self.builder)
+                self._index.synced_version = self._index.get_meta('version')
+                self._next_meta_check = time.monotonic() + self.meta_check_interval
+            index = self._index
+            if not self.builder:
+                now = time.monotonic()
+                if index.synced_version != snapshot.digest and now >= self._next_meta_check:
+                    self._next_meta_check = now + self.meta_check_interval
+                    index.synced_version = index.get_meta('version')
+                return index if index.synced_version == snapshot.digest else None
+            if index.synced_version == snapshot.digest or self._syncing:
+                return index if index.synced_version is not None else None
+            self._syncing = True
+            threading.Thread(target=self._sync, args=(index, snapshot), daemon=True).start()
+        return index if index.synced_version is not None else None
+
+    def wait_until_ready(self, snapshot, timeout=None, poll=0.05):
+        """阻塞直到索引与snapshot的目录版本一致（压测等脚本使用），返回索引；超时返回None"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            index = self.index_for(snapshot)
+            if index is not None and index.synced_version == snapshot.digest:
+                return index
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
 
 class StoryHandler(http.server.SimpleHTTPRequestHandler):
+    # 使用HTTP/1.1以支持keep-alive，所有响应都必须带Content-Length
+    protocol_version = 'HTTP/1.1'
+    # 空闲keep-alive连接的超时时间（秒），避免长期占用工作线程
+    timeout = DEFAULT_KEEPALIVE_TIMEOUT
+    # 头部与响应体分两次写出，关闭Nagle避免keep-alive下40ms的延迟确认等待
+    disable_nagle_algorithm = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=os.path.dirname(os.path.abspath(__file__)), **kwargs)
     
+    def handle_one_request(self):
+        """处理单个请求并记录路由指标"""
+        self.route = None
+        self.error_headers = None
+        self.request_started = None
+        self.response_status = None
+        self.response_bytes = 0
+        super().handle_one_request()
+        if self.request_started is not None and self.response_status is not None:
+            route = self.metrics_route()
+            seconds = time.perf_counter() - self.request_started
+            METRICS.observe_request(route, self.response_status, seconds, self.response_bytes)
+            ACCESS_LOG.record(route, self.command, self.path, self.response_status,
+                              self.response_bytes, seconds, self.client_address[0])
+    
+    def parse_request(self):
+        # 请求行读完后开始计时，不把keep-alive空闲等待计入延迟
+        self.request_started = time.perf_counter()
+        return super().parse_request()
+    
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+        # ApiError附带的响应头（如503的Retry-After），随send_error的响应一起发出
+        if self.error_headers:
+            for keyword, value in self.error_headers.items():
+                self.send_header(keyword, value)
+            self.error_headers = None
+    
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'content-length':
+            self.response_bytes = int(value)
+        super().send_header(keyword, value)
+    
+    def metrics_route(self):
+        """指标使用的路由标签，避免把任意路径作为标签值"""
+        if self.route in API_ROUTES:
+            return self.route
+        if urlparse(self.path).path.startswith('/api/'):
+            return 'api_other'
+        return 'static'
+    
     def do_GET(self):
         parsed_path = urlparse(self.path)
         
@@ -23,179 +1112,923 @@ class StoryHandler(http.server.SimpleHTTPRequestHandler):
             self.handle_api_request(parsed_path)
         else:
             # 静态文件服务
-            super().do_GET()
+            self.serve_static()
+    
+    def do_HEAD(self):
+        if urlparse(self.path).path.startswith('/api/'):
+            self.send_error(405, "HEAD not supported for API")
+        else:
+            self.serve_static(head_only=True)
+    
+    def resolve_static_path(self):
+        """把请求路径映射为文件路径；目录重定向、目录列表、不存在等情况返回None交给父类处理"""
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            if not urlparse(self.path).path.endswith('/'):
+                return None
+            for index in ('index.html', 'index.htm'):
+                candidate = os.path.join(path, index)
+                if os.path.isfile(candidate):
+                    return candidate
+            return None
+        if path.endswith('/') or not os.path.isfile(path):
+            return None
+        return path
+    
+    def select_sidecar(self, path, st):
+        """按Accept-Encoding选择比原文件新的预压缩旁路文件，返回(编码, 路径, stat)"""
+        available = {}
+        for encoding, suffix in SIDECAR_ENCODINGS:
+            try:
+                sidecar_st = os.stat(path + suffix)
+            except OSError:
+                continue
+            if sidecar_st.st_mtime >= st.st_mtime:
+                available[encoding] = (path + suffix, sidecar_st)
+        if not available:
+            return 'identity', path, st
+        encoding = negotiate_encoding(self.headers.get('Accept-Encoding'),
+                                      [e for e, _ in SIDECAR_ENCODINGS if e in available])
+        if encoding == 'identity':
+            return 'identity', path, st
+        return (encoding,) + available[encoding]
+    
+    def parse_range(self, size, etag, last_modified):
+        """解析单段Range请求，返回(start, end)；无Range或不适用时返回None，无法满足时返回False"""
+        header = self.headers.get('Range')
+        if not header or not header.startswith('bytes=') or ',' in header:
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range.strip() not in (etag, last_modified):
+            return None
+        start_text, sep, end_text = header[6:].strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if start_text:
+                start = int(start_text)
+                end = int(end_text) if end_text else size - 1
+            else:
+                length = int(end_text)
+                if length <= 0:
+                    return False
+                start = max(0, size - length)
+                end = size - 1
+        except ValueError:
+            return None
+        if start >= size or start > end:
+            return False
+        return start, min(end, size - 1)
+    
+    def serve_static(self, head_only=False):
+        """静态文件：预压缩旁路文件、ETag/Last-Modified校验、Range请求，响应体用sendfile零拷贝发送"""
+        path = self.resolve_static_path()
+        if path is None:
+            if head_only:
+                super().do_HEAD()
+            else:
+                super().do_GET()
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+
+        wants_range = 'Range' in self.headers
+        if wants_range:
+            encoding, body_path, body_st = 'identity', path, st
+        else:
+            encoding, body_path, body_st = self.select_sidecar(path, st)
+        # 校验器按该文件实际存在的旁路文件编码匹配（与本机是否装有brotli无关）
+        sidecar_encodings = [e for e, suffix in SIDECAR_ENCODINGS if os.path.exists(path + suffix)]
+        has_sidecars = bool(sidecar_encodings)
+
+        etag = make_etag(f"f-{st.st_mtime_ns:x}-{st.st_size:x}", encoding)
+        last_modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+        filename = os.path.basename(path)
+        cache_control = HASHED_ASSET_CACHE_CONTROL if HASHED_ASSET_RE.search(filename) else STATIC_CACHE_CONTROL
+
+        not_modified = False
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            not_modified = match_etag(if_none_match, f"f-{st.st_mtime_ns:x}-{st.st_size:x}",
+                                      sidecar_encodings) is not None
+        elif self.headers.get('If-Modified-Since'):
+            try:
+                since = email.utils.parsedate_to_datetime(self.headers['If-Modified-Since'])
+                not_modified = int(st.st_mtime) <= since.timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                not_modified = False
+        if not_modified:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            if has_sidecars:
+                self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        size = body_st.st_size
+        byte_range = self.parse_range(size, etag, last_modified) if wants_range else None
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        try:
+            f = open(body_path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        with f:
+            if byte_range:
+                start, end = byte_range
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            else:
+                start, end = 0, size - 1
+                self.send_response(200)
+            length = end - start + 1 if size else 0
+            self.send_header('Content-type', self.guess_type(path))
+            self.send_header('Content-Length', str(length))
+            if encoding != 'identity':
+                self.send_header('Content-Encoding', encoding)
+            if has_sidecars:
+                self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.send_header('Cache-Control', cache_control)
+            self.end_headers()
+            if not head_only and length:
+                # socket.sendfile在支持时使用os.sendfile，文件内容不经过Python缓冲区
+                self.connection.sendfile(f, start, length)
+    
+    def do_POST(self):
+        parsed_path = urlparse(self.path)
+        self.route = parsed_path.path
+        try:
+            if parsed_path.path == '/api/stories/batch':
+                self.get_story_batch(self.read_batch_ids_from_body(), use_etag=False)
+            elif parsed_path.path == '/api/admin/reload':
+                self.require_admin()
+                self.post_reload()
+            else:
+                self.send_error(404, "API endpoint not found")
+        except ApiError as e:
+            self.error_headers = e.headers
+            self.send_error(e.status, e.message)
+        except Exception as e:
+            ACCESS_LOG.event(f"API错误: {e}", level='error', route=self.route)
+            self.send_error(500, str(e))
     
     def handle_api_request(self, parsed_path):
         """处理API请求"""
+        self.route = parsed_path.path
         try:
+            query_params = parse_qs(parsed_path.query)
             if parsed_path.path == '/api/stories':
-                self.get_stories()
+                self.get_stories(query_params)
             elif parsed_path.path == '/api/story':
-                query_params = parse_qs(parsed_path.query)
                 story_id = query_params.get('id', [None])[0]
                 if story_id:
-                    self.get_story_detail(int(story_id))
+                    self.get_story_detail(parse_int_param(query_params, 'id', None))
                 else:
                     self.send_error(400, "Missing story ID")
+            elif parsed_path.path == '/api/story/related':
+                self.get_related_stories(query_params)
             elif parsed_path.path == '/api/categories':
                 self.get_categories()
+            elif parsed_path.path == '/api/search':
+                self.search_stories(query_params)
+            elif parsed_path.path == '/api/stories/batch':
+                self.get_story_batch(parse_id_list(query_params.get('ids', [''])[0]))
+            elif parsed_path.path == '/api/metrics':
+                self.get_metrics(query_params)
+            elif parsed_path.path == '/api/admin/reload':
+                self.require_admin()
+                self.send_json_response(LAST_RELOAD or {'status': 'never'})
             else:
                 self.send_error(404, "API endpoint not found")
+        except ApiError as e:
+            self.error_headers = e.headers
+            self.send_error(e.status, e.message)
         except Exception as e:
-            print(f"API错误: {e}")
+            ACCESS_LOG.event(f"API错误: {e}", level='error', route=self.route)
             self.send_error(500, str(e))
     
-    def get_stories(self):
-        """获取所有故事"""
-        stories = self.load_stories_data()
-        self.send_json_response(stories)
+    def get_stories(self, query_params=None):
+        """获取故事列表
+
+        不带参数时返回完整列表（兼容旧客户端）；带任一分页参数时返回分页结果：
+        limit/offset 或 cursor（上一页返回的next_cursor）、category=分类名、
+        fields=逗号分隔的字段投影（id始终返回）。
+        """
+        if not query_params or not any(name in query_params for name in STORY_LIST_PARAMS):
+            snapshot = CATALOG.get()
+            tag = f"s-{snapshot.digest}"
+            if not self.check_not_modified(tag):
+                self.send_cached_json_response('stories', snapshot.version, lambda: snapshot.stories, tag)
+            return
+
+        cursor = query_params.get('cursor', [None])[0]
+        if cursor:
+            offset, category = decode_cursor(cursor)
+        else:
+            offset = parse_int_param(query_params, 'offset', 0)
+            category = query_params.get('category', [None])[0] or None
+        limit = parse_int_param(query_params, 'limit', DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+
+        fields = query_params.get('fields', [None])[0]
+        if fields:
+            fields = ['id'] + [f for f in (x.strip() for x in fields.split(',')) if f and f != 'id']
+        else:
+            fields = None
+
+        snapshot = CATALOG.get()
+        tag = f"p-{snapshot.digest}-{short_hash(offset, limit, category, fields)}"
+        if self.check_not_modified(tag):
+            return
+        records, total = snapshot.page(offset, limit, category)
+        next_offset = offset + len(records)
+        self.send_json_response({
+            'items': [project_record(r, fields) for r in records],
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'next_cursor': encode_cursor(next_offset, category) if next_offset < total else None,
+        }, tag)
     
     def get_story_detail(self, story_id):
         """获取故事详情"""
-        stories = self.load_stories_data()
-        story = next((s for s in stories if s.get('id') == story_id), None)
+        snapshot = CATALOG.get()
+        record = snapshot.get(story_id)
         
-        if story:
-            # 尝试从数据库获取完整内容
-            content = self.get_story_content_from_db(story_id)
-            if content:
-                story['content'] = content
-            self.send_json_response(story)
+        if record:
+            # ETag由目录记录、内嵌正文与正文来源版本算出，304重新验证时不查询正文
+            embedded = snapshot.contents.get(story_id)
+            tag = f"d-{short_hash(snapshot.record_digest(story_id), embedded or '', CONTENT.version())}"
+            if self.check_not_modified(tag):
+                return
+            # 优先从数据库获取完整内容，其次使用数据文件内嵌的正文
+            content = self.get_story_content_from_db(story_id) or embedded
+            self.send_json_response(join_story_content(record, content), tag)
         else:
             self.send_error(404, "Story not found")
     
+    def get_related_stories(self, query_params):
+        """相关故事：/api/story/related?id=&limit=，从预先构建的mmap索引中直接读取"""
+        story_id = parse_int_param(query_params, 'id', None)
+        if story_id is None:
+            raise ApiError(400, "Missing story ID")
+        limit = parse_int_param(query_params, 'limit', None, minimum=1)
+        table = RELATED.table()
+        if table is None:
+            raise ApiError(503, "Related index not built")
+        snapshot = CATALOG.get()
+        if snapshot.get(story_id) is None:
+            raise ApiError(404, "Story not found")
+
+        tag = f"r-{snapshot.digest}-{table.digest}-{story_id}-{limit}"
+        if self.check_not_modified(tag):
+            return
+        items = []
+        for other, score in table.related(story_id, limit) or ():
+            record = snapshot.get(other)
+            if record is None:
+                continue
+            items.append({
+                'id': other,
+                'title': record.get('title'),
+                'category_name': record.get('category_name'),
+                'excerpt': record.get('excerpt'),
+                'score': score,
+            })
+        self.send_json_response({'id': story_id, 'items': items}, tag)
+    
     def get_categories(self):
         """获取所有分类"""
-        stories = self.load_stories_data()
-        categories = list(set(story.get('category_name', '未分类') for story in stories))
-        self.send_json_response(categories)
+        snapshot = CATALOG.get()
+        tag = f"c-{snapshot.digest}"
+        if not self.check_not_modified(tag):
+            self.send_cached_json_response('categories', snapshot.version, lambda: snapshot.categories, tag)
     
-    def load_stories_data(self):
-        """加载故事数据"""
-        # 尝试加载不同的数据文件
-        data_files = [
-            '../enhanced_stories.json',
-            '../quick_stories.json',
-            'sample_stories.json'
-        ]
-        
-        for file_path in data_files:
+    def read_batch_ids_from_body(self):
+        """读取POST请求体中的id：JSON {"ids": [...]} 或表单 ids=1,2,3"""
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            raise ApiError(400, "Missing ids")
+        if length > 64 * 1024:
+            raise ApiError(413, "Request body too large")
+        body = self.rfile.read(length).decode('utf-8', errors='replace')
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip()
+        if content_type == 'application/json':
             try:
-                full_path = os.path.join(os.path.dirname(__file__), file_path)
-                if os.path.exists(full_path):
-                    with open(full_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        print(f"✅ 加载数据文件: {file_path} ({len(data)} 个故事)")
-                        return data
-            except Exception as e:
-                print(f"❌ 加载 {file_path} 失败: {e}")
-                continue
-        
-        # 如果都失败了，返回示例数据
-        print("📝 使用示例数据")
-        return self.get_sample_stories()
+                payload = json.loads(body)
+            except ValueError:
+                raise ApiError(400, "Invalid JSON body")
+            ids = payload.get('ids') if isinstance(payload, dict) else payload
+            return parse_id_list(ids)
+        return parse_id_list(','.join(parse_qs(body).get('ids', [])))
+    
+    def get_story_batch(self, story_ids, use_etag=True):
+        """批量获取故事详情：一次IN查询取回全部正文，返回 {items, missing, without_content}"""
+        snapshot = CATALOG.get()
+        found_ids = [story_id for story_id in story_ids if snapshot.get(story_id) is not None]
+        missing = [story_id for story_id in story_ids if snapshot.get(story_id) is None]
+
+        # 先用目录记录与正文来源版本计算ETag，命中304时不查询正文
+        tag = None
+        if use_etag:
+            tag_parts = []
+            for story_id in found_ids:
+                tag_parts.extend((snapshot.record_digest(story_id), snapshot.contents.get(story_id) or ''))
+            tag = f"b-{short_hash(snapshot.digest, *story_ids, *tag_parts, CONTENT.version())}"
+            if self.check_not_modified(tag):
+                return
+
+        contents = self.get_story_contents_from_db(found_ids)
+        items = []
+        without_content = []
+        for story_id in found_ids:
+            content = contents.get(story_id) or snapshot.contents.get(story_id)
+            if not content:
+                without_content.append(story_id)
+            items.append(join_story_content(snapshot.get(story_id), content))
+        self.send_json_response({
+            'items': items,
+            'missing': missing,
+            'without_content': without_content,
+        }, tag)
+    
+    def search_stories(self, query_params):
+        """全文检索：/api/search?q=关键词&limit=&offset="""
+        query = (query_params.get('q', [''])[0] or '').strip()
+        if not query:
+            raise ApiError(400, "Missing query")
+        limit = parse_int_param(query_params, 'limit', DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+        offset = parse_int_param(query_params, 'offset', 0)
+
+        snapshot = CATALOG.get()
+        tag = f"q-{snapshot.digest}-{short_hash(query, limit, offset)}"
+        if self.check_not_modified(tag):
+            return
+        index = SEARCH.index_for(snapshot)
+        if index is None:
+            raise ApiError(503, "Search index is building", {'Retry-After': str(SEARCH_RETRY_AFTER)})
+        total, hits = index.search(query, limit, offset)
+        for hit in hits:
+            record = snapshot.get(hit['id'])
+            if record is not None:
+                hit['category_name'] = record.get('category_name')
+        self.send_json_response({
+            'query': query,
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'items': hits,
+        }, tag)
+    
+    def require_admin(self):
+        """管理接口鉴权：配置了--admin-token时校验X-Admin-Token，否则只允许本机访问"""
+        if ADMIN_TOKEN:
+            if self.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+                raise ApiError(403, "Forbidden")
+        elif self.client_address[0] not in ('127.0.0.1', '::1'):
+            raise ApiError(403, "Forbidden")
+    
+    def post_reload(self):
+        """重新加载数据集；多进程模式下通知主进程向所有工作进程发送SIGHUP"""
+        if WORKER_INDEX is not None:
+            os.kill(os.getppid(), signal.SIGHUP)
+            self.send_json_response({'status': 'scheduled', 'workers': 'all'})
+            return
+        report = reload_dataset('admin')
+        if report.get('status') == 'busy':
+            raise ApiError(409, "Reload already in progress")
+        self.send_json_response(report)
+    
+    def get_metrics(self, query_params):
+        """进程内指标：默认Prometheus文本格式，?format=json 或 Accept: application/json 时返回JSON"""
+        wants_json = (query_params.get('format', [''])[0] == 'json'
+                      or 'application/json' in (self.headers.get('Accept') or ''))
+        if wants_json:
+            data = METRICS.to_dict()
+            data['access_log'] = ACCESS_LOG.stats()
+            self.send_json_response(data)
+            return
+        body = METRICS.to_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_cache_headers()
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def load_stories_data(self):
+        """加载故事数据（来自进程级缓存目录）"""
+        return CATALOG.get().stories
     
     def get_story_content_from_db(self, story_id):
-        """从数据库获取故事内容"""
-        db_files = [
-            '../enhanced_stories.db',
-            '../quick_stories.db'
-        ]
-        
-        for db_file in db_files:
-            try:
-                full_path = os.path.join(os.path.dirname(__file__), db_file)
-                if os.path.exists(full_path):
-                    conn = sqlite3.connect(full_path)
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT content FROM stories WHERE id = ?", (story_id,))
-                    result = cursor.fetchone()
-                    conn.close()
-                    
-                    if result and result[0]:
-                        return result[0]
-            except Exception as e:
-                print(f"数据库查询失败 {db_file}: {e}")
-                continue
-        
-        return None
+        """获取故事内容（只读数据库连接池，其次正文分片）"""
+        return CONTENT.get_content(story_id)
+    
+    def get_story_contents_from_db(self, story_ids):
+        """批量获取故事内容，返回{id: content}"""
+        return CONTENT.get_contents(story_ids)
     
     def get_sample_stories(self):
         """获取示例故事数据"""
-        return [
-            {
-                "id": 1,
-                "title": "小红帽",
-                "category_name": "童话故事",
-                "excerpt": "从前有个可爱的小姑娘，她总是戴着一顶红色的帽子，所以大家都叫她小红帽。",
-                "length": 1200,
-                "content": "从前有个可爱的小姑娘，她总是戴着一顶红色的帽子，所以大家都叫她小红帽。\n\n有一天，妈妈让小红帽去看望生病的奶奶，并给她带去一些好吃的食物。小红帽高高兴兴地出发了。\n\n在去奶奶家的路上，小红帽遇到了一只大灰狼。大灰狼问她要去哪里，小红帽天真地告诉了它。\n\n大灰狼听后，眼珠一转，想出了一个坏主意。它抄近路先到了奶奶家，把奶奶吞进了肚子里，然后穿上奶奶的衣服躺在床上等小红帽。\n\n小红帽到了奶奶家，发现奶奶的样子很奇怪。她问：'奶奶，您的耳朵怎么这么大？''为了更好地听你说话，我的孩子。'\n\n'奶奶，您的眼睛怎么这么大？''为了更好地看你，我的孩子。'\n\n'奶奶，您的嘴巴怎么这么大？''为了更好地吃掉你！'说完，大灰狼就扑向了小红帽。\n\n幸好这时候猎人路过，听到了呼救声，赶紧冲进屋里救出了小红帽和奶奶。从此以后，小红帽再也不随便和陌生人说话了。"
-            },
-            {
-                "id": 2,
-                "title": "三只小猪",
-                "category_name": "童话故事",
-                "excerpt": "三只小猪要盖房子，老大用稻草，老二用木头，老三用砖头。",
-                "length": 1500,
-                "content": "从前有三只小猪，他们要离开妈妈独自生活。\n\n老大很懒，用稻草盖了一座房子。老二也不太勤快，用木头盖了一座房子。只有老三很勤劳，用砖头盖了一座结实的房子。\n\n有一天，大灰狼来了。它先到了老大的稻草房子前，用力一吹，房子就倒了。老大赶紧跑到老二家。\n\n大灰狼又来到老二的木头房子前，用力一撞，房子也倒了。两只小猪赶紧跑到老三家。\n\n大灰狼来到老三的砖头房子前，又吹又撞，房子纹丝不动。大灰狼气得要从烟囱爬进去。\n\n聪明的老三早就在烟囱下面放了一口大锅，锅里装满了开水。大灰狼掉进锅里，被烫得哇哇叫着逃跑了。\n\n从此以后，三只小猪快快乐乐地生活在一起，老大和老二也学会了要勤劳。"
-            },
-            {
-                "id": 3,
-                "title": "龟兔赛跑",
-                "category_name": "寓言故事",
-                "excerpt": "骄傲的兔子和坚持不懈的乌龟进行了一场赛跑。",
-                "length": 800,
-                "content": "从前，有一只跑得很快的兔子和一只爬得很慢的乌龟。\n\n兔子总是嘲笑乌龟爬得慢，乌龟很不服气，就向兔子挑战赛跑。\n\n比赛开始了，兔子一下子就跑得很远，回头看看，乌龟还在后面慢慢地爬着。\n\n兔子想：'乌龟爬得这么慢，我先睡一觉也不会输。'于是它在路边睡着了。\n\n乌龟虽然爬得慢，但是它一直坚持不懈地向前爬，一步一步地超过了睡觉的兔子。\n\n等兔子醒来的时候，乌龟已经到达了终点。兔子后悔极了。\n\n这个故事告诉我们：坚持不懈的努力比天赋更重要，骄傲使人落后。"
-            }
-        ]
-    
-    def send_json_response(self, data):
-        """发送JSON响应"""
+        return get_sample_stories()
+    
+    def send_json_response(self, data, tag=None):
+        """发送JSON响应（紧凑格式，按Accept-Encoding压缩）"""
+        body = encode_json(data)
+        encoding = 'identity'
+        if len(body) >= MIN_COMPRESS_SIZE:
+            encoding = negotiate_encoding(self.headers.get('Accept-Encoding'))
+            body = compress_body(body, encoding)
+        self.send_json_body(body, encoding, tag)
+    
+    def send_cached_json_response(self, name, version, build, tag=None):
+        """发送缓存的JSON响应，压缩结果随缓存复用，不会每次重新压缩"""
+        cached = RESPONSE_CACHE.get(name, version, build)
+        encoding, body = cached.get(negotiate_encoding(self.headers.get('Accept-Encoding')))
+        self.send_json_body(body, encoding, tag)
+    
+    def check_not_modified(self, tag):
+        """If-None-Match命中时直接返回304，不做任何序列化"""
+        etag = match_etag(self.headers.get('If-None-Match'), tag)
+        if etag is None:
+            return False
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_cache_headers()
+        self.end_headers()
+        return True
+    
+    def send_cache_headers(self):
+        """发送按路由配置的Cache-Control及Vary"""
+        route = getattr(self, 'route', None)
+        self.send_header('Cache-Control', ROUTE_CACHE_CONTROL.get(route, DEFAULT_CACHE_CONTROL))
+        self.send_header('Vary', 'Accept-Encoding')
+    
+    def send_json_body(self, body, encoding='identity', tag=None):
+        """写出已序列化（及压缩）的JSON响应体"""
         self.send_response(200)
         self.send_header('Content-type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if encoding != 'identity':
+            self.send_header('Content-Encoding', encoding)
+        if tag:
+            self.send_header('ETag', make_etag(tag, encoding))
+        self.send_cache_headers()
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        
-        json_data = json.dumps(data, ensure_ascii=False, indent=2)
-        self.wfile.write(json_data.encode('utf-8'))
+        self.wfile.write(body)
+    
+    def log_request(self, code='-', size='-'):
+        # 访问日志在handle_one_request中统一记录（带路由与耗时）
+        pass
     
     def log_message(self, format, *args):
-        """自定义日志格式"""
-        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {format % args}")
+        """父类的错误信息写入访问日志的事件流，不在请求线程中输出"""
+        ACCESS_LOG.event(format % args, level='warning', client=self.client_address[0])
+
+# 数据源：crawler=爬虫输出的JSON与SQLite，story=story/目录下的优化列表与正文分片，
+# auto=两者都启用（目录按文件顺序取第一个存在的，正文先查数据库再查分片）
+CRAWLER_DATA_FILES = ['../enhanced_stories.json', '../quick_stories.json']
+STORY_DATA_FILES = ['../../story/stories_optimized.json']
+STORY_CONTENTS_DIR = '../../story/contents'
+DATA_SOURCES = ('auto', 'crawler', 'story')
+
+# 进程级故事目录，所有请求线程共享
+CATALOG = StoryCatalog(
+    data_files=CRAWLER_DATA_FILES + STORY_DATA_FILES + ['sample_stories.json'],
+    base_dir=os.path.dirname(os.path.abspath(__file__))
+)
+
+# 全文检索服务（索引文件默认位于本目录，可用 --search-db 指定）
+SEARCH = SearchService(default_index_path())
+
+# 大响应体（完整目录、分类）及其压缩结果的缓存
+RESPONSE_CACHE = ResponseCache()
+
+# 进程级正文数据库连接池
+CONTENT_DB = ContentDatabasePool(
+    db_files=[
+        '../enhanced_stories.db',
+        '../quick_stories.db'
+    ],
+    base_dir=os.path.dirname(os.path.abspath(__file__))
+)
+
+# story/contents 正文分片
+CONTENT_SHARDS = ShardedContentStore(
+    contents_dir=STORY_CONTENTS_DIR,
+    base_dir=os.path.dirname(os.path.abspath(__file__))
+)
+
+# 正文查找链：按顺序查询各正文来源
+CONTENT = ContentStoreChain([CONTENT_DB, CONTENT_SHARDS])
+
+
+# 预先构建的相关故事索引（related_index.py生成）
+RELATED = RelatedStoriesIndex(default_related_path())
+
+# 管理接口令牌（--admin-token）；为空时管理接口只允许本机访问
+ADMIN_TOKEN = None
+# 多进程模式下当前工作进程的序号，单进程时为None
+WORKER_INDEX = None
+# 最近一次重新加载的报告
+LAST_RELOAD = None
+RELOAD_LOCK = threading.Lock()
+
+
+def reload_dataset(reason='manual'):
+    """零停机重新加载数据集
+
+    先在调用线程中构建新目录快照、预检数据库、重扫正文分片、打开相关故事索引，
+    全部就绪后才一并替换（先目录后各正文库，替换本身只是换引用，不做I/O），
+    任何一步失败都不改动当前数据；处理中的请求继续使用各自持有的旧快照。
+    替换后预热完整目录的响应缓存，再同步检索索引。返回包含各阶段耗时的报告。
+    """
+    global LAST_RELOAD
+    if not RELOAD_LOCK.acquire(blocking=False):
+        return {'status': 'busy'}
+    try:
+        started = time.perf_counter()
+        timings = {}
+
+        try:
+            snapshot = CATALOG.build()
+            timings['catalog_ms'] = (time.perf_counter() - started) * 1000
+            mark = time.perf_counter()
+            prepared_db = CONTENT_DB.prepare_reload()
+            prepared_shards = CONTENT_SHARDS.prepare_reload()
+            prepared_related = RELATED.prepare_reload()
+            timings['content_ms'] = (time.perf_counter() - mark) * 1000
+        except Exception as e:
+            LAST_RELOAD = {'status': 'failed', 'reason': reason, 'error': str(e), 'finished_at': time.time()}
+            ACCESS_LOG.event(f"❌ 数据集重新加载失败: {e}", level='error')
+            return LAST_RELOAD
+
+        mark = time.perf_counter()
+        CATALOG.swap(snapshot)
+        databases = CONTENT_DB.publish(prepared_db)
+        shards = CONTENT_SHARDS.publish(prepared_shards)
+        RELATED.publish(prepared_related)
+        timings['publish_ms'] = (time.perf_counter() - mark) * 1000
+
+        mark = time.perf_counter()
+        RESPONSE_CACHE.get('stories', snapshot.version, lambda: snapshot.stories).get('gzip')
+        RESPONSE_CACHE.get('categories', snapshot.version, lambda: snapshot.categories)
+        timings['warm_ms'] = (time.perf_counter() - mark) * 1000
+
+        mark = time.perf_counter()
+        SEARCH.index_for(snapshot)
+        timings['search_ms'] = (time.perf_counter() - mark) * 1000
+
+        timings['total_ms'] = (time.perf_counter() - started) * 1000
+        LAST_RELOAD = {
+            'status': 'ok',
+            'reason': reason,
+            'version': snapshot.version,
+            'digest': snapshot.digest,
+            'stories': len(snapshot.stories),
+            'databases': databases,
+            'content_shards': shards,
+            'timings_ms': {name: round(value, 2) for name, value in timings.items()},
+            'finished_at': time.time(),
+        }
+        ACCESS_LOG.event(f"🔄 数据集重新加载完成 ({reason})", stories=len(snapshot.stories),
+                         version=snapshot.version, total_ms=LAST_RELOAD['timings_ms']['total_ms'])
+        return LAST_RELOAD
+    finally:
+        RELOAD_LOCK.release()
+
+
+def install_reload_signal():
+    """SIGHUP触发后台重新加载（信号处理函数本身不阻塞服务循环）"""
+    if not hasattr(signal, 'SIGHUP'):
+        return
+    signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+        target=reload_dataset, args=('SIGHUP',), daemon=True).start())
+
+
+def configure_data_source(name):
+    """切换数据源（见DATA_SOURCES）"""
+    if name == 'crawler':
+        CATALOG.data_files = CRAWLER_DATA_FILES + ['sample_stories.json']
+        CONTENT.stores = [CONTENT_DB]
+    elif name == 'story':
+        CATALOG.data_files = list(STORY_DATA_FILES)
+        CONTENT.stores = [CONTENT_SHARDS]
+    elif name == 'auto':
+        CATALOG.data_files = CRAWLER_DATA_FILES + STORY_DATA_FILES + ['sample_stories.json']
+        CONTENT.stores = [CONTENT_DB, CONTENT_SHARDS]
+    else:
+        raise ValueError(f"未知的数据源: {name}")
+    CATALOG.invalidate()
+
+
+class ThreadPoolHTTPServer(http.server.HTTPServer):
+    """使用固定大小线程池处理连接的HTTP服务器"""
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, bind_and_activate=True, workers=DEFAULT_WORKERS):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='story-worker')
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ThreadedHTTPServer(http.server.ThreadingHTTPServer):
+    """每个连接一个线程的HTTP服务器"""
+    allow_reuse_address = True
 
-def start_server(port=8000):
+
+class SingleHTTPServer(socketserver.TCPServer):
+    """单线程串行处理请求（原始模式）"""
+    allow_reuse_address = True
+
+
+def create_server(port=8000, mode='threaded', threads=DEFAULT_WORKERS,
+                  host='', handler_class=StoryHandler,
+                  keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT, reuse_port=False):
+    """按指定模式创建服务器实例（不启动）
+
+    reuse_port=True 时监听套接字设置SO_REUSEPORT，供多进程模式下各工作进程绑定同一端口。
+    """
+    handler_class.timeout = keepalive_timeout
+    if mode == 'single':
+        httpd = SingleHTTPServer((host, port), handler_class, bind_and_activate=False)
+    elif mode == 'threaded':
+        httpd = ThreadedHTTPServer((host, port), handler_class, bind_and_activate=False)
+    elif mode == 'pool':
+        httpd = ThreadPoolHTTPServer((host, port), handler_class, bind_and_activate=False, workers=threads)
+    else:
+        raise ValueError(f"未知的服务模式: {mode}")
+    httpd.allow_reuse_port = reuse_port
+    try:
+        httpd.server_bind()
+        httpd.server_activate()
+    except BaseException:
+        httpd.server_close()
+        raise
+    return httpd
+
+
+def prefork_supported():
+    """当前平台是否支持多进程模式（需要fork与SO_REUSEPORT）"""
+    return hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT')
+
+
+def probe_port(host, port):
+    """以SO_REUSEPORT试绑定端口（不监听），尽早发现端口占用并解析端口0"""
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        probe.bind((host, port))
+        return probe.getsockname()[1]
+    finally:
+        probe.close()
+
+
+def run_worker(index, port, mode, threads, keepalive_timeout, host=''):
+    """多进程模式下的工作进程：独立绑定SO_REUSEPORT套接字并处理请求，不返回"""
+    global WORKER_INDEX
+    WORKER_INDEX = index
+    # Ctrl+C 由主进程统一处理；SIGTERM 时正常退出；SIGHUP 重新加载数据集
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    install_reload_signal()
+    if ACCESS_LOG.path:
+        # 每个工作进程写自己的日志文件，轮转互不干扰
+        base, ext = os.path.splitext(ACCESS_LOG.path)
+        ACCESS_LOG.configure(path=f"{base}.worker{index}{ext}")
+    code = 0
+    try:
+        httpd = create_server(port, mode, threads, host=host,
+                              keepalive_timeout=keepalive_timeout, reuse_port=True)
+        # 只由第一个工作进程在后台构建/同步检索索引（共用同一个索引文件），其他进程只读
+        SEARCH.builder = index == 0
+        if SEARCH.builder:
+            SEARCH.index_for(CATALOG.get())
+        try:
+            httpd.serve_forever()
+        finally:
+            httpd.server_close()
+    except SystemExit:
+        pass
+    except Exception as e:
+        print(f"❌ 工作进程 {index} 异常退出: {e}")
+        code = 1
+    finally:
+        ACCESS_LOG.close()
+        sys.stdout.flush()
+        os._exit(code)
+
+
+def run_prefork(port, workers, mode='threaded', threads=DEFAULT_WORKERS,
+                keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT, host='', on_ready=None):
+    """预先fork出workers个工作进程，各自以SO_REUSEPORT监听同一端口，由内核分发连接
+
+    主进程只负责监督：工作进程意外退出时重新fork（1秒内连续崩溃则退避），
+    收到SIGINT/SIGTERM时通知所有工作进程退出并等待；收到SIGHUP时转发给所有工作进程。
+    目录在fork前预加载，各工作进程持有自己的一份（写时复制共享初始内存）。
+    """
+    port = probe_port(host, port)
+    CATALOG.get()
+
+    children = {}
+    state = {'stopping': False}
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(index, port, mode, threads, keepalive_timeout, host)
+        children[pid] = (index, time.monotonic())
+
+    def stop(signum, frame):
+        if state['stopping']:
+            return
+        state['stopping'] = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def forward_reload(signum, frame):
+        # 主进程只转发SIGHUP，由各工作进程各自在后台重新加载
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGHUP)
+            except ProcessLookupError:
+                pass
+
+    previous_handlers = {sig: signal.signal(sig, stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+    previous_handlers[signal.SIGHUP] = signal.signal(signal.SIGHUP, forward_reload)
+    try:
+        for index in range(workers):
+            spawn(index)
+        if on_ready:
+            on_ready(port)
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            index, started = children.pop(pid, (None, 0.0))
+            if index is None or state['stopping']:
+                continue
+            print(f"⚠️  工作进程 {index} (pid {pid}) 退出，状态 {status}，正在重启")
+            if time.monotonic() - started < 1.0:
+                time.sleep(1.0)
+            if not state['stopping']:
+                spawn(index)
+    finally:
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+    return port
+
+
+def start_server(port=8000, mode='threaded', threads=DEFAULT_WORKERS,
+                 keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT, open_browser=True, workers=1):
     """启动服务器"""
+    # 延迟打开浏览器
+    def open_browser_later():
+        time.sleep(2)
+        try:
+            webbrowser.open(f'http://localhost:{port}')
+            print(f"🌐 已自动打开浏览器")
+        except:
+            pass
+
+    if workers > 1 and not prefork_supported():
+        print("⚠️  当前平台不支持多进程模式（需要fork与SO_REUSEPORT），改为单进程运行")
+        workers = 1
+
     try:
-        with socketserver.TCPServer(("", port), StoryHandler) as httpd:
+        if workers > 1:
+            def on_ready(bound_port):
+                print(f"🚀 故事网站服务器启动成功!")
+                print(f"⚙️  服务模式: {workers} 个工作进程 × {mode}" + (f" ({threads} 个工作线程)" if mode == 'pool' else ""))
+                print(f"📱 本地访问地址: http://localhost:{bound_port}")
+                print(f"⏹️  按 Ctrl+C 停止服务器")
+                print("-" * 50)
+                # 浏览器线程在fork之后才启动，避免子进程继承线程状态
+                if open_browser:
+                    threading.Thread(target=open_browser_later, daemon=True).start()
+
+            run_prefork(port, workers, mode, threads, keepalive_timeout, on_ready=on_ready)
+            print(f"\n⏹️  服务器已停止")
+            return
+
+        with create_server(port, mode, threads, keepalive_timeout=keepalive_timeout) as httpd:
+            install_reload_signal()
             print(f"🚀 故事网站服务器启动成功!")
+            print(f"⚙️  服务模式: {mode}" + (f" ({threads} 个工作线程)" if mode == 'pool' else ""))
             print(f"📱 本地访问地址: http://localhost:{port}")
             print(f"🌐 网络访问地址: http://127.0.0.1:{port}")
             print(f"⏹️  按 Ctrl+C 停止服务器")
             print("-" * 50)
             
-            # 延迟打开浏览器
-            def open_browser():
-                time.sleep(2)
-                try:
-                    webbrowser.open(f'http://localhost:{port}')
-                    print(f"🌐 已自动打开浏览器")
-                except:
-                    pass
-            
-            threading.Thread(target=open_browser, daemon=True).start()
+            if open_browser:
+                threading.Thread(target=open_browser_later, daemon=True).start()
             
+            # 在后台开始构建/同步检索索引，不占用第一个搜索请求
+            SEARCH.index_for(CATALOG.get())
             httpd.serve_forever()
             
     except OSError as e:
-        if e.errno == 10048:  # Windows端口被占用
+        if e.errno in (errno.EADDRINUSE, 10048):  # 端口被占用（10048为Windows）
             print(f"❌ 端口 {port} 被占用，尝试使用端口 {port + 1}")
-            start_server(port + 1)
+            start_server(port + 1, mode, threads, keepalive_timeout, open_browser, workers)
         else:
             print(f"❌ 服务器启动失败: {e}")
     except KeyboardInterrupt:
         print(f"\n⏹️  服务器已停止")
+    finally:
+        ACCESS_LOG.close()
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='小故事铺 - 本地服务器')
+    parser.add_argument('--port', type=int, default=8000, help='监听端口 (默认: 8000)')
+    parser.add_argument('--mode', choices=SERVER_MODES, default='threaded',
+                        help='服务模式: single=单线程, threaded=每连接一线程, pool=固定线程池 (默认: threaded)')
+    parser.add_argument('--threads', type=int, default=DEFAULT_WORKERS,
+                        help=f'pool模式下的工作线程数 (默认: {DEFAULT_WORKERS})')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='工作进程数；大于1时预先fork多个进程，以SO_REUSEPORT共享端口 (默认: 1)')
+    parser.add_argument('--keepalive-timeout', type=float, default=DEFAULT_KEEPALIVE_TIMEOUT,
+                        help=f'keep-alive空闲连接超时秒数 (默认: {DEFAULT_KEEPALIVE_TIMEOUT})')
+    parser.add_argument('--cache-control', action='append', default=[], metavar='ROUTE=VALUE',
+                        help="覆盖某个API路由的Cache-Control，可重复，如 --cache-control '/api/stories=public, max-age=600'")
+    parser.add_argument('--data-source', choices=DATA_SOURCES, default='auto',
+                        help='数据源: crawler=爬虫JSON+SQLite, story=story/优化列表+正文分片, auto=两者 (默认: auto)')
+    parser.add_argument('--db-pool-size', type=int, default=8,
+                        help='每个正文数据库的只读连接池大小 (默认: 8)')
+    parser.add_argument('--immutable-db', action='store_true',
+                        help='以immutable=1打开正文数据库（仅用于不再写入的冻结快照）')
+    parser.add_argument('--search-db', default=None, help='全文检索索引文件路径 (默认: 本目录下 search_index.db)')
+    parser.add_argument('--related-index', default=None,
+                        help='相关故事索引文件路径 (默认: 本目录下 related_index.bin，由related_index.py构建)')
+    parser.add_argument('--admin-token', default=None,
+                        help='管理接口（POST /api/admin/reload）令牌，未设置时只允许本机访问')
+    parser.add_argument('--access-log', default=None,
+                        help='访问日志文件（JSON行），未设置时写到标准输出；多进程模式下每个工作进程一个文件')
+    parser.add_argument('--access-log-max-bytes', type=int, default=10 * 1024 * 1024,
+                        help='访问日志轮转大小（字节，默认: 10MB；0为不轮转）')
+    parser.add_argument('--access-log-backups', type=int, default=5, help='保留的轮转文件个数 (默认: 5)')
+    parser.add_argument('--access-log-sample', type=float, default=1.0,
+                        help='成功请求的访问日志采样比例 0~1，4xx/5xx始终记录 (默认: 1.0)')
+    parser.add_argument('--no-access-log', action='store_true', help='关闭访问日志')
+    parser.add_argument('--no-browser', action='store_true', help='启动后不自动打开浏览器')
+    args = parser.parse_args(argv)
+    global ADMIN_TOKEN
+    ADMIN_TOKEN = args.admin_token
+    ACCESS_LOG.configure(path=args.access_log, max_bytes=args.access_log_max_bytes,
+                         backups=args.access_log_backups, sample_rate=args.access_log_sample,
+                         enabled=not args.no_access_log)
+    CONTENT_DB.pool_size = max(1, args.db_pool_size)
+    CONTENT_DB.immutable = args.immutable_db
+    if args.search_db:
+        SEARCH.db_path = args.search_db
+    if args.related_index:
+        RELATED.path = args.related_index
+    configure_data_source(args.data_source)
+    for item in args.cache_control:
+        route, sep, value = item.partition('=')
+        if not sep or not route.startswith('/'):
+            parser.error(f"--cache-control 格式应为 ROUTE=VALUE: {item}")
+        ROUTE_CACHE_CONTROL[route.strip()] = value.strip()
+    return args
 
 if __name__ == "__main__":
+    args = parse_args()
+
     # 确保在正确的目录中运行
     script_dir = os.path.dirname(os.path.abspath(__file__))
     os.chdir(script_dir)
@@ -204,4 +2037,5 @@ if __name__ == "__main__":
     print("🏠 小故事铺 - 本地服务器")
     print("=" * 50)
     
-    start_server()
\ No newline at end of file
+    start_server(args.port, args.mode, args.threads, args.keepalive_timeout,
+                 open_browser=not args.no_browser, workers=args.workers)